@@ -0,0 +1,30 @@
+"""Add revoked_at to revoked tokens
+
+Revision ID: 1e5ac9364dee
+Revises: cd3623895678
+Create Date: 2026-10-18 05:45:30.069161
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1e5ac9364dee'
+down_revision: Union[str, None] = 'cd3623895678'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('revoked_tokens', sa.Column('revoked_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False))
+    op.create_index('ix_revoked_tokens_revoked_at', 'revoked_tokens', ['revoked_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_revoked_tokens_revoked_at', table_name='revoked_tokens')
+    op.drop_column('revoked_tokens', 'revoked_at')
@@ -0,0 +1,38 @@
+"""Add posts like_count
+
+Revision ID: 3f1c9a7d2e84
+Revises: b254c2c5c5d0
+Create Date: 2026-10-18 09:12:31.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c9a7d2e84'
+down_revision: Union[str, None] = 'b254c2c5c5d0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('posts', sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        """
+        UPDATE posts
+        SET like_count = counts.likes
+        FROM (SELECT post_id, count(*) AS likes FROM likes GROUP BY post_id) AS counts
+        WHERE posts.id = counts.post_id
+        """
+    )
+    op.create_index('ix_posts_like_count_id', 'posts', ['like_count', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_posts_like_count_id', table_name='posts')
+    op.drop_column('posts', 'like_count')
@@ -0,0 +1,34 @@
+"""Add secondary indexes
+
+Revision ID: c5e2a9b04d13
+Revises: 8d4b6e0f1a27
+Create Date: 2026-10-18 14:02:48.391175
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e2a9b04d13'
+down_revision: Union[str, None] = '8d4b6e0f1a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index('ix_posts_created_at_id', 'posts', ['created_at', 'id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_posts_user_id', 'posts', ['user_id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_likes_post_id', 'likes', ['post_id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_likes_post_id', table_name='likes', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_posts_user_id', table_name='posts', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_posts_created_at_id', table_name='posts', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,30 @@
+"""Add session rotation and purge
+
+Revision ID: cd3623895678
+Revises: 56161799d82c
+Create Date: 2026-10-18 05:33:06.339783
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'cd3623895678'
+down_revision: Union[str, None] = '56161799d82c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('sessions', sa.Column('previous_refresh_token_hash', sa.String(), nullable=True))
+    op.create_index('ix_sessions_expires_at', 'sessions', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_sessions_expires_at', table_name='sessions')
+    op.drop_column('sessions', 'previous_refresh_token_hash')
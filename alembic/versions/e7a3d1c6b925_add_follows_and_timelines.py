@@ -0,0 +1,61 @@
+"""Add follows and home timelines
+
+Revision ID: e7a3d1c6b925
+Revises: c5e2a9b04d13
+Create Date: 2026-10-18 16:21:37.508114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a3d1c6b925'
+down_revision: Union[str, None] = 'c5e2a9b04d13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('follows',
+    sa.Column('follower_id', sa.Integer(), nullable=False),
+    sa.Column('followee_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['followee_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['follower_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('follower_id', 'followee_id')
+    )
+    op.create_index('ix_follows_followee_id', 'follows', ['followee_id'], unique=False)
+    op.create_table('timeline_entries',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'post_id')
+    )
+    op.create_index('ix_timeline_entries_post_id', 'timeline_entries', ['post_id'], unique=False)
+    op.create_index('ix_timeline_entries_user_id_created_at_post_id', 'timeline_entries', ['user_id', 'created_at', 'post_id'], unique=False)
+    op.add_column('users', sa.Column('follower_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_index('ix_users_follower_count', 'users', ['follower_count'], unique=False)
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index('ix_posts_user_id_created_at_id', 'posts', ['user_id', 'created_at', 'id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_posts_user_id', table_name='posts', postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_posts_user_id', 'posts', ['user_id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_posts_user_id_created_at_id', table_name='posts', postgresql_concurrently=True, if_exists=True)
+    op.drop_index('ix_users_follower_count', table_name='users')
+    op.drop_column('users', 'follower_count')
+    op.drop_index('ix_timeline_entries_user_id_created_at_post_id', table_name='timeline_entries')
+    op.drop_index('ix_timeline_entries_post_id', table_name='timeline_entries')
+    op.drop_table('timeline_entries')
+    op.drop_index('ix_follows_followee_id', table_name='follows')
+    op.drop_table('follows')
@@ -0,0 +1,171 @@
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Optional
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 60) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class RedisCache:
+    def __init__(self, url: str, prefix: str, ttl: float = 60) -> None:
+        try:
+            from redis import asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(
+                "CACHE_REDIS_URL is set but the 'redis' package is not installed"
+            ) from e
+
+        self.prefix = prefix
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._client = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self._client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return json.loads(value)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expire = self.ttl if ttl is None else ttl
+        await self._client.set(
+            self.prefix + key, json.dumps(value), px=max(int(expire * 1000), 1)
+        )
+
+    async def delete(self, key: str) -> None:
+        await self._client.delete(self.prefix + key)
+
+    async def clear(self) -> None:
+        async for key in self._client.scan_iter(match=self.prefix + "*"):
+            await self._client.delete(key)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+# In-process LRU in front of an optional cache shared by all workers. Values
+# must be JSON serializable so they can be stored in the shared tier.
+class TieredCache:
+    def __init__(self, local: MemoryCache, shared: Optional[RedisCache] = None):
+        self.local = local
+        self.shared = shared
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self.local.get(key)
+        if value is None and self.shared is not None:
+            value = await self.shared.get(key)
+            if value is not None:
+                await self.local.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self.local.set(key, value, ttl)
+        if self.shared is not None:
+            await self.shared.set(key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await self.local.delete(key)
+        if self.shared is not None:
+            await self.shared.delete(key)
+
+    async def clear(self) -> None:
+        await self.local.clear()
+        if self.shared is not None:
+            await self.shared.clear()
+
+    def stats(self) -> dict:
+        stats = {"local": self.local.stats()}
+        if self.shared is not None:
+            stats["shared"] = self.shared.stats()
+        return stats
+
+
+# Entries are keyed by a generation token, so invalidating everything is a
+# single write and entries computed before the write can never be read again.
+# The token is read from the shared tier when there is one, so a write in one
+# worker also invalidates the local tiers of the others.
+class GenerationCache:
+    GENERATION_KEY = "generation"
+    GENERATION_TTL = 24 * 60 * 60
+
+    def __init__(self, cache: TieredCache) -> None:
+        self.cache = cache
+        self._generation = uuid.uuid4().hex
+
+    async def generation(self) -> str:
+        if self.cache.shared is None:
+            return self._generation
+        return await self.cache.shared.get(self.GENERATION_KEY) or "0"
+
+    async def get(self, generation: str, key: str) -> Optional[Any]:
+        return await self.cache.get(f"{generation}:{key}")
+
+    async def set(self, generation: str, key: str, value: Any) -> None:
+        await self.cache.set(f"{generation}:{key}", value)
+
+    async def invalidate(self) -> None:
+        self._generation = uuid.uuid4().hex
+        if self.cache.shared is not None:
+            await self.cache.shared.set(
+                self.GENERATION_KEY, self._generation, self.GENERATION_TTL
+            )
+
+    async def clear(self) -> None:
+        await self.invalidate()
+        await self.cache.clear()
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+def create_cache(namespace: str, maxsize: int, ttl: float) -> TieredCache:
+    shared = None
+    if config.CACHE_REDIS_URL:
+        logger.info("Using shared cache for %s", namespace)
+        shared = RedisCache(config.CACHE_REDIS_URL, f"{namespace}:", ttl)
+    return TieredCache(MemoryCache(maxsize, ttl), shared)
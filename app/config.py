@@ -1,5 +1,5 @@
 from functools import lru_cache
-from typing import Optional
+from typing import Literal, Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -16,10 +16,43 @@ class GlobalConfig(BaseConfig):
     DATABASE_HOSTNAME: Optional[str] = None
     DATABASE_PORT: Optional[str] = None
     DATABASE_NAME: Optional[str] = None
+    DATABASE_REPLICA_URLS: list[str] = []
     DB_FORCE_ROLL_BACK: bool = False
+    DB_POOL_MIN_SIZE: int = 2
+    DB_POOL_MAX_SIZE: int = 10
+    DB_POOL_ACQUIRE_TIMEOUT_SECONDS: float = 5.0
+    DB_POOL_MAX_LIFETIME_SECONDS: float = 1800.0
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    REPLICA_MAX_LAG_SECONDS: float = 5.0
+    REPLICA_CHECK_INTERVAL_SECONDS: float = 5.0
+    DB_STARTUP_DDL: Literal["auto", "always", "never"] = "auto"
     SECRET_KEY: Optional[str] = None
     ALGORITHM: Optional[str] = None
     ACCESS_TOKEN_EXPIRE_MINUTES: Optional[int] = None
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    CACHE_REDIS_URL: Optional[str] = None
+    USER_CACHE_SIZE: int = 1024
+    USER_CACHE_TTL_SECONDS: int = 30
+    TOKEN_CACHE_SIZE: int = 4096
+    REVOKED_TOKENS_POLL_SECONDS: float = 1.0
+    FEED_CACHE_SIZE: int = 256
+    FEED_CACHE_TTL_SECONDS: int = 5
+    EXPORT_SETTLE_SECONDS: float = 10.0
+    TIMELINE_FANOUT_MAX_FOLLOWERS: int = 10_000
+    TIMELINE_FANOUT_QUEUE_SIZE: int = 1000
+    TIMELINE_BACKFILL_POSTS: int = 20
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 32
+    DB_SLOW_QUERY_SECONDS: float = 0.1
+    LOG_QUEUE_SIZE: int = 10_000
+    LOG_BATCH_SIZE: int = 100
+    LOG_FLUSH_INTERVAL_SECONDS: float = 1.0
+    # Logger name to N, keeping one in every N records below WARNING from that
+    # logger and its children, e.g. {"app.routes.post.reads": 10}
+    LOG_SAMPLE_RATES: dict[str, int] = {}
+    METRICS_DIR: Optional[str] = None
+    METRICS_FLUSH_INTERVAL_SECONDS: float = 5.0
+    EVENT_LOOP_LAG_INTERVAL_SECONDS: float = 0.5
 
 
 class DevConfig(GlobalConfig):
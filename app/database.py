@@ -1,12 +1,18 @@
 import databases
 import sqlalchemy
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.sql.expression import text
 
 from app.config import config
 
+SEARCH_CONFIG = "english"
+
 metadata = sqlalchemy.MetaData()
 
+# Needed by the trigram index on posts.title
+create_extensions = sqlalchemy.DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+sqlalchemy.event.listen(metadata, "before_create", create_extensions)
+
 post_table = sqlalchemy.Table(
     "posts",
     metadata,
@@ -28,6 +34,29 @@ post_table = sqlalchemy.Table(
         sqlalchemy.ForeignKey("users.id", ondelete="CASCADE"),
         nullable=False,
     ),
+    sqlalchemy.Column(
+        "like_count", sqlalchemy.Integer, server_default="0", nullable=False
+    ),
+    sqlalchemy.Column(
+        "search_vector",
+        TSVECTOR,
+        sqlalchemy.Computed(
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', title), 'A') || "
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', content), 'B')",
+            persisted=True,
+        ),
+    ),
+    sqlalchemy.Index("ix_posts_created_at_id", "created_at", "id"),
+    # Also serves the per-author reads of the home timeline
+    sqlalchemy.Index("ix_posts_user_id_created_at_id", "user_id", "created_at", "id"),
+    sqlalchemy.Index("ix_posts_like_count_id", "like_count", "id"),
+    sqlalchemy.Index("ix_posts_search_vector", "search_vector", postgresql_using="gin"),
+    sqlalchemy.Index(
+        "ix_posts_title_trgm",
+        "title",
+        postgresql_using="gin",
+        postgresql_ops={"title": "gin_trgm_ops"},
+    ),
 )
 
 user_table = sqlalchemy.Table(
@@ -42,6 +71,10 @@ user_table = sqlalchemy.Table(
         server_default=text("now()"),
         nullable=False,
     ),
+    sqlalchemy.Column(
+        "follower_count", sqlalchemy.Integer, server_default="0", nullable=False
+    ),
+    sqlalchemy.Index("ix_users_follower_count", "follower_count"),
 )
 
 like_table = sqlalchemy.Table(
@@ -59,16 +92,130 @@ like_table = sqlalchemy.Table(
         sqlalchemy.ForeignKey("posts.id", ondelete="CASCADE"),
         primary_key=True,
     ),
+    sqlalchemy.Index("ix_likes_post_id", "post_id"),
+)
+
+follow_table = sqlalchemy.Table(
+    "follows",
+    metadata,
+    sqlalchemy.Column(
+        "follower_id",
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    sqlalchemy.Column(
+        "followee_id",
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    sqlalchemy.Column(
+        "created_at",
+        sqlalchemy.TIMESTAMP(timezone=True),
+        server_default=text("now()"),
+        nullable=False,
+    ),
+    sqlalchemy.Index("ix_follows_followee_id", "followee_id"),
+)
+
+# Materialized home timelines, filled by fanning new posts out to followers
+timeline_table = sqlalchemy.Table(
+    "timeline_entries",
+    metadata,
+    sqlalchemy.Column(
+        "user_id",
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    sqlalchemy.Column(
+        "post_id",
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey("posts.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    sqlalchemy.Column(
+        "created_at", sqlalchemy.TIMESTAMP(timezone=True), nullable=False
+    ),
+    sqlalchemy.Index(
+        "ix_timeline_entries_user_id_created_at_post_id",
+        "user_id",
+        "created_at",
+        "post_id",
+    ),
+    sqlalchemy.Index("ix_timeline_entries_post_id", "post_id"),
+)
+
+# Login sessions, each renewed with its latest refresh token. Rotated tokens
+# no longer match refresh_token_hash, so presenting one again is detected.
+session_table = sqlalchemy.Table(
+    "sessions",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Uuid, primary_key=True),
+    sqlalchemy.Column(
+        "user_id",
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+    ),
+    sqlalchemy.Column("refresh_token_hash", sqlalchemy.String, nullable=False),
+    # The hash rotated out last, presenting it again means the token leaked
+    sqlalchemy.Column("previous_refresh_token_hash", sqlalchemy.String),
+    sqlalchemy.Column(
+        "created_at",
+        sqlalchemy.TIMESTAMP(timezone=True),
+        server_default=text("now()"),
+        nullable=False,
+    ),
+    sqlalchemy.Column(
+        "expires_at", sqlalchemy.TIMESTAMP(timezone=True), nullable=False
+    ),
+    sqlalchemy.Column("revoked_at", sqlalchemy.TIMESTAMP(timezone=True)),
+    sqlalchemy.Index("ix_sessions_user_id", "user_id"),
+    sqlalchemy.Index("ix_sessions_expires_at", "expires_at"),
+)
+
+# Revoked access tokens (jti, or the digest of tokens issued without one) and
+# sessions, kept until the tokens they cover would have expired
+revoked_token_table = sqlalchemy.Table(
+    "revoked_tokens",
+    metadata,
+    sqlalchemy.Column("token_id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column(
+        "expires_at", sqlalchemy.TIMESTAMP(timezone=True), nullable=False
+    ),
+    sqlalchemy.Column(
+        "revoked_at",
+        sqlalchemy.TIMESTAMP(timezone=True),
+        server_default=text("now()"),
+        nullable=False,
+    ),
+    sqlalchemy.Index("ix_revoked_tokens_expires_at", "expires_at"),
+    sqlalchemy.Index("ix_revoked_tokens_revoked_at", "revoked_at"),
 )
 
 DATABASE_URL = f"postgresql+asyncpg://{config.DATABASE_USERNAME}:{config.DATABASE_PASSWORD}@{config.DATABASE_HOSTNAME}:{config.DATABASE_PORT}/{config.DATABASE_NAME}"
 
-engine = create_async_engine(DATABASE_URL)
 
+class Database(databases.Database):
+    SUPPORTED_BACKENDS = {
+        **databases.Database.SUPPORTED_BACKENDS,
+        "postgresql": "app.db_pool:InstrumentedPostgresBackend",
+    }
 
-async def create_tables():
-    async with engine.begin() as conn:
-        await conn.run_sync(metadata.create_all)
+    def pool_stats(self) -> dict:
+        return self._backend.stats()
 
 
-database = databases.Database(DATABASE_URL, force_rollback=config.DB_FORCE_ROLL_BACK)
+pool_options = {
+    "min_size": config.DB_POOL_MIN_SIZE,
+    "max_size": config.DB_POOL_MAX_SIZE,
+    "acquire_timeout": config.DB_POOL_ACQUIRE_TIMEOUT_SECONDS,
+    "max_lifetime": config.DB_POOL_MAX_LIFETIME_SECONDS,
+    "statement_cache_size": config.DB_STATEMENT_CACHE_SIZE,
+}
+
+database = Database(
+    DATABASE_URL, force_rollback=config.DB_FORCE_ROLL_BACK, **pool_options
+)
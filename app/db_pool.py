@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import asyncpg
+from databases.backends.postgres import PostgresBackend, PostgresConnection
+from fastapi import HTTPException, status
+
+from app.metrics import Histogram
+from app.tracing import traced_query
+
+logger = logging.getLogger(__name__)
+
+database_busy_exception = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Server is busy, please retry later",
+    headers={"Retry-After": "1"},
+)
+
+
+class PoolConnection(asyncpg.Connection):
+    # asyncpg only expires idle connections, the creation time lets released
+    # connections be recycled after a fixed lifetime as well
+    __slots__ = ("created_at",)
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.created_at = time.monotonic()
+
+
+class InstrumentedPostgresConnection(PostgresConnection):
+    _database: "InstrumentedPostgresBackend"
+
+    async def acquire(self) -> None:
+        assert self._connection is None, "Connection is already acquired"
+        assert self._database._pool is not None, "DatabaseBackend is not running"
+        backend = self._database
+
+        started = time.perf_counter()
+        backend.waiting += 1
+        try:
+            self._connection = await backend._pool.acquire(
+                timeout=backend.acquire_timeout
+            )
+        except asyncio.TimeoutError as e:
+            backend.acquire_timeouts += 1
+            logger.warning("Timed out waiting for a database connection")
+            raise database_busy_exception from e
+        finally:
+            backend.waiting -= 1
+            backend.acquire_time.observe(time.perf_counter() - started)
+
+    def _compile(self, query):
+        compiled = super()._compile(query)
+        self._compiled_sql = compiled[0]
+        return compiled
+
+    @contextmanager
+    def _traced(self) -> Iterator[None]:
+        self._compiled_sql = ""
+        with traced_query() as trace:
+            try:
+                yield
+            finally:
+                trace.sql = self._compiled_sql
+
+    # fetch_val goes through fetch_one, so every query is traced exactly once.
+    # iterate is left out, its duration is set by the consumer.
+    async def fetch_all(self, query):
+        with self._traced():
+            return await super().fetch_all(query)
+
+    async def fetch_one(self, query):
+        with self._traced():
+            return await super().fetch_one(query)
+
+    async def execute(self, query):
+        with self._traced():
+            return await super().execute(query)
+
+    async def execute_many(self, queries):
+        with self._traced():
+            return await super().execute_many(queries)
+
+    async def release(self) -> None:
+        assert self._connection is not None, "Connection is not acquired"
+        backend = self._database
+
+        age = time.monotonic() - self._connection.created_at
+        if backend.max_lifetime and age > backend.max_lifetime:
+            # Closing hands the slot back to the pool, which reconnects it on
+            # the next acquire
+            backend.recycled += 1
+            await self._connection.close()
+        await super().release()
+
+
+class InstrumentedPostgresBackend(PostgresBackend):
+    def __init__(
+        self,
+        database_url,
+        *,
+        acquire_timeout: Optional[float] = None,
+        max_lifetime: Optional[float] = None,
+        **options,
+    ) -> None:
+        super().__init__(database_url, connection_class=PoolConnection, **options)
+        self.acquire_timeout = acquire_timeout
+        self.max_lifetime = max_lifetime
+        self.waiting = 0
+        self.acquire_timeouts = 0
+        self.recycled = 0
+        self.acquire_time = Histogram()
+
+    def connection(self) -> InstrumentedPostgresConnection:
+        return InstrumentedPostgresConnection(self, self._dialect)
+
+    def stats(self) -> dict:
+        pool = self._pool
+        size = pool.get_size() if pool else 0
+        idle = pool.get_idle_size() if pool else 0
+        return {
+            "connected": pool is not None,
+            "min_size": pool.get_min_size() if pool else 0,
+            "max_size": pool.get_max_size() if pool else 0,
+            "size": size,
+            "in_use": size - idle,
+            "idle": idle,
+            "waiting": self.waiting,
+            "acquire_timeouts": self.acquire_timeouts,
+            "recycled": self.recycled,
+            "acquire_seconds": self.acquire_time.snapshot(),
+        }
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from fastapi import HTTPException, status
+
+from app.config import config
+from app.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+pool_saturated_exception = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Server is busy, please retry later",
+    headers={"Retry-After": "1"},
+)
+
+
+class PasswordHashPool:
+    # bcrypt releases the GIL, so a small thread pool keeps hashing off the
+    # event loop without the pickling overhead of a process pool.
+    def __init__(self, max_workers: int, max_queue: int) -> None:
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.rejected = 0
+        self.wait_time = Histogram()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="password-hash"
+        )
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            logger.warning("Password hashing pool saturated, rejecting request")
+            raise pool_saturated_exception
+
+        submitted_at = time.perf_counter()
+
+        def job() -> tuple[T, float]:
+            waited = time.perf_counter() - submitted_at
+            return func(*args), waited
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result, waited = await loop.run_in_executor(self._executor, job)
+        finally:
+            self.in_flight -= 1
+
+        self.wait_time.observe(waited)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": max(self.in_flight - self.max_workers, 0),
+            "rejected": self.rejected,
+            "wait_seconds": self.wait_time.snapshot(),
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_pool = PasswordHashPool(
+    config.PASSWORD_HASH_WORKERS, config.PASSWORD_HASH_MAX_QUEUE
+)
@@ -1,16 +1,32 @@
+import functools
+import itertools
 import logging
+import queue
 from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
 
-from app.config import DevConfig, config
+from asgi_correlation_id import CorrelationIdFilter
 
+from app.config import DevConfig, ProdConfig, config
 
+# Loggers whose handlers move behind the queue in queued mode
+QUEUED_LOGGERS = ("app", "uvicorn", "databases", "asyncpg")
+
+
+# Logins and lookups log the same few addresses over and over
+EMAIL_MASK_CACHE_SIZE = 1024
+
+
+@functools.lru_cache(maxsize=EMAIL_MASK_CACHE_SIZE)
 def obfuscated(email: str, obfuscated_length: int) -> str:
-    first, last = email.split("@")
+    # Idempotent: masking a masked address returns it unchanged
+    first, at, last = email.partition("@")
     if len(first) <= obfuscated_length:
         return email
 
-    characters = email[:obfuscated_length]
-    return characters + ("*" * (len(first) - obfuscated_length)) + "@" + last
+    mask = "*" * (len(first) - obfuscated_length)
+    return first[:obfuscated_length] + mask + at + last
 
 
 class EmailObfuscationFilter(logging.Filter):
@@ -19,20 +35,319 @@ class EmailObfuscationFilter(logging.Filter):
         self.obfuscated_length = obfuscated_length
 
     def filter(self, record: logging.LogRecord) -> bool:
-        if hasattr(record, "email"):
+        # Every handler lists the filter, a record is masked by the first one.
+        # Underscored attributes are left out of the JSON log lines.
+        if hasattr(record, "email") and not hasattr(record, "_email_obfuscated"):
             record.email = obfuscated(record.email, self.obfuscated_length)
+            record._email_obfuscated = True
         return True
 
 
+class SamplingFilter(logging.Filter):
+    # Keeps one in every N records from a sampled logger (or its children),
+    # counted per logger. Warnings and errors always pass. Kept records carry
+    # sample_rate so that counts can be scaled back up.
+    def __init__(self, name: str = "", rates: Optional[dict[str, int]] = None) -> None:
+        super().__init__(name)
+        self.rates = {
+            logger: rate for logger, rate in (rates or {}).items() if rate > 1
+        }
+        self.counters: dict[str, itertools.count] = {}
+        self.resolved: dict[str, Optional[str]] = {}
+
+    def sampled_logger(self, name: str) -> Optional[str]:
+        # The closest configured ancestor, looked up once per logger name
+        try:
+            return self.resolved[name]
+        except KeyError:
+            pass
+        sampled, candidate = None, name
+        while candidate:
+            if candidate in self.rates:
+                sampled = candidate
+                break
+            candidate = candidate.rpartition(".")[0]
+        self.resolved[name] = sampled
+        return sampled
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        sampled = self.sampled_logger(record.name)
+        if sampled is None:
+            return True
+
+        # One filter is shared by several handlers, the record is only counted
+        # by the first of them
+        decided = getattr(record, "sample_rate", None)
+        if decided is not None:
+            return decided > 0
+
+        rate = self.rates[sampled]
+        counter = self.counters.get(record.name)
+        if counter is None:
+            counter = self.counters.setdefault(record.name, itertools.count())
+        record.sample_rate = 0 if next(counter) % rate else rate
+        return record.sample_rate > 0
+
+
+class DroppingQueueHandler(QueueHandler):
+    # Never blocks the event loop: records that do not fit in the queue are
+    # dropped and counted
+    def __init__(self, maxsize: int) -> None:
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The message is resolved now, while its arguments are unchanged;
+        # formatting, exception text included, is left to the listener thread
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "max_queue": self.queue.maxsize,
+            "dropped": self.dropped,
+        }
+
+
+class BatchingQueueListener(QueueListener):
+    # Flushes the handlers whenever the queue stays empty for flush_interval,
+    # so batched records are written out once traffic stops. With routes,
+    # a record only goes to the handlers of the closest logger it names,
+    # as it would have without the queue.
+    def __init__(
+        self,
+        queue,
+        *handlers,
+        flush_interval: float = 1.0,
+        routes: Optional[dict[str, list[logging.Handler]]] = None,
+    ) -> None:
+        super().__init__(queue, *handlers, respect_handler_level=True)
+        self.flush_interval = flush_interval
+        self.routes = routes
+        self.resolved: dict[str, list[logging.Handler]] = {}
+
+    def route(self, name: str) -> list[logging.Handler]:
+        if self.routes is None:
+            return self.handlers
+        try:
+            return self.resolved[name]
+        except KeyError:
+            pass
+        handlers, candidate = self.handlers, name
+        while candidate:
+            if candidate in self.routes:
+                handlers = self.routes[candidate]
+                break
+            candidate = candidate.rpartition(".")[0]
+        self.resolved[name] = handlers
+        return handlers
+
+    def handle(self, record: logging.LogRecord) -> None:
+        record = self.prepare(record)
+        for handler in self.route(record.name):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        while True:
+            try:
+                return self.queue.get(block, timeout=self.flush_interval)
+            except queue.Empty:
+                for handler in self.handlers:
+                    handler.flush()
+                if not block:
+                    raise
+
+    def enqueue_sentinel(self) -> None:
+        # Waits for room rather than losing the stop request on a full queue
+        self.queue.put(self._sentinel)
+
+    def stop(self) -> None:
+        super().stop()
+        for handler in self.handlers:
+            handler.flush()
+
+
+class BatchingRotatingFileHandler(RotatingFileHandler):
+    # Formats each record on arrival but writes batch_size of them (or
+    # whatever is pending on flush) with a single write, rolling over between
+    # batches instead of checking the file size for every record
+    def __init__(self, *args, batch_size: int = 100, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.batch_size = batch_size
+        self.pending: list[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.pending.append(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.pending) >= self.batch_size or record.levelno >= logging.ERROR:
+            self.flush()
+
+    def flush(self) -> None:
+        self.acquire()
+        try:
+            if self.pending:
+                data = "".join(self.pending)
+                self.pending.clear()
+                if self.stream is None:
+                    self.stream = self._open()
+                position = self.stream.tell()
+                if (
+                    self.maxBytes > 0
+                    and position
+                    and position + len(data) >= self.maxBytes
+                ):
+                    self.doRollover()
+                self.stream.write(data)
+            super().flush()
+        finally:
+            self.release()
+
+    def close(self) -> None:
+        self.flush()
+        super().close()
+
+
+log_queue_handler: Optional[DroppingQueueHandler] = None
+log_listener: Optional[BatchingQueueListener] = None
+# The handlers each logger had before they moved behind the queue
+queued_handlers: dict[str, list[logging.Handler]] = {}
+
+
+def start_log_listener() -> None:
+    # Swaps the configured handlers for one queue handler and hands them to a
+    # background thread. The correlation id lives in a contextvar, so its
+    # filter has to run on the queue handler, in the request's context.
+    global log_queue_handler, log_listener
+
+    queue_handler = DroppingQueueHandler(config.LOG_QUEUE_SIZE)
+    # Sampled out records are dropped before anything else is done with them
+    queue_handler.addFilter(sampling_filter())
+    queue_handler.addFilter(correlation_id_filter())
+
+    handlers: list[logging.Handler] = []
+    queued_handlers.clear()
+    for name in QUEUED_LOGGERS:
+        logger = logging.getLogger(name)
+        queued_handlers[name] = logger.handlers
+        handlers.extend(
+            handler for handler in logger.handlers if handler not in handlers
+        )
+        logger.handlers = [queue_handler]
+
+    log_queue_handler = queue_handler
+    log_listener = BatchingQueueListener(
+        queue_handler.queue,
+        *handlers,
+        flush_interval=config.LOG_FLUSH_INTERVAL_SECONDS,
+        routes=dict(queued_handlers),
+    )
+    log_listener.start()
+
+
+def stop_logging() -> None:
+    # Drains the queue, then hands the handlers back to their loggers so that
+    # anything logged later, e.g. by uvicorn on shutdown, is still written
+    global log_listener
+    if log_listener is None:
+        return
+
+    log_listener.stop()
+    sampling = sampling_filter()
+    for handler in log_listener.handlers:
+        handler.filters.insert(0, sampling)
+        handler.addFilter(correlation_id_filter())
+    for name, handlers in queued_handlers.items():
+        logging.getLogger(name).handlers = handlers
+    queued_handlers.clear()
+    log_listener = None
+
+
+def logging_stats() -> dict:
+    if log_queue_handler is None or log_listener is None:
+        return {"mode": "sync"}
+    return {"mode": "queue", **log_queue_handler.stats()}
+
+
+def correlation_id_length() -> int:
+    return 8 if isinstance(config, DevConfig) else 32
+
+
+def correlation_id_filter() -> CorrelationIdFilter:
+    return CorrelationIdFilter(uuid_length=correlation_id_length(), default_value="-")
+
+
+def sampling_filter() -> SamplingFilter:
+    return SamplingFilter(rates=config.LOG_SAMPLE_RATES)
+
+
 def configure_logging() -> None:
+    stop_logging()
+    queued = config.LOG_QUEUE_SIZE > 0
+    # Queued records get their correlation id before they are enqueued
+    handler_filters = (
+        ["email_obfuscation"]
+        if queued
+        else ["sampling", "correlation_id", "email_obfuscation"]
+    )
+
+    if isinstance(config, ProdConfig):
+        console_handler = {
+            "class": "logging.StreamHandler",
+            "level": "DEBUG",
+            "formatter": "plain_console",
+            "filters": handler_filters,
+        }
+    else:
+        console_handler = {
+            "class": "rich.logging.RichHandler",
+            "level": "DEBUG",
+            "formatter": "console",
+            "filters": handler_filters,
+        }
+
+    file_handler = {
+        "class": "logging.handlers.RotatingFileHandler",
+        "level": "DEBUG",
+        "formatter": "file",
+        "filters": handler_filters,
+        "filename": "app.log",
+        "maxBytes": 1024 * 1024,  # 1 MB
+        "backupCount": 2,
+        "encoding": "utf8",
+    }
+    if queued:
+        # Writes happen on the listener thread, where batching them is safe
+        file_handler["()"] = BatchingRotatingFileHandler
+        file_handler["batch_size"] = config.LOG_BATCH_SIZE
+        del file_handler["class"]
+
     dictConfig(
         {
             "version": 1,
             "disable_existing_loggers": False,
             "filters": {
+                "sampling": {
+                    "()": SamplingFilter,
+                    "rates": config.LOG_SAMPLE_RATES,
+                },
                 "correlation_id": {
                     "()": "asgi_correlation_id.CorrelationIdFilter",
-                    "uuid_length": 8 if isinstance(config, DevConfig) else 32,
+                    "uuid_length": correlation_id_length(),
                     "default_value": "-",
                 },
                 "email_obfuscation": {
@@ -46,6 +361,11 @@ def configure_logging() -> None:
                     "datefmt": "%Y-%m-%dT%H:%M:%S",
                     "format": "(%(correlation_id)s) %(name)s:%(lineno)d - %(message)s",
                 },
+                "plain_console": {
+                    "class": "logging.Formatter",
+                    "datefmt": "%Y-%m-%dT%H:%M:%S",
+                    "format": "%(asctime)s %(levelname)s (%(correlation_id)s) %(name)s:%(lineno)d - %(message)s",
+                },
                 "file": {
                     "class": "pythonjsonlogger.jsonlogger.JsonFormatter",
                     "datefmt": "%Y-%m-%dT%H:%M:%S",
@@ -53,22 +373,8 @@ def configure_logging() -> None:
                 },
             },
             "handlers": {
-                "default": {
-                    "class": "rich.logging.RichHandler",
-                    "level": "DEBUG",
-                    "formatter": "console",
-                    "filters": ["correlation_id", "email_obfuscation"],
-                },
-                "rotating_file": {
-                    "class": "logging.handlers.RotatingFileHandler",
-                    "level": "DEBUG",
-                    "formatter": "file",
-                    "filters": ["correlation_id", "email_obfuscation"],
-                    "filename": "app.log",
-                    "maxBytes": 1024 * 1024,  # 1 MB
-                    "backupCount": 2,
-                    "encoding": "utf8",
-                },
+                "default": console_handler,
+                "rotating_file": file_handler,
             },
             "loggers": {
                 "app": {
@@ -82,3 +388,5 @@ def configure_logging() -> None:
             },
         }
     )
+    if queued:
+        start_log_listener()
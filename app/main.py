@@ -1,31 +1,57 @@
 import logging
+import time
 from contextlib import asynccontextmanager
 
 from asgi_correlation_id import CorrelationIdMiddleware
 from fastapi import FastAPI, HTTPException
 from fastapi.exception_handlers import http_exception_handler
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
-from app.database import create_tables, database
-from app.logging_conf import configure_logging
+from app.database import database
+from app.hashing import password_pool
+from app.logging_conf import configure_logging, logging_stats, stop_logging
+from app.metrics import MetricsMiddleware, metrics_reporter
+from app.replicas import replicas
+from app.revocations import revocations
+from app.routes.follow import router as follow_router
 from app.routes.like import router as like_router
+from app.routes.post import feed_cache
 from app.routes.post import router as post_router
 from app.routes.user import router as user_router
+from app.schema import prepare_schema
+from app.security import user_cache
+from app.timeline import fanout_worker
 
 logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    started = time.perf_counter()
     configure_logging()
     await database.connect()
-    await create_tables()
+    await prepare_schema()
+    await replicas.connect()
+    await revocations.start()
+    fanout_worker.start()
+    metrics_reporter.start()
+    logger.info("Startup finished in %.3fs", time.perf_counter() - started)
     yield
+    await metrics_reporter.stop()
+    await fanout_worker.stop()
+    await revocations.stop()
+    await replicas.disconnect()
     await database.disconnect()
+    password_pool.shutdown()
+    stop_logging()
 
 
 app = FastAPI(lifespan=lifespan, title="Social Media API")
 
+# Added first so that it runs inside CorrelationIdMiddleware and its logs
+# carry the request id
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(CorrelationIdMiddleware)
 
 origins = ["*"]
@@ -35,11 +61,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 app.include_router(post_router)
 app.include_router(user_router)
 app.include_router(like_router)
+app.include_router(follow_router)
 
 
 @app.get("/health", status_code=200, tags=["Health"])
@@ -47,7 +75,39 @@ async def health_check():
     return {"status": "ok", "service": "social_media_api"}
 
 
+@app.get("/health/password-hashing", status_code=200, tags=["Health"])
+async def password_hashing_stats():
+    return password_pool.stats()
+
+
+@app.get("/health/database", status_code=200, tags=["Health"])
+async def database_pool_stats():
+    return {**database.pool_stats(), "replicas": replicas.stats()}
+
+
+@app.get("/health/cache", status_code=200, tags=["Health"])
+async def cache_stats():
+    return {"users": user_cache.stats(), "feed": feed_cache.stats()}
+
+
+@app.get("/health/timeline-fanout", status_code=200, tags=["Health"])
+async def timeline_fanout_stats():
+    return fanout_worker.stats()
+
+
+@app.get("/health/logging", status_code=200, tags=["Health"])
+async def logging_pipeline_stats():
+    return logging_stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Health"])
+async def metrics():
+    return PlainTextResponse(
+        metrics_reporter.collect(), media_type="text/plain; version=0.0.4"
+    )
+
+
 @app.exception_handler(HTTPException)
 async def http_exception_handle_logging(request, exc):
-    logger.error(f"HTTPException: {exc.status_code} {exc.detail}")
+    logger.error("HTTPException: %s %s", exc.status_code, exc.detail)
     return await http_exception_handler(request, exc)
@@ -0,0 +1,332 @@
+import asyncio
+import bisect
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional, Sequence
+
+from app.config import config
+from app.tracing import RequestQueries, log_request_summary, request_queries
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+DESCRIPTIONS = {
+    "http_requests_total": "Requests handled, by route template and status",
+    "http_requests_in_flight": "Requests being handled",
+    "http_request_duration_seconds": "Request latency, by route template",
+    "http_request_db_seconds": "Time spent in database queries per request",
+    "http_request_db_queries": "Database queries per request",
+    "event_loop_lag_seconds": "Delay of the event loop waking up a sleeping task",
+    "event_loop_lag_last_seconds": "Last measured event loop lag, by worker",
+    "metrics_workers": "Workers whose metrics are included",
+}
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        cumulative, total = {}, 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            cumulative[str(bound)] = total
+        cumulative["+Inf"] = self.count
+        return {"buckets": cumulative, "sum": self.sum, "count": self.count}
+
+
+def labels(**values) -> str:
+    # Rendered once and used as the key, so merged snapshots match on it
+    escaped = (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for value in values.values()
+    )
+    return ",".join(f'{name}="{value}"' for name, value in zip(values, escaped))
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.counters: dict[str, dict[str, float]] = {}
+        self.gauges: dict[str, dict[str, float]] = {}
+        self.histograms: dict[str, dict[str, Histogram]] = {}
+
+    def inc(self, name: str, label_key: str = "", value: float = 1) -> None:
+        series = self.counters.setdefault(name, {})
+        series[label_key] = series.get(label_key, 0) + value
+
+    def add(self, name: str, label_key: str = "", value: float = 1) -> None:
+        series = self.gauges.setdefault(name, {})
+        series[label_key] = series.get(label_key, 0) + value
+
+    def set(self, name: str, label_key: str = "", value: float = 0) -> None:
+        self.gauges.setdefault(name, {})[label_key] = value
+
+    def observe(
+        self,
+        name: str,
+        label_key: str,
+        value: float,
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        series = self.histograms.setdefault(name, {})
+        histogram = series.get(label_key)
+        if histogram is None:
+            histogram = series[label_key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def snapshot(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "written_at": time.time(),
+            "counters": self.counters,
+            "gauges": self.gauges,
+            "histograms": {
+                name: {key: histogram.snapshot() for key, histogram in series.items()}
+                for name, series in self.histograms.items()
+            },
+        }
+
+
+def merge(snapshots: list[dict], live_after: float) -> dict:
+    # Counters and histograms of every worker that ever wrote a snapshot are
+    # summed, so totals do not drop when a worker restarts. Gauges describe
+    # the present and only come from workers that are still writing.
+    merged: dict = {"counters": {}, "gauges": {}, "histograms": {}}
+    live = [snapshot for snapshot in snapshots if snapshot["written_at"] >= live_after]
+
+    for snapshot in snapshots:
+        for name, series in snapshot["counters"].items():
+            totals = merged["counters"].setdefault(name, {})
+            for key, value in series.items():
+                totals[key] = totals.get(key, 0) + value
+
+        for name, series in snapshot["histograms"].items():
+            totals = merged["histograms"].setdefault(name, {})
+            for key, histogram in series.items():
+                total = totals.setdefault(key, {"buckets": {}, "sum": 0.0, "count": 0})
+                for bound, count in histogram["buckets"].items():
+                    total["buckets"][bound] = total["buckets"].get(bound, 0) + count
+                total["sum"] += histogram["sum"]
+                total["count"] += histogram["count"]
+
+    for snapshot in live:
+        for name, series in snapshot["gauges"].items():
+            totals = merged["gauges"].setdefault(name, {})
+            for key, value in series.items():
+                totals[key] = totals.get(key, 0) + value
+    merged["gauges"]["metrics_workers"] = {"": len(live)}
+
+    return merged
+
+
+def sample(name: str, label_key: str, value: float) -> str:
+    return f"{name}{{{label_key}}} {value}" if label_key else f"{name} {value}"
+
+
+def render(merged: dict) -> str:
+    # Prometheus text exposition format
+    lines = []
+    for kind in ("counters", "gauges", "histograms"):
+        for name, series in sorted(merged[kind].items()):
+            if name in DESCRIPTIONS:
+                lines.append(f"# HELP {name} {DESCRIPTIONS[name]}")
+            lines.append(f"# TYPE {name} {kind[:-1]}")
+            for key, value in sorted(series.items()):
+                if kind != "histograms":
+                    lines.append(sample(name, key, value))
+                    continue
+                for bound, count in value["buckets"].items():
+                    bucket_key = f'{key},le="{bound}"' if key else f'le="{bound}"'
+                    lines.append(sample(f"{name}_bucket", bucket_key, count))
+                lines.append(sample(f"{name}_sum", key, value["sum"]))
+                lines.append(sample(f"{name}_count", key, value["count"]))
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    # Labels requests by route template (/posts/{post_id}), which the router
+    # stores in the scope, so raw paths cannot blow up the series count
+    def __init__(self, app, metrics: Optional[Metrics] = None) -> None:
+        self.app = app
+        self.metrics = metrics or app_metrics
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        queries = RequestQueries()
+        token = request_queries.set(queries)
+        self.metrics.add("http_requests_in_flight")
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.add("http_requests_in_flight", value=-1)
+            request_queries.reset(token)
+
+            route = scope.get("route")
+            template = route.path if route is not None else "unmatched"
+            route_key = labels(method=scope["method"], route=template)
+            self.metrics.inc(
+                "http_requests_total",
+                labels(method=scope["method"], route=template, status=status_code),
+            )
+            self.metrics.observe("http_request_duration_seconds", route_key, elapsed)
+            self.metrics.observe("http_request_db_seconds", route_key, queries.seconds)
+            self.metrics.observe(
+                "http_request_db_queries", route_key, queries.count, QUERY_COUNT_BUCKETS
+            )
+            log_request_summary(
+                scope["method"], template, status_code, elapsed, queries
+            )
+
+
+class MetricsReporter:
+    # Measures event loop lag and, with a directory configured, writes this
+    # worker's snapshot there so any worker can serve the merged metrics of
+    # all of them
+    def __init__(
+        self,
+        metrics: Metrics,
+        directory: Optional[str],
+        flush_interval: float,
+        lag_interval: float,
+    ) -> None:
+        self.metrics = metrics
+        self.directory = Path(directory) if directory else None
+        self.flush_interval = flush_interval
+        self.lag_interval = lag_interval
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def path(self) -> Optional[Path]:
+        if self.directory is None:
+            return None
+        return self.directory / f"worker-{os.getpid()}.json"
+
+    def flush(self) -> None:
+        if self.path is None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        partial = self.path.with_suffix(".tmp")
+        partial.write_text(json.dumps(self.metrics.snapshot()))
+        # Readers never see a half-written file
+        os.replace(partial, self.path)
+
+    def remove_stale(self) -> None:
+        # Files of workers from an earlier run would otherwise be summed in
+        # for good
+        if self.directory is None or not self.directory.is_dir():
+            return
+        for path in self.directory.glob("worker-*"):
+            pid = path.name.removeprefix("worker-").partition(".")[0]
+            if pid.isdigit() and not pid_alive(int(pid)):
+                path.unlink(missing_ok=True)
+
+    def snapshots(self) -> list[dict]:
+        snapshots = [self.metrics.snapshot()]
+        if self.directory is None or not self.directory.is_dir():
+            return snapshots
+
+        for path in self.directory.glob("worker-*.json"):
+            if path == self.path:
+                continue
+            try:
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                logger.warning("Skipping unreadable metrics file %s", path)
+        return snapshots
+
+    def collect(self) -> str:
+        live_after = time.time() - 3 * self.flush_interval
+        return render(merge(self.snapshots(), live_after))
+
+    async def _run(self) -> None:
+        worker = labels(worker=os.getpid())
+        flushed = time.monotonic()
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.lag_interval)
+            lag = max(time.monotonic() - started - self.lag_interval, 0.0)
+            self.metrics.observe("event_loop_lag_seconds", "", lag, LOOP_LAG_BUCKETS)
+            self.metrics.set("event_loop_lag_last_seconds", worker, lag)
+
+            if time.monotonic() - flushed >= self.flush_interval:
+                flushed = time.monotonic()
+                try:
+                    self.flush()
+                except OSError:
+                    logger.exception("Could not write the metrics snapshot")
+
+    def start(self) -> None:
+        try:
+            self.remove_stale()
+            # Replaces a file left behind by a dead worker with the same pid
+            self.flush()
+        except OSError:
+            logger.exception("Could not write the metrics snapshot")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            self.flush()
+        except OSError:
+            logger.exception("Could not write the metrics snapshot")
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def default_metrics_dir() -> Optional[str]:
+    # Workers spawned by uvicorn --workers share a directory named after the
+    # master process; a single process has no other workers to merge
+    parent = multiprocessing.parent_process()
+    if parent is None:
+        return None
+    return os.path.join(tempfile.gettempdir(), f"social-api-metrics-{parent.pid}")
+
+
+app_metrics = Metrics()
+
+metrics_reporter = MetricsReporter(
+    app_metrics,
+    config.METRICS_DIR or default_metrics_dir(),
+    config.METRICS_FLUSH_INTERVAL_SECONDS,
+    config.EVENT_LOOP_LAG_INTERVAL_SECONDS,
+)
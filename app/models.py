@@ -1,6 +1,7 @@
 from datetime import datetime
+from enum import Enum
 
-from pydantic import BaseModel, ConfigDict, EmailStr, Field
+from pydantic import AliasChoices, BaseModel, ConfigDict, EmailStr, Field
 
 
 class PostIn(BaseModel):
@@ -13,11 +14,27 @@ class PostOut(PostIn):
     id: int
     created_at: datetime
     user_id: int
-    likes: int = Field(default=0)
+    likes: int = Field(default=0, validation_alias=AliasChoices("like_count", "likes"))
+    liked_by_me: bool = False
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class LikeBulkIn(BaseModel):
+    post_ids: list[int] = Field(..., min_length=1, max_length=100)
+
+
+class LikeStatus(str, Enum):
+    liked = "liked"
+    unliked = "unliked"
+    not_found = "not_found"
+
+
+class LikeResult(BaseModel):
+    post_id: int
+    status: LikeStatus
+
+
 class UserIn(BaseModel):
     email: EmailStr
     password: str = Field(..., min_length=4)
@@ -30,6 +47,19 @@ class UserOut(UserIn):
     model_config = ConfigDict(from_attributes=True)
 
 
+class CurrentUser(BaseModel):
+    id: int
+    email: str
+
+    def __getitem__(self, key: str):
+        return getattr(self, key)
+
+
 class Token(BaseModel):
     access_token: str
+    refresh_token: str
     token_type: str
+
+
+class RefreshTokenIn(BaseModel):
+    refresh_token: str
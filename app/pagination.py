@@ -0,0 +1,51 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+from typing import Any
+
+from fastapi import HTTPException, status
+
+from app.config import config
+
+invalid_cursor_exception = HTTPException(
+    status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    key = (config.SECRET_KEY or "").encode()
+    digest = hmac.new(key, payload.encode(), hashlib.sha256).digest()
+    return _b64encode(digest)
+
+
+def encode_cursor(sorting: str, key: Any, post_id: int) -> str:
+    data = json.dumps({"s": sorting, "k": key, "id": post_id}, separators=(",", ":"))
+    payload = _b64encode(data.encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def decode_cursor(cursor: str, sorting: str) -> tuple[Any, int]:
+    # A cursor is only valid for the sorting it was issued for
+    payload, _, signature = cursor.partition(".")
+    if not hmac.compare_digest(signature.encode(), _sign(payload).encode()):
+        raise invalid_cursor_exception
+
+    try:
+        data = json.loads(_b64decode(payload))
+        key, post_id = data["k"], int(data["id"])
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise invalid_cursor_exception from e
+
+    if data.get("s") != sorting:
+        raise invalid_cursor_exception
+    return key, post_id
@@ -0,0 +1,209 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Optional
+
+import asyncpg
+import sqlalchemy
+from databases import DatabaseURL
+
+from app.config import config
+from app.database import Database, database, pool_options
+
+logger = logging.getLogger(__name__)
+
+# Seconds since the last replayed transaction, or 0 when everything received
+# has been replayed (an idle primary otherwise looks like growing lag). NULL
+# when no WAL receiver is streaming: a replica cut off from the primary has
+# replayed all it received and would report no lag forever. The receiver's
+# status is only visible with pg_read_all_stats, the row itself to anyone.
+replication_lag_query = sqlalchemy.text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (
+            SELECT 1 FROM pg_stat_wal_receiver
+            WHERE COALESCE(status, 'streaming') = 'streaming'
+        ) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END AS lag
+    """
+)
+
+# The replica is down, restarting, refusing connections or rejecting our
+# credentials: it leaves the rotation until a health check passes again
+replica_down_errors = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.InterfaceError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.OperatorInterventionError,
+    asyncpg.TooManyConnectionsError,
+    asyncpg.InvalidAuthorizationSpecificationError,
+)
+# Any other error of a read, e.g. a hot standby cancelling it on a recovery
+# conflict, is only retried on the primary
+replica_errors = (*replica_down_errors, asyncpg.PostgresError)
+
+
+class Replica:
+    def __init__(self, url: str) -> None:
+        self.database = Database(url, **pool_options)
+        self.name = str(DatabaseURL(url).obscure_password)
+        self.healthy = False
+        self.lag: Optional[float] = None
+
+    async def check(self, max_lag: float) -> None:
+        try:
+            if not self.database.is_connected:
+                await self.database.connect()
+            lag = await self.database.fetch_val(replication_lag_query)
+        except replica_errors as e:
+            if self.healthy:
+                logger.warning("Replica %s is unreachable: %r", self.name, e)
+            self.healthy = False
+            self.lag = None
+            return
+
+        self.lag = None if lag is None else float(lag)
+        healthy = self.lag is not None and self.lag <= max_lag
+        if healthy != self.healthy:
+            if healthy:
+                state = "back in rotation"
+            elif self.lag is None:
+                state = "not streaming from the primary"
+            else:
+                state = f"{self.lag:.1f}s behind"
+            logger.warning("Replica %s is %s", self.name, state)
+        self.healthy = healthy
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag,
+            "pool": self.database.pool_stats(),
+        }
+
+
+class ReplicaSet:
+    # Routes reads that tolerate replication lag to healthy replicas in turn,
+    # falling back to the primary when none are available
+    def __init__(
+        self,
+        primary: Database,
+        urls: list[str],
+        max_lag: float,
+        check_interval: float,
+    ) -> None:
+        self.primary = primary
+        self.replicas = [Replica(url) for url in urls]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._next = 0
+        self._checker: Optional[asyncio.Task] = None
+
+    async def check(self) -> None:
+        results = await asyncio.gather(
+            *(replica.check(self.max_lag) for replica in self.replicas),
+            return_exceptions=True,
+        )
+        for replica, result in zip(self.replicas, results):
+            if isinstance(result, Exception):
+                logger.error(
+                    "Health check of replica %s failed",
+                    replica.name,
+                    exc_info=result,
+                )
+                replica.healthy = False
+                replica.lag = None
+
+    async def _check_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.check()
+            except Exception:
+                # A dead checker would freeze every replica's state
+                logger.exception("Replica health checks failed")
+
+    async def connect(self) -> None:
+        if not self.replicas:
+            return
+        await self.check()
+        self._checker = asyncio.create_task(self._check_forever())
+
+    async def disconnect(self) -> None:
+        if self._checker is not None:
+            self._checker.cancel()
+            self._checker = None
+        for replica in self.replicas:
+            if replica.database.is_connected:
+                await replica.database.disconnect()
+            replica.healthy = False
+
+    def reader(self) -> Optional[Replica]:
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self._next % len(self.replicas)]
+            self._next += 1
+            if replica.healthy:
+                return replica
+        return None
+
+    async def fetch_all(self, query) -> list:
+        replica = self.reader()
+        if replica is not None:
+            try:
+                return await replica.database.fetch_all(query)
+            except replica_errors as e:
+                self.failed(replica, e)
+        return await self.primary.fetch_all(query)
+
+    async def fetch_one(self, query):
+        replica = self.reader()
+        if replica is not None:
+            try:
+                row = await replica.database.fetch_one(query)
+            except replica_errors as e:
+                self.failed(replica, e)
+            else:
+                if row is not None:
+                    return row
+                # A miss may just be a write the replica has not replayed yet
+        return await self.primary.fetch_one(query)
+
+    async def iterate(self, query) -> AsyncIterator:
+        # A replica failing before its first row is replaced by the primary;
+        # once rows were sent, the stream is not restarted halfway through
+        replica = self.reader()
+        if replica is not None:
+            streamed = False
+            try:
+                async for row in replica.database.iterate(query):
+                    streamed = True
+                    yield row
+                return
+            except replica_errors as e:
+                if streamed:
+                    raise
+                self.failed(replica, e)
+        async for row in self.primary.iterate(query):
+            yield row
+
+    def failed(self, replica: Replica, error: Exception) -> None:
+        logger.warning("Replica %s failed, using primary: %r", replica.name, error)
+        if isinstance(error, replica_down_errors):
+            replica.healthy = False
+
+    def stats(self) -> list[dict]:
+        return [replica.stats() for replica in self.replicas]
+
+
+replicas = ReplicaSet(
+    database,
+    config.DATABASE_REPLICA_URLS,
+    max_lag=config.REPLICA_MAX_LAG_SECONDS,
+    check_interval=config.REPLICA_CHECK_INTERVAL_SECONDS,
+)
@@ -0,0 +1,106 @@
+import asyncio
+import datetime
+import logging
+import time
+from typing import Optional
+
+import sqlalchemy
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import config
+from app.database import Database, database, revoked_token_table
+
+logger = logging.getLogger(__name__)
+
+# revoked_at is the start of the revoking transaction, which may commit after
+# a later revocation was already polled, so every poll reads a little further
+# back than the newest row it has seen
+POLL_OVERLAP = datetime.timedelta(seconds=5)
+
+
+class RevocationList:
+    # Every revoked token and session id that has not expired yet, held in
+    # memory so that requests check them without a query. revoked_tokens is
+    # the source of truth: a worker's own revocations apply at once, those of
+    # other workers once the next poll reads them.
+    def __init__(self, db: Database, poll_interval: float) -> None:
+        self.database = db
+        self.poll_interval = poll_interval
+        # Token id to the time its token expires
+        self.revoked: dict[str, float] = {}
+        self.watermark: Optional[datetime.datetime] = None
+        self._poller: Optional[asyncio.Task] = None
+
+    def is_revoked(self, token_ids: list[str]) -> bool:
+        now = time.time()
+        return any(self.revoked.get(token_id, 0) > now for token_id in token_ids)
+
+    async def revoke(self, token_ids: list[str], expires_at: float) -> None:
+        if not token_ids or expires_at <= time.time():
+            return
+        expires = datetime.datetime.fromtimestamp(expires_at, datetime.timezone.utc)
+        query = (
+            insert(revoked_token_table)
+            .values(
+                [
+                    {"token_id": token_id, "expires_at": expires}
+                    for token_id in token_ids
+                ]
+            )
+            .on_conflict_do_nothing()
+        )
+        await self.database.execute(query)
+        for token_id in token_ids:
+            self.revoked[token_id] = expires_at
+
+        # Revocations are rare, each one also clears out the expired ones
+        await self.database.execute(
+            revoked_token_table.delete().where(
+                revoked_token_table.c.expires_at <= sqlalchemy.func.now()
+            )
+        )
+
+    async def refresh(self) -> None:
+        query = sqlalchemy.select(revoked_token_table).where(
+            revoked_token_table.c.expires_at > sqlalchemy.func.now()
+        )
+        if self.watermark is not None:
+            query = query.where(
+                revoked_token_table.c.revoked_at > self.watermark - POLL_OVERLAP
+            )
+        for row in await self.database.fetch_all(query):
+            self.revoked[row.token_id] = row.expires_at.timestamp()
+            if self.watermark is None or row.revoked_at > self.watermark:
+                self.watermark = row.revoked_at
+
+        now = time.time()
+        self.revoked = {
+            token_id: expires_at
+            for token_id, expires_at in self.revoked.items()
+            if expires_at > now
+        }
+
+    async def _poll_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh()
+            except Exception:
+                # Keeps polling: the revocations already known still apply
+                logger.exception("Could not refresh the revoked tokens")
+
+    async def start(self) -> None:
+        await self.refresh()
+        self._poller = asyncio.create_task(self._poll_forever())
+
+    async def stop(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+
+    def clear(self) -> None:
+        self.revoked.clear()
+        self.watermark = None
+
+
+revocations = RevocationList(database, config.REVOKED_TOKENS_POLL_SECONDS)
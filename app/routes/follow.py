@@ -0,0 +1,190 @@
+import logging
+from datetime import datetime
+from typing import Annotated, Optional
+
+import asyncpg
+import sqlalchemy
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.dialects.postgresql import insert
+
+from app.database import (
+    database,
+    follow_table,
+    post_table,
+    timeline_table,
+    user_table,
+)
+from app.models import PostOut, UserOut
+from app.pagination import decode_cursor, encode_cursor, invalid_cursor_exception
+from app.replicas import replicas
+from app.routes.post import select_posts_for
+from app.security import get_current_user
+from app.timeline import backfill_timeline, is_celebrity, remove_author_from_timeline
+
+router = APIRouter(tags=["Follows"])
+
+logger = logging.getLogger(__name__)
+
+TIMELINE_CURSOR = "timeline"
+
+user_not_found_exception = HTTPException(
+    status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+)
+
+
+def change_follower_count(user_id: int, delta: int):
+    return (
+        user_table.update()
+        .where(user_table.c.id == user_id)
+        .values(follower_count=user_table.c.follower_count + delta)
+    )
+
+
+@router.put("/follow/{user_id}", status_code=status.HTTP_200_OK)
+async def follow_user(
+    user_id: int,
+    current_user: Annotated[UserOut, Depends(get_current_user)],
+):
+    logger.info("Following user with id %s", user_id)
+
+    if user_id == current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="You cannot follow yourself",
+        )
+
+    query = (
+        insert(follow_table)
+        .values(follower_id=current_user.id, followee_id=user_id)
+        .on_conflict_do_nothing()
+        .returning(follow_table.c.followee_id)
+    )
+    try:
+        async with database.transaction():
+            if await database.fetch_one(query) is not None:
+                await database.execute(change_follower_count(user_id, 1))
+                await database.execute(backfill_timeline(current_user.id, user_id))
+    except asyncpg.ForeignKeyViolationError as e:
+        raise user_not_found_exception from e
+
+    return {"detail": "User followed"}
+
+
+@router.delete("/follow/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def unfollow_user(
+    user_id: int,
+    current_user: Annotated[UserOut, Depends(get_current_user)],
+):
+    logger.info("Unfollowing user with id %s", user_id)
+
+    query = (
+        follow_table.delete()
+        .where(
+            follow_table.c.follower_id == current_user.id,
+            follow_table.c.followee_id == user_id,
+        )
+        .returning(follow_table.c.followee_id)
+    )
+    async with database.transaction():
+        if await database.fetch_one(query) is not None:
+            await database.execute(change_follower_count(user_id, -1))
+            await database.execute(
+                remove_author_from_timeline(current_user.id, user_id)
+            )
+            return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+    exists = sqlalchemy.select(user_table.c.id).where(user_table.c.id == user_id)
+    if await database.fetch_one(exists) is None:
+        raise user_not_found_exception
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+def timeline_page(user_id: int, limit: int, before: Optional[tuple[datetime, int]]):
+    # Newest (post_id, created_at) pairs from the materialized timeline merged
+    # with the newest posts of followed authors that are not fanned out. Each
+    # side reads at most `limit` index entries per source, so the cost does
+    # not grow with the number of followed users.
+    def page(query, created_at, post_id):
+        if before is not None:
+            query = query.where(
+                sqlalchemy.tuple_(created_at, post_id) < sqlalchemy.tuple_(*before)
+            )
+        return query.order_by(created_at.desc(), post_id.desc()).limit(limit)
+
+    materialized = page(
+        sqlalchemy.select(timeline_table.c.post_id, timeline_table.c.created_at).where(
+            timeline_table.c.user_id == user_id
+        ),
+        timeline_table.c.created_at,
+        timeline_table.c.post_id,
+    ).subquery()
+
+    followed = (
+        sqlalchemy.select(follow_table.c.followee_id)
+        .where(
+            follow_table.c.follower_id == user_id,
+            follow_table.c.followee_id == user_table.c.id,
+        )
+        .exists()
+    )
+    celebrities = (
+        sqlalchemy.select(user_table.c.id)
+        .where(
+            is_celebrity(user_table.c.follower_count),
+            sqlalchemy.or_(user_table.c.id == user_id, followed),
+        )
+        .subquery()
+    )
+    celebrity_posts = page(
+        sqlalchemy.select(
+            post_table.c.id.label("post_id"), post_table.c.created_at
+        ).where(post_table.c.user_id == celebrities.c.id),
+        post_table.c.created_at,
+        post_table.c.id,
+    ).lateral()
+
+    merged = sqlalchemy.union(
+        sqlalchemy.select(materialized.c.post_id, materialized.c.created_at),
+        sqlalchemy.select(celebrity_posts.c.post_id, celebrity_posts.c.created_at)
+        .select_from(celebrities)
+        .join(celebrity_posts, sqlalchemy.true()),
+    ).subquery()
+    return (
+        sqlalchemy.select(merged.c.post_id)
+        .order_by(merged.c.created_at.desc(), merged.c.post_id.desc())
+        .limit(limit)
+        .subquery()
+    )
+
+
+@router.get("/timeline", response_model=list[PostOut])
+async def get_timeline(
+    response: Response,
+    current_user: Annotated[UserOut, Depends(get_current_user)],
+    limit: Annotated[int, Query(gt=0, le=100)] = 10,
+    cursor: Optional[str] = None,
+):
+    logger.info("Getting the home timeline")
+
+    before = None
+    if cursor:
+        key, post_id = decode_cursor(cursor, TIMELINE_CURSOR)
+        try:
+            before = (datetime.fromisoformat(key), post_id)
+        except (TypeError, ValueError) as e:
+            raise invalid_cursor_exception from e
+
+    page = timeline_page(current_user.id, limit, before)
+    query = (
+        select_posts_for(current_user.id)
+        .join(page, page.c.post_id == post_table.c.id)
+        .order_by(post_table.c.created_at.desc(), post_table.c.id.desc())
+    )
+    posts = await replicas.fetch_all(query)
+
+    if len(posts) == limit:
+        last = posts[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            TIMELINE_CURSOR, last.created_at.isoformat(), last.id
+        )
+    return posts
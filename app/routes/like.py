@@ -1,11 +1,14 @@
 import logging
-from typing import Annotated
+from typing import Annotated, Optional
 
-from fastapi import APIRouter, Depends, status
+import asyncpg
+import sqlalchemy
+from fastapi import APIRouter, Depends, Response, status
+from sqlalchemy.dialects.postgresql import insert
 
-from app.database import database, like_table
-from app.models import UserOut
-from app.routes.post import find_post
+from app.database import database, like_table, post_table
+from app.models import LikeBulkIn, LikeResult, LikeStatus, UserOut
+from app.routes.post import feed_cache, post_not_found_exception
 from app.security import get_current_user
 
 router = APIRouter(prefix="/like", tags=["Likes"])
@@ -13,32 +16,159 @@ router = APIRouter(prefix="/like", tags=["Likes"])
 logger = logging.getLogger(__name__)
 
 
+def change_likes(user_id: int, post_ids: list[int], *, add: bool, remove: bool):
+    # Adds and/or removes the user's likes on the given posts and adjusts
+    # posts.like_count in one statement. With both add and remove set, a post
+    # is liked only if no like was removed from it, which makes it a toggle.
+    # Returns one row per existing post with whether a like was removed.
+    posts = (
+        sqlalchemy.select(post_table.c.id)
+        .where(post_table.c.id.in_(post_ids))
+        .cte("target_posts")
+    )
+    changes = []
+
+    removed = None
+    if remove:
+        removed = (
+            like_table.delete()
+            .where(
+                like_table.c.user_id == user_id,
+                like_table.c.post_id.in_(sqlalchemy.select(posts.c.id)),
+            )
+            .returning(like_table.c.post_id)
+            .cte("removed_likes")
+        )
+        changes.append(
+            sqlalchemy.select(
+                removed.c.post_id, sqlalchemy.literal_column("-1").label("delta")
+            )
+        )
+
+    if add:
+        source = sqlalchemy.select(
+            sqlalchemy.cast(user_id, sqlalchemy.Integer), posts.c.id
+        )
+        if removed is not None:
+            source = source.where(
+                posts.c.id.not_in(sqlalchemy.select(removed.c.post_id))
+            )
+        added = (
+            insert(like_table)
+            .from_select(["user_id", "post_id"], source)
+            .on_conflict_do_nothing()
+            .returning(like_table.c.post_id)
+            .cte("added_likes")
+        )
+        changes.append(
+            sqlalchemy.select(
+                added.c.post_id, sqlalchemy.literal_column("1").label("delta")
+            )
+        )
+
+    deltas = sqlalchemy.union_all(*changes).subquery()
+    totals = (
+        sqlalchemy.select(
+            deltas.c.post_id, sqlalchemy.func.sum(deltas.c.delta).label("delta")
+        )
+        .group_by(deltas.c.post_id)
+        .subquery()
+    )
+    counted = (
+        post_table.update()
+        .where(post_table.c.id == totals.c.post_id)
+        .values(like_count=post_table.c.like_count + totals.c.delta)
+        .returning(post_table.c.id)
+        .cte("counted_likes")
+    )
+
+    if removed is not None:
+        was_removed = posts.c.id.in_(sqlalchemy.select(removed.c.post_id))
+    else:
+        was_removed = sqlalchemy.false()
+
+    return sqlalchemy.select(posts.c.id, was_removed.label("removed")).add_cte(counted)
+
+
+async def apply_like_changes(
+    user_id: int, post_ids: list[int], *, add: bool, remove: bool
+) -> dict[int, bool]:
+    # Returns whether each existing post ended up liked by the change
+    query = change_likes(user_id, post_ids, add=add, remove=remove)
+    try:
+        results = await database.fetch_all(query)
+    except asyncpg.ForeignKeyViolationError as e:
+        # A post was deleted while the like was being inserted
+        raise post_not_found_exception from e
+
+    if results:
+        await feed_cache.invalidate()
+    return {result.id: add and not result.removed for result in results}
+
+
+async def apply_like_change(
+    user_id: int, post_id: int, *, add: bool, remove: bool
+) -> bool:
+    results = await apply_like_changes(user_id, [post_id], add=add, remove=remove)
+    if post_id not in results:
+        raise post_not_found_exception
+    return results[post_id]
+
+
+def like_status(liked: Optional[bool]) -> LikeStatus:
+    if liked is None:
+        return LikeStatus.not_found
+    return LikeStatus.liked if liked else LikeStatus.unliked
+
+
+@router.post("/bulk", response_model=list[LikeResult])
+async def toggle_likes_bulk(
+    likes: LikeBulkIn,
+    current_user: Annotated[UserOut, Depends(get_current_user)],
+):
+    post_ids = list(dict.fromkeys(likes.post_ids))
+    logger.info("Toggling likes on %d posts", len(post_ids))
+
+    # One statement, so all toggles are applied together or not at all
+    results = await apply_like_changes(current_user.id, post_ids, add=True, remove=True)
+
+    return [
+        LikeResult(post_id=post_id, status=like_status(results.get(post_id)))
+        for post_id in post_ids
+    ]
+
+
 @router.post("/{post_id}", status_code=status.HTTP_201_CREATED)
 async def like_post(
     post_id: int,
     current_user: Annotated[UserOut, Depends(get_current_user)],
 ):
-    logger.info(f"Liking a post with id {post_id}")
+    logger.info("Toggling like on a post with id %s", post_id)
 
-    await find_post(post_id)
+    liked = await apply_like_change(current_user.id, post_id, add=True, remove=True)
 
-    select_query = like_table.select().where(
-        like_table.c.user_id == current_user.id,
-        like_table.c.post_id == post_id,
-    )
-    existing_like = await database.fetch_one(select_query)
+    if liked:
+        return {"detail": "Like added successfully"}
+    return {"detail": "Like removed successfully"}
 
-    if existing_like:
-        delete_query = like_table.delete().where(
-            like_table.c.user_id == current_user.id,
-            like_table.c.post_id == post_id,
-        )
-        await database.execute(delete_query)
-        return {"detail": "Like removed successfully"}
 
-    insert_query = like_table.insert().values(
-        user_id=current_user.id,
-        post_id=post_id,
-    )
-    await database.execute(insert_query)
-    return {"detail": "Like added successfully"}
+@router.put("/{post_id}", status_code=status.HTTP_200_OK)
+async def add_like(
+    post_id: int,
+    current_user: Annotated[UserOut, Depends(get_current_user)],
+):
+    logger.info("Liking a post with id %s", post_id)
+
+    await apply_like_change(current_user.id, post_id, add=True, remove=False)
+    return {"detail": "Post liked"}
+
+
+@router.delete("/{post_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def remove_like(
+    post_id: int,
+    current_user: Annotated[UserOut, Depends(get_current_user)],
+):
+    logger.info("Unliking a post with id %s", post_id)
+
+    await apply_like_change(current_user.id, post_id, add=False, remove=True)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
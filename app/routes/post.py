@@ -1,37 +1,111 @@
+import csv
+import hashlib
+import io
+import json
 import logging
+from datetime import datetime, timedelta
 from enum import Enum
-from typing import Annotated
+from typing import Annotated, AsyncIterator, Optional
 
 import sqlalchemy
-from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 
-from app.database import database, like_table, post_table
+from app.cache import GenerationCache, create_cache
+from app.config import config
+from app.database import SEARCH_CONFIG, database, like_table, post_table
 from app.models import PostIn, PostOut, UserOut
+from app.pagination import decode_cursor, encode_cursor, invalid_cursor_exception
+from app.replicas import replicas
 from app.security import get_current_user
+from app.timeline import fanout_worker
 
 router = APIRouter(prefix="/posts", tags=["Posts"])
 
 logger = logging.getLogger(__name__)
+# The hot read paths log here, so they can be sampled on their own with
+# LOG_SAMPLE_RATES
+read_logger = logging.getLogger(f"{__name__}.reads")
+
+# Everything but the search vector, which is only used for filtering
+post_columns = [column for column in post_table.c if column.name != "search_vector"]
+
+select_post_and_likes = sqlalchemy.select(*post_columns)
+
 
-select_post_and_likes = (
-    sqlalchemy.select(
-        post_table, sqlalchemy.func.count(like_table.c.post_id).label("likes")
+def liked_by(user_id: int):
+    # Semi-join served by the likes primary key (user_id, post_id)
+    return (
+        sqlalchemy.exists()
+        .where(
+            like_table.c.post_id == post_table.c.id,
+            like_table.c.user_id == user_id,
+        )
+        .label("liked_by_me")
     )
-    .select_from(post_table.outerjoin(like_table))
-    .group_by(post_table.c.id)
+
+
+def select_posts_for(user_id: int):
+    return select_post_and_likes.add_columns(liked_by(user_id))
+
+
+# Whole feed pages, invalidated by every write that can change one
+feed_cache = GenerationCache(
+    create_cache("feed", config.FEED_CACHE_SIZE, config.FEED_CACHE_TTL_SECONDS)
+)
+
+post_adapter = TypeAdapter(PostOut)
+posts_adapter = TypeAdapter(list[PostOut])
+
+MAX_BATCH_SIZE = 100
+
+# Rows serialized per chunk of a streamed export
+EXPORT_CHUNK_ROWS = 500
+
+post_not_found_exception = HTTPException(
+    status_code=status.HTTP_404_NOT_FOUND, detail="Post not found"
 )
 
 
+def post_json(post) -> bytes:
+    # Validated from the raw asyncpg row: from_attributes goes through
+    # databases' Record.__getattr__ for every field, which costs several times
+    # more than the validation itself
+    return post_adapter.dump_json(post_adapter.validate_python(dict(post._mapping)))
+
+
+def posts_json(posts) -> bytes:
+    return posts_adapter.dump_json(
+        posts_adapter.validate_python([dict(post._mapping) for post in posts])
+    )
+
+
+def json_response(body: bytes, status_code: int = status.HTTP_200_OK) -> Response:
+    # Bypasses FastAPI's response_model encoding, the routes keep their
+    # response_model for the OpenAPI schema
+    return Response(
+        content=body, status_code=status_code, media_type="application/json"
+    )
+
+
 async def find_post(post_id: int):
-    logger.info(f"Finding post with id {post_id}")
+    read_logger.info("Finding post with id %s", post_id)
 
-    query = post_table.select().where(post_table.c.id == post_id)
+    query = select_post_and_likes.where(post_table.c.id == post_id)
     post = await database.fetch_one(query)
 
     if post is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Post not found"
-        )
+        raise post_not_found_exception
     return post
 
 
@@ -39,6 +113,136 @@ class PostSorting(str, Enum):
     new = "new"
     old = "old"
     most_likes = "most_likes"
+    relevance = "relevance"
+
+
+class SearchMode(str, Enum):
+    substring = "substring"
+    fulltext = "fulltext"
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+def after_cursor(query, sort_column, descending: bool, key, post_id: int):
+    try:
+        if isinstance(sort_column.type, sqlalchemy.DateTime):
+            key = datetime.fromisoformat(key)
+        elif isinstance(sort_column.type, sqlalchemy.Integer):
+            key = int(key)
+        else:
+            key = float(key)
+    except (TypeError, ValueError) as e:
+        raise invalid_cursor_exception from e
+
+    position = sqlalchemy.tuple_(sort_column, post_table.c.id)
+    if descending:
+        return query.filter(position < sqlalchemy.tuple_(key, post_id))
+    return query.filter(position > sqlalchemy.tuple_(key, post_id))
+
+
+def filtered_posts(
+    user_id: Optional[int], search: str, search_mode: SearchMode, sorting: PostSorting
+):
+    # The feed query without paging; returns the query, its sort key and
+    # whether it sorts descending. Without a user, liked_by_me is left out.
+    query = select_post_and_likes if user_id is None else select_posts_for(user_id)
+    rank = None
+
+    if search and search_mode == SearchMode.fulltext:
+        ts_query = sqlalchemy.func.websearch_to_tsquery(
+            sqlalchemy.literal_column(f"'{SEARCH_CONFIG}'"), search
+        )
+        rank = sqlalchemy.func.ts_rank_cd(post_table.c.search_vector, ts_query)
+        query = query.add_columns(rank.label("rank")).filter(
+            post_table.c.search_vector.bool_op("@@")(ts_query)
+        )
+    elif search:
+        query = query.filter(post_table.c.title.contains(search))
+
+    if sorting == PostSorting.relevance:
+        if rank is None:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Relevance sorting requires a full-text search",
+            )
+        sort_column = rank.label("rank")
+    elif sorting == PostSorting.most_likes:
+        sort_column = post_table.c.like_count
+    else:
+        sort_column = post_table.c.created_at
+    descending = sorting != PostSorting.old
+
+    return query, sort_column, descending
+
+
+def ordered(query, sort_column, descending: bool):
+    if descending:
+        return query.order_by(sort_column.desc(), post_table.c.id.desc())
+    return query.order_by(sort_column.asc(), post_table.c.id.asc())
+
+
+async def fetch_feed_page(
+    limit: int,
+    skip: int,
+    cursor: Optional[str],
+    search: str,
+    search_mode: SearchMode,
+    sorting: PostSorting,
+) -> dict:
+    # The same for every user, liked_by_me is filled in per request
+    query, sort_column, descending = filtered_posts(None, search, search_mode, sorting)
+
+    if cursor:
+        key, post_id = decode_cursor(cursor, sorting.value)
+        query = after_cursor(query, sort_column, descending, key, post_id)
+    else:
+        query = query.offset(skip)
+    query = ordered(query, sort_column, descending)
+
+    posts = await replicas.fetch_all(query.limit(limit))
+
+    next_cursor = None
+    if len(posts) == limit:
+        last = posts[-1]
+        key = last[sort_column.name]
+        if isinstance(key, datetime):
+            key = key.isoformat()
+        next_cursor = encode_cursor(sorting.value, key, last.id)
+
+    body = posts_json(posts)
+    return {
+        "body": body.decode(),
+        "etag": f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+        "post_ids": [post.id for post in posts],
+        "next_cursor": next_cursor,
+    }
+
+
+async def liked_post_ids(user_id: int, post_ids: list[int]) -> set[int]:
+    # Served by the likes primary key (user_id, post_id)
+    if not post_ids:
+        return set()
+    query = sqlalchemy.select(like_table.c.post_id).where(
+        like_table.c.user_id == user_id, like_table.c.post_id.in_(post_ids)
+    )
+    return {row.post_id for row in await replicas.fetch_all(query)}
+
+
+def liked_etag(page_etag: str, liked: set[int]) -> str:
+    # The caller's liked_by_me flags are part of the body, so of its ETag too
+    liked_ids = ",".join(str(post_id) for post_id in sorted(liked))
+    digest = hashlib.blake2b(f"{page_etag}:{liked_ids}".encode(), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
 
 
 @router.get("/", response_model=list[PostOut])
@@ -46,34 +250,141 @@ async def get_posts(
     current_user: Annotated[UserOut, Depends(get_current_user)],
     limit: Annotated[int, Query(gt=0)] = 10,
     skip: Annotated[int, Query(ge=0)] = 0,
+    cursor: Optional[str] = None,
     search: str = "",
+    search_mode: SearchMode = SearchMode.substring,
     sorting: PostSorting = PostSorting.new,
+    if_none_match: Annotated[Optional[str], Header()] = None,
 ):
-    logger.info("Getting all posts")
-
-    if sorting == PostSorting.new:
-        query = (
-            select_post_and_likes.filter(post_table.c.title.contains(search))
-            .offset(skip)
-            .limit(limit)
-            .order_by(post_table.c.created_at.desc())
-        )
-    elif sorting == PostSorting.old:
-        query = (
-            select_post_and_likes.filter(post_table.c.title.contains(search))
-            .offset(skip)
-            .limit(limit)
-            .order_by(post_table.c.created_at.asc())
-        )
-    elif sorting == PostSorting.most_likes:
-        query = (
-            select_post_and_likes.filter(post_table.c.title.contains(search))
-            .offset(skip)
-            .limit(limit)
-            .order_by(sqlalchemy.desc("likes"))
+    read_logger.info("Getting all posts")
+
+    generation = await feed_cache.generation()
+    # Pages are shared by all users, only their liked_by_me flags are looked
+    # up for each request
+    key = json.dumps(
+        [
+            sorting.value,
+            search_mode.value,
+            search,
+            limit,
+            cursor or skip,
+        ]
+    )
+    page = await feed_cache.get(generation, key)
+    if page is None:
+        page = await fetch_feed_page(limit, skip, cursor, search, search_mode, sorting)
+        await feed_cache.set(generation, key, page)
+
+    liked = await liked_post_ids(current_user.id, page["post_ids"])
+    etag = page["etag"]
+    if liked:
+        etag = liked_etag(etag, liked)
+
+    headers = {"ETag": etag}
+    if page["next_cursor"]:
+        headers["X-Next-Cursor"] = page["next_cursor"]
+
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    body = page["body"]
+    if liked:
+        posts = posts_adapter.validate_json(body)
+        for post in posts:
+            post.liked_by_me = post.id in liked
+        body = posts_adapter.dump_json(posts)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/batch", response_model=list[PostOut])
+async def get_posts_batch(
+    current_user: Annotated[UserOut, Depends(get_current_user)],
+    ids: Annotated[list[int], Query(min_length=1, max_length=MAX_BATCH_SIZE)],
+):
+    logger.info("Getting %d posts by id", len(ids))
+
+    query = select_posts_for(current_user.id).where(post_table.c.id.in_(ids))
+    # On the primary, liked_by_me has to reflect the user's own recent likes
+    posts = {post.id: post for post in await database.fetch_all(query)}
+
+    # Requested order, without duplicates; missing posts are left out
+    return json_response(
+        posts_json(
+            [posts[post_id] for post_id in dict.fromkeys(ids) if post_id in posts]
         )
+    )
+
+
+async def export_chunks(query, export_format: ExportFormat) -> AsyncIterator[str]:
+    # Rows come from a server-side cursor and are flushed every
+    # EXPORT_CHUNK_ROWS, so memory use does not depend on the export size
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(PostOut.model_fields))
+    if export_format == ExportFormat.csv:
+        writer.writeheader()
+
+    rows = 0
+    async for row in replicas.iterate(query):
+        post = PostOut.model_validate(dict(row._mapping))
+        if export_format == ExportFormat.csv:
+            writer.writerow(post.model_dump(mode="json"))
+        else:
+            buffer.write(post.model_dump_json())
+            buffer.write("\n")
+
+        rows += 1
+        if rows % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+    logger.info("Exported %d posts", rows)
 
-    return await database.fetch_all(query)
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_posts(
+    current_user: Annotated[UserOut, Depends(get_current_user)],
+    search: str = "",
+    search_mode: SearchMode = SearchMode.substring,
+    sorting: PostSorting = PostSorting.old,
+    since: Optional[datetime] = None,
+    since_id: Optional[int] = None,
+    export_format: Annotated[ExportFormat, Query(alias="format")] = (
+        ExportFormat.ndjson
+    ),
+):
+    logger.info("Exporting posts")
+
+    query, sort_column, descending = filtered_posts(
+        current_user.id, search, search_mode, sorting
+    )
+    # created_at is the start of the inserting transaction, so a post can
+    # commit after newer ones were already exported. Posts younger than the
+    # settle window are held back until any such stragglers are visible.
+    settle_window = timedelta(seconds=config.EXPORT_SETTLE_SECONDS)
+    query = query.filter(
+        post_table.c.created_at
+        <= sqlalchemy.func.now() - sqlalchemy.cast(settle_window, sqlalchemy.Interval)
+    )
+    if since is not None:
+        # Watermark for incremental exports: pass the created_at and id of the
+        # last exported post to get only the ones after it. Posts created in
+        # one transaction share created_at, the id tells them apart.
+        if since_id is None:
+            query = query.filter(post_table.c.created_at > since)
+        else:
+            query = query.filter(
+                sqlalchemy.tuple_(post_table.c.created_at, post_table.c.id)
+                > sqlalchemy.tuple_(since, since_id)
+            )
+    query = ordered(query, sort_column, descending)
+
+    media_type = (
+        "text/csv" if export_format == ExportFormat.csv else "application/x-ndjson"
+    )
+    return StreamingResponse(export_chunks(query, export_format), media_type=media_type)
 
 
 @router.get("/{post_id}", response_model=PostOut)
@@ -81,9 +392,14 @@ async def get_post(
     post_id: int,
     current_user: Annotated[UserOut, Depends(get_current_user)],
 ):
-    await find_post(post_id)
-    query = select_post_and_likes.filter(post_table.c.id == post_id)
-    return await database.fetch_one(query)
+    read_logger.info("Getting post with id %s", post_id)
+
+    query = select_posts_for(current_user.id).filter(post_table.c.id == post_id)
+    post = await replicas.fetch_one(query)
+
+    if post is None:
+        raise post_not_found_exception
+    return json_response(post_json(post))
 
 
 @router.post("/", response_model=PostOut, status_code=status.HTTP_201_CREATED)
@@ -94,9 +410,36 @@ async def create_post(
     logger.info("Creating a post")
 
     data = {**post.model_dump(), "user_id": current_user.id}
-    query = post_table.insert().values(**data)
-    last_record_id = await database.execute(query)
-    return await find_post(last_record_id)
+    query = post_table.insert().values(**data).returning(*post_columns)
+    post = await database.fetch_one(query)
+    await feed_cache.invalidate()
+    await fanout_worker.submit(current_user.id, [post.id])
+    return json_response(post_json(post), status.HTTP_201_CREATED)
+
+
+@router.post("/bulk", response_model=list[PostOut], status_code=status.HTTP_201_CREATED)
+async def create_posts_bulk(
+    posts: Annotated[list[PostIn], Body(min_length=1, max_length=MAX_BATCH_SIZE)],
+    current_user: Annotated[UserOut, Depends(get_current_user)],
+):
+    logger.info("Creating %d posts", len(posts))
+
+    rows = [{**post.model_dump(), "user_id": current_user.id} for post in posts]
+    # A single multi-row INSERT, so either every post is created or none is
+    query = post_table.insert().values(rows).returning(*post_columns)
+    created = await database.fetch_all(query)
+    await feed_cache.invalidate()
+    await fanout_worker.submit(current_user.id, [post.id for post in created])
+    return json_response(posts_json(created), status.HTTP_201_CREATED)
+
+
+async def raise_for_missing_or_forbidden(post_id: int):
+    # Only reached when an ownership-guarded write matched no row
+    await find_post(post_id)
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Not authorized to perform requested action",
+    )
 
 
 @router.put("/{post_id}", response_model=PostOut, status_code=status.HTTP_201_CREATED)
@@ -105,21 +448,21 @@ async def update_post(
     updated_post: PostIn,
     current_user: Annotated[UserOut, Depends(get_current_user)],
 ):
-    logger.info(f"Updating post with id {post_id}")
-
-    post = await find_post(post_id)
-
-    if post.user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to perform requested action",
-        )
+    logger.info("Updating post with id %s", post_id)
 
     data = updated_post.model_dump()
-    query = post_table.update().where(post_table.c.id == post_id).values(**data)
+    query = (
+        post_table.update()
+        .where(post_table.c.id == post_id, post_table.c.user_id == current_user.id)
+        .values(**data)
+        .returning(*post_columns, liked_by(current_user.id))
+    )
+    post = await database.fetch_one(query)
 
-    await database.execute(query)
-    return await find_post(post_id)
+    if post is None:
+        await raise_for_missing_or_forbidden(post_id)
+    await feed_cache.invalidate()
+    return json_response(post_json(post), status.HTTP_201_CREATED)
 
 
 @router.delete("/{post_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -127,16 +470,16 @@ async def delete_post(
     post_id: int,
     current_user: Annotated[UserOut, Depends(get_current_user)],
 ):
-    logger.info(f"Deleting post with id {post_id}")
+    logger.info("Deleting post with id %s", post_id)
 
-    post = await find_post(post_id)
-
-    if post.user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to perform requested action",
-        )
+    query = (
+        post_table.delete()
+        .where(post_table.c.id == post_id, post_table.c.user_id == current_user.id)
+        .returning(post_table.c.id)
+    )
+    deleted = await database.fetch_one(query)
 
-    query = post_table.delete().where(post_table.c.id == post_id)
-    await database.execute(query)
+    if deleted is None:
+        await raise_for_missing_or_forbidden(post_id)
+    await feed_cache.invalidate()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -6,12 +6,19 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
 
 from app.database import database, user_table
-from app.models import Token, UserIn
+from app.hashing import password_pool
+from app.models import CurrentUser, RefreshTokenIn, Token, UserIn
 from app.security import (
     authenticate_user,
     create_access_token,
+    create_session,
+    get_current_user,
     get_password_hash,
     get_user,
+    oauth2_scheme,
+    revoke_access_token,
+    revoke_user_sessions,
+    rotate_session,
 )
 
 router = APIRouter(tags=["Users"])
@@ -37,9 +44,8 @@ async def register_user(user: UserIn):
             status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists"
         )
 
-    query = user_table.insert().values(
-        email=email, password=get_password_hash(user.password)
-    )
+    password = await password_pool.run(get_password_hash, user.password)
+    query = user_table.insert().values(email=email, password=password)
     await database.execute(query)
     return {"detail": "User created"}
 
@@ -58,6 +64,40 @@ async def login(user_credentials: Annotated[OAuth2PasswordRequestForm, Depends()
     logger.info("Logging in a user", extra={"email": email})
 
     user = await authenticate_user(email, user_credentials.password)
-    access_token = create_access_token(user.email)
+    session_id, refresh_token = await create_session(user.id)
+    access_token = create_access_token(user.email, user.id, session_id)
 
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+    }
+
+
+@router.post("/token/refresh", response_model=Token)
+async def refresh(body: RefreshTokenIn):
+    # Renewing a token costs one indexed update rather than a bcrypt check
+    logger.info("Refreshing an access token")
+
+    session, refresh_token = await rotate_session(body.refresh_token)
+    access_token = create_access_token(session.email, session.user_id, session.id.hex)
+
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+    }
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(token: Annotated[str, Depends(oauth2_scheme)]):
+    logger.info("Logging out a user")
+    await revoke_access_token(token)
+
+
+@router.post("/logout/all", status_code=status.HTTP_204_NO_CONTENT)
+async def logout_everywhere(
+    current_user: Annotated[CurrentUser, Depends(get_current_user)],
+):
+    logger.info("Logging out a user everywhere")
+    await revoke_user_sessions(current_user.id)
@@ -0,0 +1,138 @@
+import logging
+from functools import lru_cache
+from pathlib import Path
+
+import asyncpg
+import sqlalchemy
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app.config import config
+from app.database import create_extensions, database, metadata
+
+logger = logging.getLogger(__name__)
+
+# Serialises concurrent workers creating the schema on an empty database
+SCHEMA_LOCK_ID = 0x5C4E3A
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+
+
+@lru_cache()
+def alembic_heads() -> frozenset[str]:
+    return frozenset(alembic_script().get_heads())
+
+
+@lru_cache()
+def alembic_base() -> str:
+    return alembic_script().get_base()
+
+
+def alembic_script() -> ScriptDirectory:
+    alembic_config = Config(str(ALEMBIC_INI))
+    alembic_config.set_main_option(
+        "script_location", str(ALEMBIC_INI.parent / "alembic")
+    )
+    return ScriptDirectory.from_config(alembic_config)
+
+
+async def current_revisions() -> frozenset[str]:
+    try:
+        # A savepoint, so that a missing table does not abort a transaction
+        # the caller may be in
+        async with database.transaction():
+            rows = await database.fetch_all(
+                sqlalchemy.text("SELECT version_num FROM alembic_version")
+            )
+    except asyncpg.UndefinedTableError:
+        return frozenset()
+    return frozenset(row.version_num for row in rows)
+
+
+async def existing_tables() -> set[str]:
+    # The application's tables and Alembic's present in the current schema
+    names = [table.name for table in metadata.sorted_tables] + ["alembic_version"]
+    query = sqlalchemy.text(
+        "SELECT tablename FROM pg_tables "
+        "WHERE schemaname = current_schema() AND tablename = ANY(:names)"
+    ).bindparams(names=names)
+    return {row.tablename for row in await database.fetch_all(query)}
+
+
+# Alembic's own bookkeeping table, kept out of the application metadata
+alembic_version_table = sqlalchemy.Table(
+    "alembic_version",
+    sqlalchemy.MetaData(),
+    sqlalchemy.Column("version_num", sqlalchemy.String(32), primary_key=True),
+)
+
+
+async def create_schema(only_empty: bool = False) -> bool:
+    # Same result as metadata.create_all but sent through the application's
+    # pool, and without reflecting the catalog first. With only_empty, tables
+    # are only created in a database without any of them. Returns whether
+    # DDL was run.
+    async with database.transaction():
+        await database.execute(
+            sqlalchemy.select(sqlalchemy.func.pg_advisory_xact_lock(SCHEMA_LOCK_ID))
+        )
+        if only_empty:
+            existing = await existing_tables()
+            if "alembic_version" in existing and await current_revisions():
+                # Created and stamped by a worker that won the race
+                return False
+            existing.discard("alembic_version")
+            if existing:
+                # Built by metadata.create_all before the migrations existed;
+                # newer indexes would fail on columns it does not have
+                logger.error(
+                    "Tables %s exist but Alembic has never stamped this "
+                    "database; run `alembic stamp %s && alembic upgrade head`",
+                    ", ".join(sorted(existing)),
+                    alembic_base(),
+                )
+                return False
+
+        logger.info("Creating missing tables")
+        await database.execute(create_extensions)
+        for table in metadata.sorted_tables:
+            await database.execute(CreateTable(table, if_not_exists=True))
+            for index in table.indexes:
+                await database.execute(CreateIndex(index, if_not_exists=True))
+
+        # The tables just created are the head revision; stamping it keeps
+        # later boots and `alembic upgrade` from running the migrations again.
+        # Checked under the lock, a worker that lost the race finds it stamped.
+        await database.execute(CreateTable(alembic_version_table, if_not_exists=True))
+        if await database.fetch_one(alembic_version_table.select().limit(1)) is None:
+            for head in sorted(alembic_heads()):
+                await database.execute(
+                    alembic_version_table.insert().values(version_num=head)
+                )
+    return True
+
+
+async def prepare_schema(mode: str = config.DB_STARTUP_DDL) -> bool:
+    # "auto" only creates the schema in an empty database. A database at an
+    # older revision is left to `alembic upgrade`: creating the newer tables
+    # and indexes here would race the migrations, and fail on columns they
+    # have not added yet. "never" leaves the schema entirely to Alembic.
+    # Returns whether DDL was run.
+    if mode == "never":
+        return False
+    if mode == "auto":
+        revisions = await current_revisions()
+        if revisions == alembic_heads():
+            return False
+        if revisions:
+            logger.warning(
+                "Database is at revision %s, not the Alembic head %s; "
+                "skipping table creation until `alembic upgrade head` runs",
+                ", ".join(sorted(revisions)),
+                ", ".join(sorted(alembic_heads())),
+            )
+            return False
+        return await create_schema(only_empty=True)
+
+    return await create_schema()
@@ -1,14 +1,24 @@
 import datetime
+import hashlib
 import logging
-from typing import Annotated
+import secrets
+import time
+import uuid
+from typing import Annotated, Optional
 
+import sqlalchemy
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import ExpiredSignatureError, JWTError, jwt
 from passlib.context import CryptContext
 
+from app.cache import MemoryCache, create_cache
 from app.config import config
-from app.database import database, user_table
+from app.database import database, session_table, user_table
+from app.hashing import password_pool
+from app.models import CurrentUser
+from app.replicas import replicas
+from app.revocations import revocations
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +27,18 @@ ALGORITHM = config.ALGORITHM
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Users of tokens issued without a user id, by email. Nothing changes or
+# deletes users; entries are only refreshed after the TTL.
+user_cache = create_cache(
+    "users", config.USER_CACHE_SIZE, config.USER_CACHE_TTL_SECONDS
+)
+# Claims of tokens whose signature has been checked, by token digest, until
+# the token expires. Only this worker's own checks are worth caching.
+verified_tokens = MemoryCache(config.TOKEN_CACHE_SIZE)
+
+# Ended sessions deleted by each login
+SESSION_PURGE_BATCH_SIZE = 100
+
 credentials_exception = HTTPException(
     status_code=status.HTTP_401_UNAUTHORIZED,
     detail="Could not validate credentials",
@@ -28,13 +50,20 @@ def access_token_require_minutes() -> int:
     return config.ACCESS_TOKEN_EXPIRE_MINUTES
 
 
-def create_access_token(email: str) -> str:
+def create_access_token(
+    email: str, user_id: Optional[int] = None, session_id: Optional[str] = None
+) -> str:
     logger.info("Creating access token")
 
     expire = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
         minutes=access_token_require_minutes()
     )
-    jwt_data = {"sub": email, "exp": expire}
+    jwt_data = {"sub": email, "exp": expire, "jti": uuid.uuid4().hex}
+    # With the user id in the token, requests need no user lookup
+    if user_id is not None:
+        jwt_data["uid"] = user_id
+    if session_id is not None:
+        jwt_data["sid"] = session_id
     encoded_jwt = jwt.encode(jwt_data, key=SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -47,11 +76,14 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
-async def get_user(email: str):
+async def get_user(email: str, *, from_replica: bool = False):
     logger.info("Fetching user from database", extra={"email": email})
 
     query = user_table.select().where(user_table.c.email == email)
-    user = await database.fetch_one(query)
+    if from_replica:
+        user = await replicas.fetch_one(query)
+    else:
+        user = await database.fetch_one(query)
 
     if user:
         return user
@@ -60,31 +92,186 @@ async def get_user(email: str):
 async def authenticate_user(email: str, password: str):
     logger.info("Authenticating user")
 
-    user = await get_user(email)
+    user = await get_user(email, from_replica=True)
     if not user:
         raise credentials_exception
-    if not verify_password(password, user["password"]):
+    if not await password_pool.run(verify_password, password, user["password"]):
         raise credentials_exception
     return user
 
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
-    try:
-        payload = jwt.decode(token, key=SECRET_KEY, algorithms=[ALGORITHM])
-        email = payload.get("sub")
-        if email is None:
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def verified_claims(token: str) -> dict:
+    digest = token_digest(token)
+    claims = await verified_tokens.get(digest)
+    if claims is None:
+        try:
+            payload = jwt.decode(token, key=SECRET_KEY, algorithms=[ALGORITHM])
+        except ExpiredSignatureError as e:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token has expired",
+                headers={"WWW-Authenticate": "Bearer"},
+            ) from e
+        except JWTError as e:
+            raise credentials_exception from e
+        if payload.get("sub") is None or "exp" not in payload:
             raise credentials_exception
-    except ExpiredSignatureError as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired",
-            headers={"WWW-Authenticate": "Bearer"},
-        ) from e
-    except JWTError as e:
+
+        claims = {
+            "sub": payload["sub"],
+            "uid": payload.get("uid"),
+            "jti": payload.get("jti"),
+            "sid": payload.get("sid"),
+            "exp": payload["exp"],
+        }
+        await verified_tokens.set(digest, claims, ttl=claims["exp"] - time.time())
+
+    token_ids = [claims["jti"] or digest]
+    if claims["sid"] is not None:
+        token_ids.append(claims["sid"])
+    if revocations.is_revoked(token_ids):
+        raise credentials_exception
+    return claims
+
+
+async def revoke_access_token(token: str) -> None:
+    # Along with the session the token was issued for, if any. Tokens issued
+    # without a jti are revoked by their digest.
+    claims = await verified_claims(token)
+    await revocations.revoke([claims["jti"] or token_digest(token)], claims["exp"])
+    if claims["sid"] is not None:
+        await revoke_sessions(session_table.c.id == uuid.UUID(hex=claims["sid"]))
+
+
+def refresh_token_hash(secret: str) -> str:
+    # Refresh secrets are random, a plain digest is enough to not store them
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+
+def new_refresh_token(session_id: uuid.UUID) -> tuple[str, str]:
+    secret = secrets.token_urlsafe(32)
+    return f"{session_id.hex}.{secret}", refresh_token_hash(secret)
+
+
+async def create_session(user_id: int) -> tuple[str, str]:
+    # Returns the session id and its first refresh token
+    session_id = uuid.uuid4()
+    refresh_token, token_hash = new_refresh_token(session_id)
+    expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+        days=config.REFRESH_TOKEN_EXPIRE_DAYS
+    )
+    query = session_table.insert().values(
+        id=session_id,
+        user_id=user_id,
+        refresh_token_hash=token_hash,
+        expires_at=expires_at,
+    )
+    await database.execute(query)
+    await purge_sessions()
+    return session_id.hex, refresh_token
+
+
+async def purge_sessions() -> int:
+    # Revoking a session also expires it, so one index finds every ended
+    # session. Deleted in small batches to keep logins fast.
+    ended = (
+        sqlalchemy.select(session_table.c.id)
+        .where(session_table.c.expires_at <= sqlalchemy.func.now())
+        .limit(SESSION_PURGE_BATCH_SIZE)
+    )
+    query = (
+        session_table.delete()
+        .where(session_table.c.id.in_(ended))
+        .returning(session_table.c.id)
+    )
+    return len(await database.fetch_all(query))
+
+
+async def rotate_session(refresh_token: str):
+    # One indexed update swaps the refresh token for a new one, instead of a
+    # password check. Returns the session (id, user_id, email) and the new
+    # refresh token.
+    session_hex, _, secret = refresh_token.partition(".")
+    try:
+        session_id = uuid.UUID(hex=session_hex)
+    except ValueError as e:
         raise credentials_exception from e
 
-    user = await get_user(email)
+    token_hash = refresh_token_hash(secret)
+    new_token, new_hash = new_refresh_token(session_id)
+    query = (
+        session_table.update()
+        .where(
+            session_table.c.id == session_id,
+            session_table.c.refresh_token_hash == token_hash,
+            session_table.c.revoked_at.is_(None),
+            session_table.c.expires_at > sqlalchemy.func.now(),
+            user_table.c.id == session_table.c.user_id,
+        )
+        .values(
+            previous_refresh_token_hash=session_table.c.refresh_token_hash,
+            refresh_token_hash=new_hash,
+        )
+        .returning(session_table.c.id, session_table.c.user_id, user_table.c.email)
+    )
+    session = await database.fetch_one(query)
+    if session is not None:
+        return session, new_token
+
+    # The token rotated out last means it has leaked or is being replayed,
+    # so the session ends. Any other wrong secret is only rejected, or
+    # anyone who knows the session id could end it.
+    reused = session_table.c.previous_refresh_token_hash == token_hash
+    if await revoke_sessions(session_table.c.id == session_id, reused):
+        logger.warning("Refresh token reused, revoking its session")
+    raise credentials_exception
+
+
+async def revoke_sessions(*conditions) -> int:
+    # Ends the live sessions matching conditions, and the access tokens
+    # issued for them
+    query = (
+        session_table.update()
+        .where(
+            *conditions,
+            session_table.c.revoked_at.is_(None),
+            session_table.c.expires_at > sqlalchemy.func.now(),
+        )
+        .values(revoked_at=sqlalchemy.func.now(), expires_at=sqlalchemy.func.now())
+        .returning(session_table.c.id)
+    )
+    revoked = await database.fetch_all(query)
+    await revocations.revoke(
+        [session.id.hex for session in revoked],
+        time.time() + access_token_require_minutes() * 60,
+    )
+    return len(revoked)
+
+
+async def revoke_user_sessions(user_id: int) -> int:
+    logger.info("Revoking all sessions of a user")
+    return await revoke_sessions(session_table.c.user_id == user_id)
+
+
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+    claims = await verified_claims(token)
+    email = claims["sub"]
+    if claims["uid"] is not None:
+        return CurrentUser(id=claims["uid"], email=email)
+
+    # Tokens issued without the user id
+    cached_user = await user_cache.get(email)
+    if cached_user is not None:
+        return CurrentUser.model_validate(cached_user)
+
+    user = await get_user(email, from_replica=True)
     if user is None:
         raise credentials_exception
 
-    return user
+    current_user = CurrentUser(id=user["id"], email=user["email"])
+    await user_cache.set(email, current_user.model_dump())
+    return current_user
@@ -1,7 +1,9 @@
 import os
-from typing import AsyncGenerator, Generator
+from contextlib import contextmanager
+from typing import AsyncGenerator, Callable, Generator
 
 import pytest
+from databases.backends.postgres import PostgresConnection
 from fastapi.testclient import TestClient
 from httpx import ASGITransport, AsyncClient
 
@@ -9,6 +11,9 @@ os.environ["ENV_STATE"] = "test"
 
 from app.database import database, user_table
 from app.main import app
+from app.revocations import revocations
+from app.routes.post import feed_cache
+from app.security import user_cache, verified_tokens
 from app.tests.routes.test_post import create_post
 
 
@@ -29,6 +34,55 @@ async def db() -> AsyncGenerator:
     await database.disconnect()
 
 
+@pytest.fixture(autouse=True)
+async def clear_caches() -> AsyncGenerator:
+    yield
+    await user_cache.clear()
+    await feed_cache.clear()
+    await verified_tokens.clear()
+    revocations.clear()
+
+
+@pytest.fixture()
+def record_queries(mocker) -> Callable:
+    # Every statement sent to Postgres is compiled exactly once, so recording
+    # compilations records round trips (transaction control is not recorded).
+    @contextmanager
+    def record_queries() -> Generator[list[tuple[str, list]], None, None]:
+        queries: list[tuple[str, list]] = []
+        compile_query = PostgresConnection._compile
+
+        def record(self, query):
+            compiled = compile_query(self, query)
+            queries.append((compiled[0], compiled[1]))
+            return compiled
+
+        patcher = mocker.patch.object(PostgresConnection, "_compile", record)
+        try:
+            yield queries
+        finally:
+            mocker.stop(patcher)
+
+    return record_queries
+
+
+@pytest.fixture()
+def assert_num_queries(record_queries: Callable) -> Callable:
+    @contextmanager
+    def assert_num_queries(expected: int) -> Generator[list[str], None, None]:
+        statements: list[str] = []
+        with record_queries() as queries:
+            yield statements
+            statements.extend(sql for sql, _ in queries)
+
+        assert len(statements) == expected, (
+            f"Expected {expected} queries, got {len(statements)}:\n"
+            + "\n".join(statements)
+        )
+
+    return assert_num_queries
+
+
 @pytest.fixture()
 async def async_client(client) -> AsyncGenerator:
     async with AsyncClient(
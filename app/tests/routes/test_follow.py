@@ -0,0 +1,171 @@
+import pytest
+from httpx import AsyncClient
+
+from app import security
+from app.config import config
+from app.database import database, timeline_table, user_table
+from app.tests.routes.test_post import create_post, create_user
+from app.timeline import FanoutWorker
+
+
+@pytest.fixture()
+async def author(async_client: AsyncClient) -> dict:
+    await create_user(async_client, email="author@gmail.com", password="test_password")
+    query = user_table.select().where(user_table.c.email == "author@gmail.com")
+    user = await database.fetch_one(query)
+    return {"id": user.id, "token": security.create_access_token(user.email)}
+
+
+async def follow(async_client: AsyncClient, token: str, user_id: int):
+    return await async_client.put(
+        f"/follow/{user_id}", headers={"Authorization": f"Bearer {token}"}
+    )
+
+
+async def timeline(async_client: AsyncClient, token: str, **params) -> list[int]:
+    response = await async_client.get(
+        "/timeline", params=params, headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    return [post["id"] for post in response.json()]
+
+
+async def follower_count(user_id: int) -> int:
+    query = user_table.select().where(user_table.c.id == user_id)
+    return (await database.fetch_one(query)).follower_count
+
+
+@pytest.mark.anyio
+async def test_follow_user(
+    async_client: AsyncClient, logged_in_token: str, author: dict
+):
+    older = await create_post(async_client, author["token"], "Older", "Content", True)
+
+    for _ in range(2):
+        response = await follow(async_client, logged_in_token, author["id"])
+        assert response.status_code == 200
+        assert response.json() == {"detail": "User followed"}
+
+    newer = await create_post(async_client, author["token"], "Newer", "Content", True)
+    own = await create_post(async_client, logged_in_token, "Own", "Content", True)
+
+    assert await follower_count(author["id"]) == 1
+    assert await timeline(async_client, logged_in_token) == [
+        own["id"],
+        newer["id"],
+        older["id"],
+    ]
+
+
+@pytest.mark.anyio
+async def test_follow_self(
+    async_client: AsyncClient, logged_in_token: str, registered_user: dict
+):
+    response = await follow(async_client, logged_in_token, registered_user["id"])
+
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_follow_user_not_found(async_client: AsyncClient, logged_in_token: str):
+    response = await follow(async_client, logged_in_token, 99999)
+
+    assert response.status_code == 404
+    assert response.json() == {"detail": "User not found"}
+
+
+@pytest.mark.anyio
+async def test_unfollow_user(
+    async_client: AsyncClient, logged_in_token: str, author: dict
+):
+    await create_post(async_client, author["token"], "Post", "Content", True)
+    await follow(async_client, logged_in_token, author["id"])
+
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    for _ in range(2):
+        response = await async_client.delete(f"/follow/{author['id']}", headers=headers)
+        assert response.status_code == 204
+
+    assert await follower_count(author["id"]) == 0
+    assert await timeline(async_client, logged_in_token) == []
+
+
+@pytest.mark.anyio
+async def test_unfollow_user_not_found(async_client: AsyncClient, logged_in_token: str):
+    response = await async_client.delete(
+        "/follow/99999", headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_timeline_cursor_pagination(
+    async_client: AsyncClient, logged_in_token: str, author: dict
+):
+    await follow(async_client, logged_in_token, author["id"])
+    posts = [
+        await create_post(async_client, author["token"], f"Post {i}", "Content", True)
+        for i in range(5)
+    ]
+
+    seen = []
+    params = {"limit": 2}
+    while True:
+        response = await async_client.get(
+            "/timeline",
+            params=params,
+            headers={"Authorization": f"Bearer {logged_in_token}"},
+        )
+        seen.extend(post["id"] for post in response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert seen == [post["id"] for post in reversed(posts)]
+
+
+@pytest.mark.anyio
+async def test_timeline_merges_authors_not_fanned_out(
+    async_client: AsyncClient, logged_in_token: str, author: dict, mocker
+):
+    mocker.patch.object(config, "TIMELINE_FANOUT_MAX_FOLLOWERS", 1)
+    await follow(async_client, logged_in_token, author["id"])
+    before = await create_post(async_client, logged_in_token, "Own", "Content", True)
+    post = await create_post(async_client, author["token"], "Popular", "Content", True)
+
+    entries = await database.fetch_all(
+        timeline_table.select().where(timeline_table.c.post_id == post["id"])
+    )
+    assert entries == []
+    assert await timeline(async_client, logged_in_token) == [post["id"], before["id"]]
+    assert await timeline(async_client, logged_in_token, limit=1) == [post["id"]]
+
+
+@pytest.mark.anyio
+async def test_fanout_worker(
+    async_client: AsyncClient, logged_in_token: str, author: dict, mocker
+):
+    worker = FanoutWorker(max_queue=1)
+    mocker.patch("app.routes.post.fanout_worker", worker)
+    await follow(async_client, logged_in_token, author["id"])
+
+    worker.start()
+    posts = [
+        await create_post(async_client, author["token"], f"Post {i}", "Content", True)
+        for i in range(3)
+    ]
+    await worker.stop()
+
+    assert worker.stats()["fanned_out"] == 3
+    assert worker.stats()["failed"] == 0
+    assert await timeline(async_client, logged_in_token) == [
+        post["id"] for post in reversed(posts)
+    ]
+
+
+@pytest.mark.anyio
+async def test_timeline_unauthorized(async_client: AsyncClient):
+    response = await async_client.get("/timeline")
+
+    assert response.status_code == 401
@@ -57,3 +57,137 @@ async def test_like_post_unauthorized(
 
     assert response.status_code == 401
     assert response.json() == {"detail": "Not authenticated"}
+
+
+@pytest.mark.anyio
+async def test_like_post_updates_like_count(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    created_post: dict,
+):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+
+    await async_client.post(f"/like/{created_post['id']}", headers=headers)
+    response = await async_client.get(f"/posts/{created_post['id']}", headers=headers)
+    assert response.json()["likes"] == 1
+
+    await async_client.post(f"/like/{created_post['id']}", headers=headers)
+    response = await async_client.get(f"/posts/{created_post['id']}", headers=headers)
+    assert response.json()["likes"] == 0
+
+
+@pytest.mark.anyio
+async def test_like_post_single_query(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    created_post: dict,
+    assert_num_queries,
+):
+    with assert_num_queries(1):
+        response = await async_client.post(
+            f"/like/{created_post['id']}",
+            headers={"Authorization": f"Bearer {logged_in_token}"},
+        )
+    assert response.status_code == 201
+
+
+@pytest.mark.anyio
+async def test_put_like_idempotent(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    created_post: dict,
+):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+
+    for _ in range(2):
+        response = await async_client.put(
+            f"/like/{created_post['id']}", headers=headers
+        )
+        assert response.status_code == 200
+        assert response.json() == {"detail": "Post liked"}
+
+    response = await async_client.get(f"/posts/{created_post['id']}", headers=headers)
+    assert response.json()["likes"] == 1
+
+
+@pytest.mark.anyio
+async def test_delete_like_idempotent(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    liked_post: dict,
+):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+
+    for _ in range(2):
+        response = await async_client.delete(
+            f"/like/{liked_post['id']}", headers=headers
+        )
+        assert response.status_code == 204
+
+    response = await async_client.get(f"/posts/{liked_post['id']}", headers=headers)
+    assert response.json()["likes"] == 0
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("method", ["PUT", "DELETE"])
+async def test_idempotent_like_post_not_found(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    method: str,
+):
+    response = await async_client.request(
+        method,
+        "/like/99999",
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Post not found"}
+
+
+@pytest.mark.anyio
+async def test_toggle_likes_bulk(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    liked_post: dict,
+    assert_num_queries,
+):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    other_post = (
+        await async_client.post(
+            "/posts/", json={"title": "Other", "content": "Content"}, headers=headers
+        )
+    ).json()
+    post_ids = [liked_post["id"], other_post["id"], 99999, other_post["id"]]
+
+    with assert_num_queries(1):
+        response = await async_client.post(
+            "/like/bulk", json={"post_ids": post_ids}, headers=headers
+        )
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"post_id": liked_post["id"], "status": "unliked"},
+        {"post_id": other_post["id"], "status": "liked"},
+        {"post_id": 99999, "status": "not_found"},
+    ]
+
+    response = await async_client.get(
+        "/posts/batch",
+        params={"ids": [liked_post["id"], other_post["id"]]},
+        headers=headers,
+    )
+    assert [post["likes"] for post in response.json()] == [0, 1]
+
+
+@pytest.mark.anyio
+async def test_toggle_likes_bulk_too_many(
+    async_client: AsyncClient, logged_in_token: str
+):
+    response = await async_client.post(
+        "/like/bulk",
+        json={"post_ids": list(range(1, 102))},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 422
@@ -1,8 +1,18 @@
+import csv
+import io
+import json
+
 import pytest
+from fastapi.encoders import jsonable_encoder
 from httpx import AsyncClient
 
 from app import security
+from app.config import config
+from app.database import database
+from app.main import app
 from app.models import PostOut
+from app.routes.post import post_json, posts_adapter, posts_json, select_posts_for
+from app.timeline import fanout_worker
 
 
 async def create_post(
@@ -83,6 +93,28 @@ async def test_create_post(
     assert post_created.user_id == registered_user["id"]
 
 
+@pytest.mark.anyio
+async def test_create_post_single_query(
+    async_client: AsyncClient,
+    created_post: dict,
+    logged_in_token: str,
+    assert_num_queries,
+    mocker,
+):
+    # The timeline fan-out is handed to the background worker
+    submit = mocker.patch.object(fanout_worker, "submit")
+
+    with assert_num_queries(1):
+        response = await async_client.post(
+            "/posts/",
+            json={"title": "Test title", "content": "Test content"},
+            headers={"Authorization": f"Bearer {logged_in_token}"},
+        )
+    assert response.status_code == 201
+    assert response.json()["likes"] == 0
+    submit.assert_awaited_once_with(created_post["user_id"], [response.json()["id"]])
+
+
 @pytest.mark.anyio
 async def test_create_post_expired_token(
     async_client: AsyncClient,
@@ -142,6 +174,155 @@ async def test_get_all_posts(
     assert created_post.items() <= response.json()[0].items()
 
 
+@pytest.mark.anyio
+async def test_get_all_posts_cached(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    created_post: dict,
+    assert_num_queries,
+):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    first = await async_client.get("/posts/", headers=headers)
+
+    # Only the caller's likes on the cached page
+    with assert_num_queries(1) as queries:
+        second = await async_client.get("/posts/", headers=headers)
+
+    assert "FROM likes" in queries[0]
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_cache_shared_between_users(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    created_post: dict,
+    assert_num_queries,
+):
+    await like_post(async_client, logged_in_token, created_post["id"])
+    await create_user(async_client, email="user2@gmail.com", password="test_password")
+    other_token = security.create_access_token(email="user2@gmail.com")
+    # Caches the second user, the page is the only thing left to share
+    await security.get_current_user(other_token)
+    first = await async_client.get(
+        "/posts/", headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+
+    with assert_num_queries(1):
+        second = await async_client.get(
+            "/posts/", headers={"Authorization": f"Bearer {other_token}"}
+        )
+
+    assert first.json()[0]["liked_by_me"] is True
+    assert second.json()[0]["liked_by_me"] is False
+    assert second.json()[0]["likes"] == 1
+    assert second.headers["ETag"] != first.headers["ETag"]
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_not_modified(
+    async_client: AsyncClient, logged_in_token: str, created_post: dict
+):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    etag = (await async_client.get("/posts/", headers=headers)).headers["ETag"]
+
+    response = await async_client.get(
+        "/posts/", headers={**headers, "If-None-Match": f"W/{etag}"}
+    )
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_cached_body_reused(
+    async_client: AsyncClient, logged_in_token: str, created_post: dict, mocker
+):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    first = await async_client.get("/posts/", headers=headers)
+    dump_json = mocker.spy(posts_adapter, "dump_json")
+
+    # Without likes on the page the cached body is sent as it is
+    second = await async_client.get("/posts/", headers=headers)
+
+    assert second.content == first.content
+    assert dump_json.call_count == 0
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_not_modified_with_likes(
+    async_client: AsyncClient, logged_in_token: str, created_post: dict, mocker
+):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    await like_post(async_client, logged_in_token, created_post["id"])
+    etag = (await async_client.get("/posts/", headers=headers)).headers["ETag"]
+    dump_json = mocker.spy(posts_adapter, "dump_json")
+
+    response = await async_client.get(
+        "/posts/", headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert dump_json.call_count == 0
+
+    # The caller's own flags are part of the ETag
+    await async_client.delete(f"/like/{created_post['id']}", headers=headers)
+    response = await async_client.get(
+        "/posts/", headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()[0]["liked_by_me"] is False
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("write", ["create", "update", "delete", "like"])
+async def test_get_all_posts_invalidated_by_writes(
+    async_client: AsyncClient, logged_in_token: str, created_post: dict, write: str
+):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    before = await async_client.get("/posts/", headers=headers)
+
+    post_url = f"/posts/{created_post['id']}"
+    if write == "create":
+        await create_post(async_client, logged_in_token, "Another", "Content", True)
+    elif write == "update":
+        await async_client.put(
+            post_url, json={"title": "Edited", "content": "Edited"}, headers=headers
+        )
+    elif write == "delete":
+        await async_client.delete(post_url, headers=headers)
+    else:
+        await like_post(async_client, logged_in_token, created_post["id"])
+
+    after = await async_client.get(
+        "/posts/", headers={**headers, "If-None-Match": before.headers["ETag"]}
+    )
+    assert after.status_code == 200
+    assert after.json() != before.json()
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_liked_by_me(
+    async_client: AsyncClient, logged_in_token: str, created_post: dict
+):
+    await like_post(async_client, logged_in_token, created_post["id"])
+    await create_user(async_client, email="user2@gmail.com", password="test_password")
+    other_token = security.create_access_token(email="user2@gmail.com")
+
+    for token, liked in ((logged_in_token, True), (other_token, False)):
+        headers = {"Authorization": f"Bearer {token}"}
+        feed = (await async_client.get("/posts/", headers=headers)).json()
+        post = (
+            await async_client.get(f"/posts/{created_post['id']}", headers=headers)
+        ).json()
+
+        assert feed[0]["liked_by_me"] is liked
+        assert post["liked_by_me"] is liked
+        assert feed[0]["likes"] == post["likes"] == 1
+
+
 @pytest.mark.anyio
 async def test_get_all_posts_sort_likes(
     async_client: AsyncClient, logged_in_token: str
@@ -166,6 +347,190 @@ async def test_get_all_posts_sort_likes(
     assert [post["id"] for post in data] == [post_2["id"], post_1["id"]]
 
 
+@pytest.mark.anyio
+@pytest.mark.parametrize("sorting", ["new", "old", "most_likes"])
+async def test_get_all_posts_cursor_pagination(
+    async_client: AsyncClient, logged_in_token: str, sorting: str
+):
+    posts = [
+        await create_post(async_client, logged_in_token, f"Post {i}", "Content", True)
+        for i in range(5)
+    ]
+    await like_post(async_client, logged_in_token, posts[2]["id"])
+
+    seen = []
+    params = {"sorting": sorting, "limit": 2}
+    while True:
+        response = await async_client.get(
+            "/posts/",
+            params=params,
+            headers={"Authorization": f"Bearer {logged_in_token}"},
+        )
+        assert response.status_code == 200
+        seen.extend(post["id"] for post in response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    response = await async_client.get(
+        "/posts/",
+        params={"sorting": sorting, "limit": 10},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert seen == [post["id"] for post in response.json()]
+    assert sorted(seen) == sorted(post["id"] for post in posts)
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_skip(async_client: AsyncClient, logged_in_token: str):
+    for i in range(3):
+        await create_post(async_client, logged_in_token, f"Post {i}", "Content", True)
+
+    response = await async_client.get(
+        "/posts/",
+        params={"sorting": "old", "skip": 1},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 200
+    assert [post["title"] for post in response.json()] == ["Post 1", "Post 2"]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "cursor",
+    ["garbage", "eyJzIjoibmV3In0.c2lnbmF0dXJl", "é.é"],
+)
+async def test_get_all_posts_invalid_cursor(
+    async_client: AsyncClient, logged_in_token: str, cursor: str
+):
+    response = await async_client.get(
+        "/posts/",
+        params={"cursor": cursor},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_cursor_wrong_sorting(
+    async_client: AsyncClient, logged_in_token: str
+):
+    for i in range(2):
+        await create_post(async_client, logged_in_token, f"Post {i}", "Content", True)
+
+    response = await async_client.get(
+        "/posts/",
+        params={"limit": 1},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    response = await async_client.get(
+        "/posts/",
+        params={"sorting": "old", "cursor": response.headers["X-Next-Cursor"]},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_search_substring(
+    async_client: AsyncClient, logged_in_token: str
+):
+    post = await create_post(
+        async_client, logged_in_token, "Pizza night", "Content", True
+    )
+    await create_post(async_client, logged_in_token, "Tallest towers", "Pizza", True)
+
+    response = await async_client.get(
+        "/posts/",
+        params={"search": "zza ni"},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 200
+    assert [p["id"] for p in response.json()] == [post["id"]]
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_empty_search_skips_filter(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    created_post: dict,
+    assert_num_queries,
+):
+    # The page and the caller's likes on it
+    with assert_num_queries(2) as queries:
+        await async_client.get(
+            "/posts/",
+            params={"search": ""},
+            headers={"Authorization": f"Bearer {logged_in_token}"},
+        )
+    assert "LIKE" not in queries[0]
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_search_fulltext(
+    async_client: AsyncClient, logged_in_token: str
+):
+    title_match = await create_post(
+        async_client, logged_in_token, "Running shoes", "Reviews", True
+    )
+    content_match = await create_post(
+        async_client, logged_in_token, "Weekend", "I ran and kept running", True
+    )
+    await create_post(async_client, logged_in_token, "Cooking", "Pasta", True)
+
+    response = await async_client.get(
+        "/posts/",
+        params={"search": "runs", "search_mode": "fulltext", "sorting": "relevance"},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 200
+    assert [p["id"] for p in response.json()] == [
+        title_match["id"],
+        content_match["id"],
+    ]
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_search_fulltext_cursor(
+    async_client: AsyncClient, logged_in_token: str
+):
+    for i in range(3):
+        await create_post(async_client, logged_in_token, f"Garden {i}", "Flowers", True)
+
+    seen = []
+    params = {
+        "search": "flower",
+        "search_mode": "fulltext",
+        "sorting": "relevance",
+        "limit": 2,
+    }
+    while True:
+        response = await async_client.get(
+            "/posts/",
+            params=params,
+            headers={"Authorization": f"Bearer {logged_in_token}"},
+        )
+        seen.extend(post["id"] for post in response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert len(seen) == len(set(seen)) == 3
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_relevance_requires_fulltext(
+    async_client: AsyncClient, logged_in_token: str
+):
+    response = await async_client.get(
+        "/posts/",
+        params={"search": "pizza", "sorting": "relevance"},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    assert response.status_code == 422
+
+
 @pytest.mark.anyio
 async def test_get_all_post_wrong_sorting(
     async_client: AsyncClient, logged_in_token: str
@@ -197,6 +562,248 @@ async def test_get_one_post(
     assert created_post.items() <= response.json().items()
 
 
+@pytest.mark.anyio
+async def test_get_one_post_single_query(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    created_post: dict,
+    assert_num_queries,
+):
+    with assert_num_queries(1):
+        response = await async_client.get(
+            f"/posts/{created_post['id']}",
+            headers={"Authorization": f"Bearer {logged_in_token}"},
+        )
+    assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_get_posts_batch(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    created_post: dict,
+    assert_num_queries,
+):
+    other_post = await create_post(
+        async_client, logged_in_token, "Other", "Content", True
+    )
+    await like_post(async_client, logged_in_token, created_post["id"])
+    ids = [other_post["id"], 99999, created_post["id"], other_post["id"]]
+
+    with assert_num_queries(1):
+        response = await async_client.get(
+            "/posts/batch",
+            params={"ids": ids},
+            headers={"Authorization": f"Bearer {logged_in_token}"},
+        )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [post["id"] for post in data] == [other_post["id"], created_post["id"]]
+    assert [post["liked_by_me"] for post in data] == [False, True]
+    assert [post["likes"] for post in data] == [0, 1]
+
+
+@pytest.mark.anyio
+async def test_get_posts_batch_too_many(
+    async_client: AsyncClient, logged_in_token: str
+):
+    response = await async_client.get(
+        "/posts/batch",
+        params={"ids": list(range(1, 102))},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_create_posts_bulk(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    created_post: dict,
+    assert_num_queries,
+    mocker,
+):
+    submit = mocker.patch.object(fanout_worker, "submit")
+    posts = [{"title": f"Bulk {i}", "content": "Content"} for i in range(3)]
+
+    with assert_num_queries(1):
+        response = await async_client.post(
+            "/posts/bulk",
+            json=posts,
+            headers={"Authorization": f"Bearer {logged_in_token}"},
+        )
+
+    assert response.status_code == 201
+    assert [post["title"] for post in response.json()] == ["Bulk 0", "Bulk 1", "Bulk 2"]
+    submit.assert_awaited_once_with(
+        created_post["user_id"], [post["id"] for post in response.json()]
+    )
+
+
+@pytest.mark.anyio
+async def test_create_posts_bulk_is_atomic(
+    async_client: AsyncClient, logged_in_token: str
+):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    response = await async_client.post(
+        "/posts/bulk",
+        json=[{"title": "Valid", "content": "Content"}, {"title": "", "content": ""}],
+        headers=headers,
+    )
+
+    assert response.status_code == 422
+    assert (await async_client.get("/posts/", headers=headers)).json() == []
+
+
+@pytest.mark.anyio
+async def test_posts_json_matches_response_model(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    registered_user: dict,
+    created_post: dict,
+):
+    await like_post(async_client, logged_in_token, created_post["id"])
+    posts = await database.fetch_all(select_posts_for(registered_user["id"]))
+
+    # What FastAPI's response_model encoding produced for the same rows
+    expected = [
+        jsonable_encoder(PostOut.model_validate(post, from_attributes=True))
+        for post in posts
+    ]
+
+    assert json.loads(posts_json(posts)) == expected
+    assert json.loads(post_json(posts[0])) == expected[0]
+    assert expected[0]["likes"] == 1
+    assert expected[0]["liked_by_me"] is True
+
+
+def test_post_routes_keep_response_schema():
+    paths = app.openapi()["paths"]
+    post_schema = {"$ref": "#/components/schemas/PostOut"}
+
+    for path, method, status_code in (
+        ("/posts/", "get", "200"),
+        ("/posts/batch", "get", "200"),
+        ("/posts/bulk", "post", "201"),
+    ):
+        content = paths[path][method]["responses"][status_code]["content"]
+        assert content["application/json"]["schema"]["items"] == post_schema
+    for path, method, status_code in (
+        ("/posts/{post_id}", "get", "200"),
+        ("/posts/", "post", "201"),
+        ("/posts/{post_id}", "put", "201"),
+    ):
+        content = paths[path][method]["responses"][status_code]["content"]
+        assert content["application/json"]["schema"] == post_schema
+
+
+@pytest.fixture()
+def settled_exports(mocker) -> None:
+    # Posts written by a test share the rolled back transaction's created_at,
+    # which is never older than the settle window
+    mocker.patch.object(config, "EXPORT_SETTLE_SECONDS", 0)
+
+
+@pytest.mark.anyio
+async def test_export_posts_ndjson(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    created_post: dict,
+    settled_exports: None,
+):
+    other_post = await create_post(
+        async_client, logged_in_token, "Other", "Content", True
+    )
+    await like_post(async_client, logged_in_token, other_post["id"])
+
+    response = await async_client.get(
+        "/posts/export", headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [
+        created_post["id"],
+        other_post["id"],
+    ]
+    assert json.loads(lines[1])["likes"] == 1
+    assert json.loads(lines[1])["liked_by_me"] is True
+
+
+@pytest.mark.anyio
+async def test_export_posts_csv(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    created_post: dict,
+    settled_exports: None,
+):
+    response = await async_client.get(
+        "/posts/export",
+        params={"format": "csv"},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert list(rows[0]) == list(PostOut.model_fields)
+    assert [row["id"] for row in rows] == [str(created_post["id"])]
+    assert rows[0]["title"] == created_post["title"]
+
+
+@pytest.mark.anyio
+async def test_export_posts_search_and_since(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    created_post: dict,
+    settled_exports: None,
+):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    newer = await create_post(async_client, logged_in_token, "Newer", "Content", True)
+    newest = await create_post(async_client, logged_in_token, "Newest", "Content", True)
+    await create_post(async_client, logged_in_token, "Unrelated", "Content", True)
+
+    async def exported_ids(**params) -> list[int]:
+        response = await async_client.get(
+            "/posts/export", params={"search": "Newe", **params}, headers=headers
+        )
+        return [json.loads(line)["id"] for line in response.text.splitlines()]
+
+    assert await exported_ids(since="2000-01-01T00:00:00Z") == [
+        newer["id"],
+        newest["id"],
+    ]
+    # Posts created in one transaction share created_at, only the id of the
+    # last exported post tells the remaining ones apart
+    assert await exported_ids(since=newer["created_at"]) == []
+    assert await exported_ids(since=newer["created_at"], since_id=newer["id"]) == [
+        newest["id"]
+    ]
+    assert await exported_ids(since=newest["created_at"], since_id=newest["id"]) == []
+
+
+@pytest.mark.anyio
+async def test_export_posts_holds_back_unsettled_posts(
+    async_client: AsyncClient, logged_in_token: str, created_post: dict
+):
+    response = await async_client.get(
+        "/posts/export", headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+
+    assert response.status_code == 200
+    assert response.text == ""
+
+
+@pytest.mark.anyio
+async def test_export_posts_unauthorized(async_client: AsyncClient):
+    response = await async_client.get("/posts/export")
+
+    assert response.status_code == 401
+
+
 @pytest.mark.anyio
 async def test_get_one_post_not_found(async_client: AsyncClient, logged_in_token: str):
     response = await async_client.get(
@@ -291,6 +898,23 @@ async def test_update_post(
     assert response.json()["published"] is False
 
 
+@pytest.mark.anyio
+async def test_update_post_single_query(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    created_post: dict,
+    assert_num_queries,
+):
+    with assert_num_queries(1):
+        response = await async_client.put(
+            f"/posts/{created_post['id']}",
+            json={"title": "Updated title", "content": "Updated content"},
+            headers={"Authorization": f"Bearer {logged_in_token}"},
+        )
+    assert response.status_code == 201
+    assert response.json()["title"] == "Updated title"
+
+
 @pytest.mark.anyio
 async def test_update_post_not_found(async_client: AsyncClient, logged_in_token: str):
     response = await async_client.put(
@@ -1,6 +1,8 @@
 import pytest
 from httpx import AsyncClient
 
+from app import security
+
 
 async def register_user(async_client: AsyncClient, email: str, password: str):
     return await async_client.post(
@@ -101,3 +103,83 @@ async def test_login_user_invalid_credentials(
         },
     )
     assert response.status_code == status_code
+
+
+@pytest.mark.anyio
+async def test_logout(async_client: AsyncClient, logged_in_token: str):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+
+    response = await async_client.post("/logout", headers=headers)
+    assert response.status_code == 204
+
+    response = await async_client.post("/logout", headers=headers)
+    assert response.status_code == 401
+
+
+async def login(async_client: AsyncClient, user: dict) -> dict:
+    response = await async_client.post(
+        "/token", data={"username": user["email"], "password": user["password"]}
+    )
+    return response.json()
+
+
+@pytest.mark.anyio
+async def test_refresh_token(async_client: AsyncClient, registered_user: dict, mocker):
+    tokens = await login(async_client, registered_user)
+    verify_password = mocker.spy(security, "verify_password")
+
+    response = await async_client.post(
+        "/token/refresh", json={"refresh_token": tokens["refresh_token"]}
+    )
+
+    assert response.status_code == 200
+    refreshed = response.json()
+    assert refreshed["refresh_token"] != tokens["refresh_token"]
+    assert verify_password.call_count == 0
+
+    response = await async_client.post(
+        "/posts/",
+        json={"title": "Refreshed", "content": "Content"},
+        headers={"Authorization": f"Bearer {refreshed['access_token']}"},
+    )
+    assert response.status_code == 201
+
+
+@pytest.mark.anyio
+async def test_refresh_token_reuse(async_client: AsyncClient, registered_user: dict):
+    tokens = await login(async_client, registered_user)
+    refreshed = (
+        await async_client.post(
+            "/token/refresh", json={"refresh_token": tokens["refresh_token"]}
+        )
+    ).json()
+
+    response = await async_client.post(
+        "/token/refresh", json={"refresh_token": tokens["refresh_token"]}
+    )
+    assert response.status_code == 401
+
+    response = await async_client.post(
+        "/token/refresh", json={"refresh_token": refreshed["refresh_token"]}
+    )
+    assert response.status_code == 401
+
+
+@pytest.mark.anyio
+async def test_logout_everywhere(async_client: AsyncClient, registered_user: dict):
+    first, second = [await login(async_client, registered_user) for _ in range(2)]
+
+    response = await async_client.post(
+        "/logout/all", headers={"Authorization": f"Bearer {first['access_token']}"}
+    )
+    assert response.status_code == 204
+
+    for tokens in (first, second):
+        response = await async_client.post(
+            "/logout", headers={"Authorization": f"Bearer {tokens['access_token']}"}
+        )
+        assert response.status_code == 401
+        response = await async_client.post(
+            "/token/refresh", json={"refresh_token": tokens["refresh_token"]}
+        )
+        assert response.status_code == 401
@@ -0,0 +1,106 @@
+import pytest
+
+from app import cache
+from app.cache import GenerationCache, MemoryCache, TieredCache
+
+
+@pytest.mark.anyio
+async def test_memory_cache_get_set():
+    memory = MemoryCache(maxsize=2, ttl=60)
+    await memory.set("a", {"id": 1})
+
+    assert await memory.get("a") == {"id": 1}
+    assert await memory.get("b") is None
+    assert memory.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+
+@pytest.mark.anyio
+async def test_memory_cache_evicts_least_recently_used():
+    memory = MemoryCache(maxsize=2, ttl=60)
+    await memory.set("a", 1)
+    await memory.set("b", 2)
+    await memory.get("a")
+    await memory.set("c", 3)
+
+    assert await memory.get("a") == 1
+    assert await memory.get("b") is None
+    assert await memory.get("c") == 3
+
+
+@pytest.mark.anyio
+async def test_memory_cache_expires(mocker):
+    monotonic = mocker.patch.object(cache.time, "monotonic", return_value=100.0)
+    memory = MemoryCache(maxsize=2, ttl=10)
+    await memory.set("a", 1)
+
+    monotonic.return_value = 109.0
+    assert await memory.get("a") == 1
+
+    monotonic.return_value = 110.0
+    assert await memory.get("a") is None
+    assert memory.stats()["size"] == 0
+
+
+@pytest.mark.anyio
+async def test_memory_cache_delete():
+    memory = MemoryCache()
+    await memory.set("a", 1)
+    await memory.delete("a")
+    await memory.delete("missing")
+
+    assert await memory.get("a") is None
+
+
+@pytest.mark.anyio
+async def test_tiered_cache_fills_local_from_shared():
+    shared = MemoryCache()
+    tiered = TieredCache(MemoryCache(), shared)
+    await shared.set("a", 1)
+
+    assert await tiered.get("a") == 1
+    assert await tiered.local.get("a") == 1
+
+    await tiered.delete("a")
+    assert await tiered.get("a") is None
+    assert await shared.get("a") is None
+
+
+@pytest.mark.anyio
+async def test_generation_cache_invalidate():
+    feed = GenerationCache(TieredCache(MemoryCache()))
+    generation = await feed.generation()
+    await feed.set(generation, "page", [1])
+
+    assert await feed.get(generation, "page") == [1]
+
+    await feed.invalidate()
+    assert await feed.get(await feed.generation(), "page") is None
+
+
+@pytest.mark.anyio
+async def test_generation_cache_shared_between_workers():
+    shared = MemoryCache()
+    worker_1 = GenerationCache(TieredCache(MemoryCache(), shared))
+    worker_2 = GenerationCache(TieredCache(MemoryCache(), shared))
+    generation = await worker_1.generation()
+    await worker_1.set(generation, "page", [1])
+    assert await worker_2.get(await worker_2.generation(), "page") == [1]
+
+    await worker_2.invalidate()
+
+    assert await worker_1.generation() == await worker_2.generation() != generation
+    assert await worker_1.get(await worker_1.generation(), "page") is None
+
+
+@pytest.mark.anyio
+async def test_cache_stats_endpoint(async_client, logged_in_token: str):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    await async_client.get("/posts/", headers=headers)
+    await async_client.get("/posts/", headers=headers)
+
+    response = await async_client.get("/health/cache")
+
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["feed"]["local"]["hits"] >= 1
+    assert set(stats["users"]["local"]) == {"size", "hits", "misses"}
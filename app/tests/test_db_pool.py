@@ -0,0 +1,83 @@
+import asyncio
+from typing import AsyncGenerator
+
+import pytest
+from fastapi import HTTPException
+from httpx import AsyncClient
+
+from app.database import DATABASE_URL
+from app.db_pool import InstrumentedPostgresBackend
+
+
+@pytest.fixture()
+async def small_pool() -> AsyncGenerator:
+    backend = InstrumentedPostgresBackend(
+        DATABASE_URL, min_size=1, max_size=1, acquire_timeout=0.05
+    )
+    await backend.connect()
+    yield backend
+    await backend.disconnect()
+
+
+@pytest.mark.anyio
+async def test_database_pool_stats(async_client: AsyncClient):
+    response = await async_client.get("/health/database")
+
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["connected"] is True
+    assert stats["in_use"] + stats["idle"] == stats["size"]
+    assert stats["acquire_seconds"]["count"] >= 1
+
+
+@pytest.mark.anyio
+async def test_acquire_timeout(small_pool: InstrumentedPostgresBackend):
+    held = small_pool.connection()
+    await held.acquire()
+
+    with pytest.raises(HTTPException) as exc_info:
+        await small_pool.connection().acquire()
+
+    await held.release()
+    assert exc_info.value.status_code == 503
+    assert small_pool.stats()["acquire_timeouts"] == 1
+    assert small_pool.stats()["waiting"] == 0
+
+
+@pytest.mark.anyio
+async def test_waiters_are_counted(small_pool: InstrumentedPostgresBackend):
+    small_pool.acquire_timeout = None
+    held = small_pool.connection()
+    await held.acquire()
+
+    waiter = small_pool.connection()
+    acquiring = asyncio.ensure_future(waiter.acquire())
+    await asyncio.sleep(0.01)
+    assert small_pool.stats()["waiting"] == 1
+    assert small_pool.stats()["in_use"] == 1
+
+    await held.release()
+    await acquiring
+    await waiter.release()
+    assert small_pool.stats()["waiting"] == 0
+
+
+@pytest.mark.anyio
+async def test_connections_recycled_after_max_lifetime(
+    small_pool: InstrumentedPostgresBackend,
+):
+    small_pool.max_lifetime = 0.001
+
+    async def backend_pid() -> int:
+        connection = small_pool.connection()
+        await connection.acquire()
+        await asyncio.sleep(0.01)
+        pid = await connection.raw_connection.fetchval("SELECT pg_backend_pid()")
+        await connection.release()
+        return pid
+
+    first_pid = await backend_pid()
+    second_pid = await backend_pid()
+
+    assert first_pid != second_pid
+    assert small_pool.stats()["recycled"] == 2
@@ -0,0 +1,59 @@
+import asyncio
+import threading
+
+import pytest
+from httpx import AsyncClient
+
+from app import security
+from app.hashing import PasswordHashPool, password_pool
+
+
+@pytest.mark.anyio
+async def test_password_pool_run():
+    pool = PasswordHashPool(max_workers=1, max_queue=1)
+    hashed = await pool.run(security.get_password_hash, "test_password")
+
+    assert await pool.run(security.verify_password, "test_password", hashed)
+    assert pool.in_flight == 0
+    assert pool.stats()["wait_seconds"]["count"] == 2
+
+
+@pytest.mark.anyio
+async def test_password_pool_saturated():
+    pool = PasswordHashPool(max_workers=1, max_queue=0)
+    release = threading.Event()
+    blocked = asyncio.ensure_future(pool.run(release.wait))
+    await asyncio.sleep(0)
+
+    with pytest.raises(security.HTTPException) as exc_info:
+        await pool.run(security.get_password_hash, "test_password")
+
+    release.set()
+    await blocked
+    assert exc_info.value.status_code == 503
+    assert pool.stats()["rejected"] == 1
+
+
+@pytest.mark.anyio
+async def test_login_pool_saturated(
+    async_client: AsyncClient, registered_user: dict, mocker
+):
+    mocker.patch.object(
+        password_pool, "in_flight", password_pool.max_workers + password_pool.max_queue
+    )
+    response = await async_client.post(
+        "/token",
+        data={
+            "username": registered_user["email"],
+            "password": registered_user["password"],
+        },
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+@pytest.mark.anyio
+async def test_password_hashing_stats(async_client: AsyncClient):
+    response = await async_client.get("/health/password-hashing")
+    assert response.status_code == 200
+    assert response.json()["max_workers"] == password_pool.max_workers
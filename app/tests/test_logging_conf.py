@@ -0,0 +1,324 @@
+import json
+import logging
+import time
+import timeit
+from typing import Generator
+
+import pytest
+from asgi_correlation_id import correlation_id
+
+from app import logging_conf
+from app.config import config
+from app.logging_conf import (
+    QUEUED_LOGGERS,
+    BatchingQueueListener,
+    BatchingRotatingFileHandler,
+    DroppingQueueHandler,
+    EmailObfuscationFilter,
+    SamplingFilter,
+    configure_logging,
+    logging_stats,
+    obfuscated,
+    stop_logging,
+)
+
+
+def make_record(
+    message: str, level: int = logging.INFO, name: str = "app.test"
+) -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, message, None, None)
+
+
+@pytest.fixture()
+def restore_loggers(tmp_path, monkeypatch) -> Generator:
+    # configure_logging reconfigures global loggers and writes app.log to the
+    # working directory
+    monkeypatch.chdir(tmp_path)
+    saved = {}
+    for name in QUEUED_LOGGERS:
+        logger = logging.getLogger(name)
+        saved[name] = (logger.handlers, logger.level, logger.propagate)
+    yield
+    stop_logging()
+    for name, (handlers, level, propagate) in saved.items():
+        logger = logging.getLogger(name)
+        for handler in logger.handlers:
+            if handler not in handlers:
+                handler.close()
+        logger.handlers, logger.level, logger.propagate = handlers, level, propagate
+
+
+@pytest.mark.parametrize(
+    "email, obfuscated_length, expected",
+    [
+        ("someone@email.com", 2, "so*****@email.com"),
+        ("someone@email.com", 0, "*******@email.com"),
+        ("ab@email.com", 2, "ab@email.com"),
+        ("not-an-email", 2, "no**********"),
+    ],
+)
+def test_obfuscated(email, obfuscated_length, expected):
+    assert obfuscated(email, obfuscated_length) == expected
+    # Masking twice changes nothing
+    assert obfuscated(expected, obfuscated_length) == expected
+
+
+def test_email_filter_masks_once(mocker):
+    email_filter = EmailObfuscationFilter(obfuscated_length=2)
+    spy = mocker.patch("app.logging_conf.obfuscated", wraps=obfuscated)
+    record = make_record("Logging in a user")
+    record.email = "someone@email.com"
+
+    # As for the console and the file handler
+    assert email_filter.filter(record) and email_filter.filter(record)
+
+    assert record.email == "so*****@email.com"
+    assert spy.call_count == 1
+
+
+def test_email_filter_login_workload(record_property):
+    # Micro-benchmark: a login logs the address from the user route and from
+    # the user lookup, and every record goes through two handlers. A few
+    # hundred users logging in repeatedly are masked from the cache, once per
+    # record, against masking from scratch on every handler as before. Timings
+    # are noisy on shared runners, so they are reported (in the JUnit XML)
+    # rather than asserted; the cache counts show the work saved.
+    emails = [f"user{i:04d}@example.com" for i in range(300)]
+    logins = [emails[(i * 7) % len(emails)] for i in range(5000)]
+    email_filter = EmailObfuscationFilter(obfuscated_length=0)
+    uncached = obfuscated.__wrapped__
+
+    def records() -> list[logging.LogRecord]:
+        batch = []
+        for email in logins:
+            for message in ("Logging in a user", "Fetching user from database"):
+                record = make_record(message)
+                record.email = email
+                batch.append(record)
+        return batch
+
+    def before(batch: list[logging.LogRecord]) -> None:
+        for record in batch:
+            for _ in range(2):
+                record.email = uncached(record.email, 0)
+
+    def after(batch: list[logging.LogRecord]) -> None:
+        for record in batch:
+            email_filter.filter(record)
+            email_filter.filter(record)
+
+    obfuscated.cache_clear()
+    timings = {}
+    for name, run in (("before", before), ("after", after)):
+        batches = [records() for _ in range(5)]
+        timings[name] = min(
+            timeit.repeat(lambda: run(batches.pop()), number=1, repeat=5)
+        )
+
+    for name, seconds in timings.items():
+        record_property(f"{name}_us_per_record", seconds / (2 * len(logins)) * 1e6)
+
+    cache = obfuscated.cache_info()
+    assert cache.misses == len(emails)
+    assert cache.hits + cache.misses == 5 * 2 * len(logins)
+
+
+def test_sampling_filter_keeps_one_in_n():
+    sampling = SamplingFilter(rates={"app.routes.post.reads": 3})
+    kept = [
+        record
+        for record in (
+            make_record(f"message {i}", name="app.routes.post.reads") for i in range(9)
+        )
+        if sampling.filter(record)
+    ]
+
+    assert [record.msg for record in kept] == ["message 0", "message 3", "message 6"]
+    assert all(record.sample_rate == 3 for record in kept)
+
+
+def test_sampling_filter_scope():
+    sampling = SamplingFilter(rates={"app.routes": 2})
+
+    # Children of a sampled logger are sampled, each counted on its own
+    assert sampling.filter(make_record("first", name="app.routes.post"))
+    assert sampling.filter(make_record("first", name="app.routes.like"))
+    assert not sampling.filter(make_record("second", name="app.routes.post"))
+    # Other loggers and warnings or errors always pass
+    assert all(
+        sampling.filter(make_record("other", name="app.security")) for _ in range(3)
+    )
+    assert all(
+        sampling.filter(make_record("failure", logging.ERROR, name="app.routes.post"))
+        for _ in range(3)
+    )
+
+
+def test_sampling_filter_shared_by_handlers():
+    # A record is counted once, however many handlers share the filter
+    sampling = SamplingFilter(rates={"app.test": 2})
+    first, second = make_record("first"), make_record("second")
+
+    assert sampling.filter(first) and sampling.filter(first)
+    assert not sampling.filter(second) and not sampling.filter(second)
+
+
+def test_queue_handler_drops_when_full():
+    handler = DroppingQueueHandler(maxsize=2)
+    for i in range(5):
+        handler.handle(make_record(f"message {i}"))
+
+    assert handler.stats() == {"queued": 2, "max_queue": 2, "dropped": 3}
+
+
+def test_queue_handler_resolves_message_args():
+    handler = DroppingQueueHandler(maxsize=1)
+    values = ["before"]
+    record = logging.LogRecord(
+        "app.test", logging.INFO, __file__, 1, "value %s", (values,), None
+    )
+
+    handler.handle(record)
+    values.append("after")
+
+    assert handler.queue.get_nowait().msg == "value ['before']"
+
+
+def test_batching_file_handler(tmp_path):
+    path = tmp_path / "app.log"
+    handler = BatchingRotatingFileHandler(
+        path, batch_size=3, maxBytes=1024 * 1024, encoding="utf8"
+    )
+
+    handler.handle(make_record("first"))
+    handler.handle(make_record("second"))
+    assert path.read_text() == ""
+
+    handler.handle(make_record("third"))
+    assert path.read_text() == "first\nsecond\nthird\n"
+
+    handler.handle(make_record("failure", logging.ERROR))
+    assert path.read_text().endswith("failure\n")
+    handler.close()
+
+
+def test_batching_file_handler_rolls_over(tmp_path):
+    path = tmp_path / "app.log"
+    handler = BatchingRotatingFileHandler(
+        path, batch_size=1, maxBytes=20, backupCount=1, encoding="utf8"
+    )
+
+    for message in ("first message", "second message", "third message"):
+        handler.handle(make_record(message))
+    handler.close()
+
+    assert path.read_text() == "third message\n"
+    assert (tmp_path / "app.log.1").read_text() == "second message\n"
+
+
+def test_listener_flushes_when_idle(tmp_path):
+    path = tmp_path / "app.log"
+    queue_handler = DroppingQueueHandler(maxsize=10)
+    file_handler = BatchingRotatingFileHandler(path, batch_size=100, encoding="utf8")
+    listener = BatchingQueueListener(
+        queue_handler.queue, file_handler, flush_interval=0.01
+    )
+    listener.start()
+
+    queue_handler.handle(make_record("queued"))
+    deadline = time.monotonic() + 2
+    while path.read_text() == "" and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    listener.stop()
+    file_handler.close()
+    assert path.read_text() == "queued\n"
+
+
+def test_configure_logging_queued(tmp_path, restore_loggers, mocker):
+    mocker.patch.object(config, "LOG_QUEUE_SIZE", 100)
+    configure_logging()
+
+    assert logging_stats()["mode"] == "queue"
+    assert all(
+        logging.getLogger(name).handlers == [logging_conf.log_queue_handler]
+        for name in QUEUED_LOGGERS
+    )
+
+    token = correlation_id.set("a" * 32)
+    try:
+        logging.getLogger("app.test").info(
+            "Queued record", extra={"email": "someone@email.com"}
+        )
+    finally:
+        correlation_id.reset(token)
+    stop_logging()
+
+    record = json.loads((tmp_path / "app.log").read_text().splitlines()[-1])
+    assert record["message"] == "Queued record"
+    assert record["correlation_id"] == "a" * 32
+    assert record["email"] != "someone@email.com"
+
+    # Handed back to the loggers, with the correlation id filter restored
+    logging.getLogger("app.test").info("After stop")
+    logging.getLogger("app").handlers[-1].flush()
+    record = json.loads((tmp_path / "app.log").read_text().splitlines()[-1])
+    assert record["message"] == "After stop"
+    assert record["correlation_id"] == "-"
+
+
+@pytest.mark.parametrize("queue_size", [0, 100])
+def test_configure_logging_keeps_logger_handlers(
+    tmp_path, restore_loggers, mocker, queue_size
+):
+    mocker.patch.object(config, "LOG_QUEUE_SIZE", queue_size)
+    configure_logging()
+
+    logging.getLogger("asyncpg.pool").warning("Console only")
+    logging.getLogger("uvicorn.error").warning("Console and file")
+    stop_logging()
+    logging.getLogger("uvicorn").handlers[-1].flush()
+
+    messages = [
+        json.loads(line)["message"]
+        for line in (tmp_path / "app.log").read_text().splitlines()
+    ]
+    assert messages == ["Console and file"]
+
+
+def test_configure_logging_sync(tmp_path, restore_loggers, mocker):
+    mocker.patch.object(config, "LOG_QUEUE_SIZE", 0)
+    configure_logging()
+
+    assert logging_stats() == {"mode": "sync"}
+    logging.getLogger("app.test").info("Sync record")
+
+    record = json.loads((tmp_path / "app.log").read_text().splitlines()[-1])
+    assert record["message"] == "Sync record"
+
+
+def test_configure_logging_sampled(tmp_path, restore_loggers, mocker):
+    mocker.patch.object(config, "LOG_QUEUE_SIZE", 100)
+    mocker.patch.object(config, "LOG_SAMPLE_RATES", {"app.routes.post.reads": 2})
+    configure_logging()
+
+    logger = logging.getLogger("app.routes.post.reads")
+    token = correlation_id.set("b" * 32)
+    try:
+        for i in range(4):
+            logger.info("Finding post with id %s", i)
+        logger.error("Post lookup failed")
+    finally:
+        correlation_id.reset(token)
+    stop_logging()
+
+    records = [
+        json.loads(line) for line in (tmp_path / "app.log").read_text().splitlines()
+    ]
+    assert [record["message"] for record in records] == [
+        "Finding post with id 0",
+        "Finding post with id 2",
+        "Post lookup failed",
+    ]
+    assert all(record["correlation_id"] == "b" * 32 for record in records)
+    assert [record.get("sample_rate") for record in records] == [2, 2, None]
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from httpx import AsyncClient
+
+from app.metrics import (
+    Metrics,
+    MetricsReporter,
+    app_metrics,
+    default_metrics_dir,
+    labels,
+    merge,
+    render,
+)
+
+
+def route_histogram(name: str, method: str, route: str) -> dict:
+    histogram = app_metrics.histograms[name].get(labels(method=method, route=route))
+    return histogram.snapshot() if histogram else {"sum": 0.0, "count": 0}
+
+
+@pytest.mark.anyio
+async def test_metrics_endpoint(async_client: AsyncClient, logged_in_token: str):
+    await async_client.get(
+        "/posts/12345", headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+
+    response = await async_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE http_requests_total counter" in response.text
+    assert (
+        'http_requests_total{method="GET",route="/posts/{post_id}",status="404"}'
+        in response.text
+    )
+    assert "/posts/12345" not in response.text
+    assert "metrics_workers 1" in response.text
+
+
+@pytest.mark.anyio
+async def test_metrics_time_database_queries(
+    async_client: AsyncClient, logged_in_token: str
+):
+    before = route_histogram("http_request_db_queries", "GET", "/posts/{post_id}")
+
+    await async_client.get(
+        "/posts/12345", headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+
+    after = route_histogram("http_request_db_queries", "GET", "/posts/{post_id}")
+    assert after["count"] == before["count"] + 1
+    assert after["sum"] >= before["sum"] + 1
+    db_time = route_histogram("http_request_db_seconds", "GET", "/posts/{post_id}")
+    assert db_time["sum"] > 0
+
+
+def test_merge_sums_counters_and_live_gauges():
+    now = time.time()
+    workers = []
+    for pid, written_at in ((1, now), (2, now), (3, now - 60)):
+        metrics = Metrics()
+        metrics.inc("http_requests_total", labels(route="/health"), 2)
+        metrics.add("http_requests_in_flight")
+        metrics.observe("http_request_duration_seconds", "", 0.02)
+        workers.append({**metrics.snapshot(), "pid": pid, "written_at": written_at})
+
+    merged = merge(workers, live_after=now - 15)
+
+    assert merged["counters"]["http_requests_total"] == {'route="/health"': 6}
+    # The third worker stopped writing, its gauges are no longer current
+    assert merged["gauges"]["http_requests_in_flight"] == {"": 2}
+    assert merged["gauges"]["metrics_workers"] == {"": 2}
+    histogram = merged["histograms"]["http_request_duration_seconds"][""]
+    assert histogram["count"] == 3
+    assert histogram["buckets"]["0.025"] == 3
+    assert histogram["buckets"]["0.01"] == 0
+
+    text = render(merged)
+    assert 'http_request_duration_seconds_bucket{le="+Inf"} 3' in text
+    assert 'http_requests_total{route="/health"} 6' in text
+
+
+def test_labels_are_escaped():
+    assert labels(route='a"b\\c') == 'route="a\\"b\\\\c"'
+
+
+def test_reporter_merges_other_workers(tmp_path):
+    other = Metrics()
+    other.inc("http_requests_total", labels(route="/health"), 5)
+    (tmp_path / "worker-1.json").write_text(json.dumps(other.snapshot()))
+    (tmp_path / "worker-2.json").write_text("{not json")
+
+    metrics = Metrics()
+    metrics.inc("http_requests_total", labels(route="/health"), 1)
+    reporter = MetricsReporter(
+        metrics, str(tmp_path), flush_interval=5, lag_interval=0.5
+    )
+    reporter.flush()
+
+    assert (tmp_path / f"worker-{os.getpid()}.json").exists()
+    assert 'http_requests_total{route="/health"} 6' in reporter.collect()
+    assert "metrics_workers 2" in reporter.collect()
+
+
+@pytest.mark.anyio
+async def test_reporter_removes_files_of_dead_workers(tmp_path):
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    for name in (
+        f"worker-{exited.pid}.json",
+        f"worker-{exited.pid}.tmp",
+        f"worker-{os.getppid()}.json",
+    ):
+        (tmp_path / name).write_text(json.dumps(Metrics().snapshot()))
+
+    reporter = MetricsReporter(
+        Metrics(), str(tmp_path), flush_interval=5, lag_interval=0.5
+    )
+    reporter.start()
+    await reporter.stop()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        [f"worker-{os.getppid()}.json", f"worker-{os.getpid()}.json"]
+    )
+
+
+def test_default_metrics_dir_only_for_spawned_workers():
+    assert default_metrics_dir() is None
+
+
+@pytest.mark.anyio
+async def test_reporter_measures_event_loop_lag():
+    metrics = Metrics()
+    reporter = MetricsReporter(metrics, None, flush_interval=5, lag_interval=0.01)
+    reporter.start()
+    await asyncio.sleep(0)
+
+    # Blocks the event loop past the reporter's wake-up time
+    time.sleep(0.1)
+    await asyncio.sleep(0.02)
+    await reporter.stop()
+
+    assert metrics.histograms["event_loop_lag_seconds"][""].sum >= 0.05
+    assert "event_loop_lag_last_seconds" in metrics.gauges
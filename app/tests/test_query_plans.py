@@ -0,0 +1,209 @@
+import json
+from typing import Callable
+
+import pytest
+from httpx import AsyncClient
+
+from app.database import database
+
+SEED_USERS = 2000
+SEED_POSTS_PER_USER = 10
+SEED_FOLLOWS_PER_USER = 5
+
+
+@pytest.fixture()
+async def seeded_dataset() -> None:
+    # Large enough that the planner prefers a sequential scan only when no
+    # index can serve the query
+    await database.execute(
+        f"""
+        INSERT INTO users (email, password)
+        SELECT 'seed' || g || '@email.com', 'not-a-hash'
+        FROM generate_series(1, {SEED_USERS}) AS g
+        """
+    )
+    await database.execute(
+        f"""
+        INSERT INTO posts (title, content, user_id)
+        SELECT 'Seeded topic' || (users.id * g % 997),
+               'Seeded content keyword' || (users.id * g % 1999),
+               users.id
+        FROM users CROSS JOIN generate_series(1, {SEED_POSTS_PER_USER}) AS g
+        """
+    )
+    await database.execute(
+        """
+        INSERT INTO likes (user_id, post_id)
+        SELECT users.id, posts.id
+        FROM users JOIN posts ON posts.id % 50 = users.id % 50
+        WHERE posts.id % 7 = 0
+        """
+    )
+    await database.execute(
+        """
+        UPDATE posts SET like_count = counts.likes
+        FROM (SELECT post_id, count(*) AS likes FROM likes GROUP BY post_id) AS counts
+        WHERE posts.id = counts.post_id
+        """
+    )
+    await database.execute(
+        f"""
+        INSERT INTO follows (follower_id, followee_id)
+        SELECT users.id, followees.id
+        FROM users CROSS JOIN generate_series(1, {SEED_FOLLOWS_PER_USER}) AS g
+        JOIN users AS followees ON followees.id = users.id + g * 37
+        """
+    )
+    await database.execute(
+        """
+        UPDATE users SET follower_count = counts.followers
+        FROM (
+            SELECT followee_id, count(*) AS followers FROM follows GROUP BY followee_id
+        ) AS counts
+        WHERE users.id = counts.followee_id
+        """
+    )
+    await database.execute(
+        """
+        INSERT INTO timeline_entries (user_id, post_id, created_at)
+        SELECT follows.follower_id, posts.id, posts.created_at
+        FROM follows JOIN posts ON posts.user_id = follows.followee_id
+        """
+    )
+    await database.execute(
+        """
+        INSERT INTO sessions (id, user_id, refresh_token_hash, expires_at)
+        SELECT gen_random_uuid(), users.id, md5(users.email), now() + interval '1 day'
+        FROM users
+        """
+    )
+    await database.execute(
+        """
+        INSERT INTO revoked_tokens (token_id, expires_at)
+        SELECT md5(sessions.id::text), sessions.expires_at FROM sessions
+        """
+    )
+    # Flush GIN pending lists like autovacuum would, or the planner costs the
+    # freshly inserted rows as unindexed
+    await database.execute(
+        """
+        SELECT gin_clean_pending_list(pg_index.indexrelid::regclass)
+        FROM pg_index
+        JOIN pg_class ON pg_class.oid = pg_index.indexrelid
+        JOIN pg_am ON pg_am.oid = pg_class.relam
+        WHERE pg_am.amname = 'gin'
+        """
+    )
+    await database.execute("ANALYZE")
+
+
+def seq_scans(plan: dict) -> list[str]:
+    found = []
+    if plan["Node Type"] == "Seq Scan":
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+async def explain(sql: str, args: list) -> list[str]:
+    async with database.connection() as connection:
+        raw_connection = connection.raw_connection
+        plan = await raw_connection.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", *args)
+    return seq_scans(json.loads(plan)[0]["Plan"])
+
+
+async def exercise_routes(
+    async_client: AsyncClient, registered_user: dict, token: str
+) -> None:
+    headers = {"Authorization": f"Bearer {token}"}
+    post = (
+        await async_client.post(
+            "/posts/", json={"title": "New", "content": "New content"}, headers=headers
+        )
+    ).json()
+
+    for params in (
+        {"sorting": "new"},
+        {"sorting": "old"},
+        {"sorting": "most_likes"},
+        {"sorting": "new", "skip": 20},
+        {"search": "topic42", "limit": 2},
+        {"search": "keyword42", "search_mode": "fulltext", "sorting": "relevance"},
+    ):
+        response = await async_client.get("/posts/", params=params, headers=headers)
+        cursor = response.headers["X-Next-Cursor"]
+        await async_client.get(
+            "/posts/", params={**params, "cursor": cursor}, headers=headers
+        )
+
+    await async_client.get(f"/posts/{post['id']}", headers=headers)
+    await async_client.get(
+        "/posts/export",
+        params={"since": post["created_at"], "since_id": post["id"]},
+        headers=headers,
+    )
+    await async_client.get(
+        "/posts/batch", params={"ids": [post["id"], 1, 2]}, headers=headers
+    )
+    await async_client.post(
+        "/posts/bulk", json=[{"title": "Bulk", "content": "Bulk"}], headers=headers
+    )
+    await async_client.post(
+        "/like/bulk", json={"post_ids": [post["id"], 1, 2]}, headers=headers
+    )
+    await async_client.put(
+        f"/posts/{post['id']}",
+        json={"title": "Updated title", "content": "Updated content"},
+        headers=headers,
+    )
+    followee = post["user_id"] + 1
+    await async_client.put(f"/follow/{followee}", headers=headers)
+    response = await async_client.get("/timeline", params={"limit": 2}, headers=headers)
+    await async_client.get(
+        "/timeline",
+        params={"limit": 2, "cursor": response.headers["X-Next-Cursor"]},
+        headers=headers,
+    )
+    await async_client.delete(f"/follow/{followee}", headers=headers)
+    await async_client.post(f"/like/{post['id']}", headers=headers)
+    await async_client.put(f"/like/{post['id']}", headers=headers)
+    await async_client.delete(f"/like/{post['id']}", headers=headers)
+    await async_client.delete(f"/posts/{post['id']}", headers=headers)
+    response = await async_client.post(
+        "/token",
+        data={
+            "username": registered_user["email"],
+            "password": registered_user["password"],
+        },
+    )
+    tokens = (
+        await async_client.post(
+            "/token/refresh", json={"refresh_token": response.json()["refresh_token"]}
+        )
+    ).json()
+    await async_client.post(
+        "/logout", headers={"Authorization": f"Bearer {tokens['access_token']}"}
+    )
+
+
+@pytest.mark.anyio
+async def test_routes_do_not_sequential_scan(
+    async_client: AsyncClient,
+    registered_user: dict,
+    logged_in_token: str,
+    seeded_dataset: None,
+    record_queries: Callable,
+):
+    with record_queries() as queries:
+        await exercise_routes(async_client, registered_user, logged_in_token)
+
+    assert len(queries) > 20
+
+    offenders = []
+    for sql, args in queries:
+        tables = await explain(sql, args)
+        if tables:
+            offenders.append(f"Seq Scan on {', '.join(tables)}: {sql}")
+
+    assert not offenders, "\n\n".join(offenders)
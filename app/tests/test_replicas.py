@@ -0,0 +1,171 @@
+import asyncio
+from typing import AsyncGenerator
+
+import asyncpg
+import pytest
+from httpx import AsyncClient
+
+from app.database import DATABASE_URL, database, post_table, user_table
+from app.replicas import ReplicaSet, replicas
+
+
+@pytest.fixture()
+async def replica_set() -> AsyncGenerator:
+    # The test database stands in for two replicas; they only see committed
+    # rows, so anything written by a test is missing on them
+    replica_set = ReplicaSet(
+        database, [DATABASE_URL, DATABASE_URL], max_lag=5, check_interval=60
+    )
+    await replica_set.connect()
+    yield replica_set
+    await replica_set.disconnect()
+
+
+@pytest.mark.anyio
+async def test_replicas_round_robin(replica_set: ReplicaSet):
+    first, second = replica_set.replicas
+
+    assert all(replica.healthy and replica.lag == 0 for replica in (first, second))
+    assert [replica_set.reader() for _ in range(3)] == [first, second, first]
+
+
+@pytest.mark.anyio
+async def test_lagging_replica_leaves_rotation(replica_set: ReplicaSet, mocker):
+    first, second = replica_set.replicas
+    mocker.patch.object(first.database, "fetch_val", return_value=60.0)
+
+    await replica_set.check()
+    assert not first.healthy
+    assert [replica_set.reader() for _ in range(3)] == [second] * 3
+
+    mocker.stopall()
+    await replica_set.check()
+    assert first.healthy
+
+
+@pytest.mark.anyio
+async def test_disconnected_replica_leaves_rotation(replica_set: ReplicaSet, mocker):
+    # No streaming WAL receiver, however caught up the replica looks
+    first, second = replica_set.replicas
+    mocker.patch.object(first.database, "fetch_val", return_value=None)
+
+    await replica_set.check()
+
+    assert not first.healthy
+    assert first.lag is None
+    assert [replica_set.reader() for _ in range(2)] == [second] * 2
+
+
+@pytest.mark.anyio
+async def test_unreachable_replica_is_unhealthy():
+    replica_set = ReplicaSet(
+        database,
+        [DATABASE_URL.replace(f":{database.url.port}/", ":1/")],
+        max_lag=5,
+        check_interval=60,
+    )
+    await replica_set.connect()
+
+    assert replica_set.reader() is None
+    assert replica_set.stats()[0]["healthy"] is False
+    assert await replica_set.fetch_one(post_table.select().limit(1)) is None
+    await replica_set.disconnect()
+
+
+@pytest.mark.anyio
+async def test_replica_miss_falls_back_to_primary(
+    replica_set: ReplicaSet, registered_user: dict
+):
+    query = user_table.select().where(user_table.c.email == registered_user["email"])
+
+    user = await replica_set.fetch_one(query)
+
+    assert user is not None
+    assert user.id == registered_user["id"]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "error, leaves_rotation",
+    [
+        (asyncpg.AdminShutdownError("terminating connection"), True),
+        (asyncpg.TooManyConnectionsError("too many clients"), True),
+        (asyncpg.InvalidPasswordError("password authentication failed"), True),
+        (asyncpg.SerializationError("conflict with recovery"), False),
+    ],
+)
+async def test_replica_error_falls_back_to_primary(
+    replica_set: ReplicaSet,
+    registered_user: dict,
+    mocker,
+    error: Exception,
+    leaves_rotation: bool,
+):
+    for replica in replica_set.replicas:
+        mocker.patch.object(replica.database, "fetch_all", side_effect=error)
+        mocker.patch.object(replica.database, "fetch_one", side_effect=error)
+    query = user_table.select().where(user_table.c.email == registered_user["email"])
+
+    assert [user.id for user in await replica_set.fetch_all(query)] == [
+        registered_user["id"]
+    ]
+    assert (await replica_set.fetch_one(query)).id == registered_user["id"]
+    assert all(
+        replica.healthy is not leaves_rotation for replica in replica_set.replicas
+    )
+
+
+@pytest.mark.anyio
+async def test_replica_error_before_first_row_streams_from_primary(
+    replica_set: ReplicaSet, registered_user: dict, mocker
+):
+    async def failing_iterate(query):
+        raise asyncpg.SerializationError("conflict with recovery")
+        yield
+
+    for replica in replica_set.replicas:
+        mocker.patch.object(replica.database, "iterate", failing_iterate)
+    query = user_table.select().where(user_table.c.email == registered_user["email"])
+
+    rows = [row async for row in replica_set.iterate(query)]
+
+    assert [row.id for row in rows] == [registered_user["id"]]
+
+
+@pytest.mark.anyio
+async def test_health_checks_survive_errors(replica_set: ReplicaSet, mocker):
+    first, second = replica_set.replicas
+    mocker.patch.object(first, "check", side_effect=RuntimeError("unexpected"))
+
+    await replica_set.check()
+
+    assert not first.healthy
+    assert second.healthy
+
+    check = mocker.patch.object(replica_set, "check", side_effect=RuntimeError)
+    replica_set.check_interval = 0.01
+    checker = asyncio.create_task(replica_set._check_forever())
+    await asyncio.sleep(0.1)
+
+    assert check.call_count >= 2
+    assert not checker.done()
+    checker.cancel()
+
+
+@pytest.mark.anyio
+async def test_get_post_reads_own_write_with_replicas(
+    async_client: AsyncClient,
+    created_post: dict,
+    logged_in_token: str,
+    replica_set: ReplicaSet,
+    mocker,
+):
+    mocker.patch.object(replicas, "replicas", replica_set.replicas)
+
+    response = await async_client.get(
+        f"/posts/{created_post['id']}",
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["id"] == created_post["id"]
@@ -0,0 +1,66 @@
+import asyncio
+import datetime
+import time
+
+import pytest
+
+from app.database import database, revoked_token_table
+from app.revocations import RevocationList, revocations
+
+
+@pytest.mark.anyio
+async def test_revoke_applies_at_once():
+    await revocations.revoke(["revoked"], time.time() + 60)
+
+    assert revocations.is_revoked(["other", "revoked"])
+    assert not revocations.is_revoked(["other"])
+
+
+@pytest.mark.anyio
+async def test_other_worker_sees_revocation_after_polling():
+    other_worker = RevocationList(database, poll_interval=60)
+    await other_worker.refresh()
+
+    await revocations.revoke(["revoked"], time.time() + 60)
+    assert not other_worker.is_revoked(["revoked"])
+
+    await other_worker.refresh()
+    assert other_worker.is_revoked(["revoked"])
+    assert other_worker.watermark is not None
+
+
+@pytest.mark.anyio
+async def test_expired_revocations_are_forgotten():
+    revocations.revoked["expired"] = time.time() - 1
+
+    assert not revocations.is_revoked(["expired"])
+    await revocations.refresh()
+    assert "expired" not in revocations.revoked
+
+
+@pytest.mark.anyio
+async def test_revoke_purges_expired():
+    await database.execute(
+        revoked_token_table.insert().values(
+            token_id="expired",
+            expires_at=datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc),
+        )
+    )
+
+    await revocations.revoke(["revoked"], time.time() + 60)
+
+    rows = await database.fetch_all(revoked_token_table.select())
+    assert [row.token_id for row in rows] == ["revoked"]
+
+
+@pytest.mark.anyio
+async def test_poller_survives_errors(mocker):
+    revocation_list = RevocationList(database, poll_interval=0.01)
+    await revocation_list.start()
+    refresh = mocker.patch.object(revocation_list, "refresh", side_effect=OSError)
+
+    await asyncio.sleep(0.1)
+
+    assert refresh.call_count >= 2
+    assert not revocation_list._poller.done()
+    await revocation_list.stop()
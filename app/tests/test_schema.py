@@ -0,0 +1,98 @@
+from typing import Callable
+
+import pytest
+
+from app import schema
+from app.database import database
+
+
+@pytest.mark.anyio
+async def test_prepare_schema_at_head_skips_ddl(assert_num_queries: Callable):
+    with assert_num_queries(1) as queries:
+        assert await schema.prepare_schema("auto") is False
+
+    assert "alembic_version" in queries[0]
+
+
+@pytest.mark.anyio
+async def test_prepare_schema_never(assert_num_queries: Callable):
+    with assert_num_queries(0):
+        assert await schema.prepare_schema("never") is False
+
+
+@pytest.mark.anyio
+async def test_prepare_schema_behind_head_skips_ddl(
+    mocker, assert_num_queries: Callable
+):
+    mocker.patch.object(schema, "alembic_heads", return_value=frozenset({"newer"}))
+
+    # Only the revision check, the migrations are left to Alembic
+    with assert_num_queries(1):
+        assert await schema.prepare_schema("auto") is False
+
+
+@pytest.fixture()
+async def empty_schema() -> None:
+    # Stands in for an empty database until the test's transaction rolls back.
+    # The extensions stay reachable in public, its alembic_version must not.
+    await database.execute("CREATE SCHEMA schema_test")
+    await database.execute("SET LOCAL search_path TO schema_test, public")
+    await database.execute("DROP TABLE public.alembic_version")
+
+
+@pytest.mark.anyio
+async def test_prepare_schema_empty_database_creates_and_stamps(
+    empty_schema: None, record_queries: Callable
+):
+    with record_queries() as queries:
+        assert await schema.prepare_schema("auto") is True
+
+    statements = [sql for sql, _ in queries]
+    assert "CREATE TABLE IF NOT EXISTS posts" in " ".join(statements)
+    assert any(
+        "CREATE INDEX IF NOT EXISTS ix_posts_title_trgm" in s for s in statements
+    )
+    assert await schema.current_revisions() == schema.alembic_heads()
+    assert await schema.prepare_schema("auto") is False
+
+
+@pytest.mark.anyio
+async def test_prepare_schema_unstamped_tables_skip_ddl(
+    empty_schema: None, record_queries: Callable, caplog
+):
+    # What create_all built before the migrations existed
+    await database.execute(
+        """
+        CREATE TABLE users (
+            id SERIAL PRIMARY KEY,
+            email VARCHAR NOT NULL UNIQUE,
+            password VARCHAR NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """
+    )
+    await database.execute(
+        """
+        CREATE TABLE posts (
+            id SERIAL PRIMARY KEY,
+            title VARCHAR NOT NULL,
+            content VARCHAR NOT NULL,
+            published BOOLEAN NOT NULL DEFAULT TRUE,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE
+        )
+        """
+    )
+
+    with record_queries() as queries:
+        assert await schema.prepare_schema("auto") is False
+
+    assert not any("CREATE" in sql for sql, _ in queries)
+    assert await schema.current_revisions() == frozenset()
+    assert f"alembic stamp {schema.alembic_base()}" in caplog.text
+
+
+@pytest.mark.anyio
+async def test_prepare_schema_always_is_idempotent():
+    assert await schema.prepare_schema("always") is True
+    assert await schema.prepare_schema("always") is True
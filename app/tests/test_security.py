@@ -1,7 +1,13 @@
+import datetime
+import time
+import uuid
+
 import pytest
 
 from app import security
 from app.config import config
+from app.database import database, session_table
+from app.revocations import revocations
 
 
 def test_access_token_require_minutes():
@@ -15,6 +21,21 @@ def test_create_access_token():
     ).items()
 
 
+def test_create_access_token_with_user_id():
+    token = security.create_access_token("test@gmail.com", 42)
+    claims = security.jwt.decode(
+        token, key=security.SECRET_KEY, algorithms=[security.ALGORITHM]
+    )
+
+    assert claims["uid"] == 42
+    assert (
+        claims["jti"]
+        != security.jwt.get_unverified_claims(
+            security.create_access_token("test@gmail.com", 42)
+        )["jti"]
+    )
+
+
 def test_password_hash():
     password = "test_password"
     assert security.verify_password(password, security.get_password_hash(password))
@@ -63,3 +84,186 @@ async def test_get_current_user(registered_user: dict):
 async def test_get_current_user_invalid_token():
     with pytest.raises(security.HTTPException):
         await security.get_current_user("invalid_token")
+
+
+@pytest.mark.anyio
+async def test_get_current_user_cached(registered_user: dict, mocker):
+    spy = mocker.spy(security, "get_user")
+    token = security.create_access_token(registered_user["email"])
+
+    first = await security.get_current_user(token)
+    second = await security.get_current_user(token)
+
+    assert first == second
+    assert second.id == registered_user["id"]
+    assert spy.call_count == 1
+
+
+@pytest.mark.anyio
+async def test_get_current_user_from_token_claims(registered_user: dict, mocker):
+    token = security.create_access_token(
+        registered_user["email"], registered_user["id"]
+    )
+    get_user = mocker.spy(security, "get_user")
+    decode = mocker.spy(security.jwt, "decode")
+
+    first = await security.get_current_user(token)
+    second = await security.get_current_user(token)
+
+    assert first == second
+    assert second.id == registered_user["id"]
+    assert second.email == registered_user["email"]
+    assert get_user.call_count == 0
+    assert decode.call_count == 1
+
+
+@pytest.mark.anyio
+async def test_verified_token_cached_until_expiry(registered_user: dict):
+    token = security.create_access_token(
+        registered_user["email"], registered_user["id"]
+    )
+
+    await security.get_current_user(token)
+
+    expires_at, claims = security.verified_tokens._entries[security.token_digest(token)]
+    remaining = expires_at - time.monotonic()
+    assert 0 < remaining <= security.access_token_require_minutes() * 60
+    assert claims["uid"] == registered_user["id"]
+
+
+@pytest.mark.anyio
+async def test_get_current_user_revoked_token(registered_user: dict):
+    token = security.create_access_token(
+        registered_user["email"], registered_user["id"]
+    )
+    other_token = security.create_access_token(
+        registered_user["email"], registered_user["id"]
+    )
+    await security.get_current_user(token)
+
+    await security.revoke_access_token(token)
+
+    with pytest.raises(security.HTTPException):
+        await security.get_current_user(token)
+    assert (await security.get_current_user(other_token)).id == registered_user["id"]
+
+
+@pytest.mark.anyio
+async def test_revoked_token_rejected_by_other_workers(registered_user: dict):
+    token = security.create_access_token(
+        registered_user["email"], registered_user["id"]
+    )
+    await security.revoke_access_token(token)
+
+    # Another worker knows the revocation once it has polled the table
+    await security.verified_tokens.clear()
+    revocations.clear()
+    await revocations.refresh()
+
+    with pytest.raises(security.HTTPException):
+        await security.get_current_user(token)
+
+
+@pytest.mark.anyio
+async def test_revoke_token_without_id(registered_user: dict):
+    expire = time.time() + 60
+    token = security.jwt.encode(
+        {"sub": registered_user["email"], "exp": expire},
+        key=security.SECRET_KEY,
+        algorithm=security.ALGORITHM,
+    )
+    await security.revoke_access_token(token)
+
+    with pytest.raises(security.HTTPException):
+        await security.get_current_user(token)
+    assert revocations.is_revoked([security.token_digest(token)])
+
+
+@pytest.mark.anyio
+async def test_rotate_session(registered_user: dict):
+    session_id, refresh_token = await security.create_session(registered_user["id"])
+
+    session, rotated = await security.rotate_session(refresh_token)
+
+    assert session.id.hex == session_id
+    assert session.user_id == registered_user["id"]
+    assert session.email == registered_user["email"]
+    assert rotated != refresh_token
+    assert rotated.startswith(f"{session_id}.")
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("refresh_token", ["", "invalid", f"{'0' * 32}.secret"])
+async def test_rotate_session_invalid_token(refresh_token: str):
+    with pytest.raises(security.HTTPException):
+        await security.rotate_session(refresh_token)
+
+
+@pytest.mark.anyio
+async def test_rotate_session_reuse_revokes_session(registered_user: dict):
+    session_id, refresh_token = await security.create_session(registered_user["id"])
+    access_token = security.create_access_token(
+        registered_user["email"], registered_user["id"], session_id
+    )
+    _, rotated = await security.rotate_session(refresh_token)
+
+    with pytest.raises(security.HTTPException):
+        await security.rotate_session(refresh_token)
+
+    # The whole session ends, including the tokens of the legitimate client
+    with pytest.raises(security.HTTPException):
+        await security.rotate_session(rotated)
+    with pytest.raises(security.HTTPException):
+        await security.get_current_user(access_token)
+
+
+@pytest.mark.anyio
+async def test_rotate_session_wrong_secret_keeps_session(registered_user: dict):
+    session_id, refresh_token = await security.create_session(registered_user["id"])
+
+    # The session id is in every access token, guessing at the secret must
+    # not end the session
+    with pytest.raises(security.HTTPException):
+        await security.rotate_session(f"{session_id}.guessed")
+
+    session, _ = await security.rotate_session(refresh_token)
+    assert session.id.hex == session_id
+
+
+@pytest.mark.anyio
+async def test_create_session_purges_ended_sessions(registered_user: dict):
+    revoked_id, _ = await security.create_session(registered_user["id"])
+    await security.revoke_user_sessions(registered_user["id"])
+    await database.execute(
+        session_table.insert().values(
+            id=uuid.uuid4(),
+            user_id=registered_user["id"],
+            refresh_token_hash="expired",
+            expires_at=datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc),
+        )
+    )
+
+    session_id, _ = await security.create_session(registered_user["id"])
+
+    rows = await database.fetch_all(session_table.select())
+    assert [row.id.hex for row in rows] == [session_id]
+
+
+@pytest.mark.anyio
+async def test_revoke_user_sessions(registered_user: dict):
+    sessions = [await security.create_session(registered_user["id"]) for _ in range(3)]
+    access_tokens = [
+        security.create_access_token(
+            registered_user["email"], registered_user["id"], session_id
+        )
+        for session_id, _ in sessions
+    ]
+
+    assert await security.revoke_user_sessions(registered_user["id"]) == 3
+    assert await security.revoke_user_sessions(registered_user["id"]) == 0
+
+    for (_, refresh_token), access_token in zip(sessions, access_tokens):
+        with pytest.raises(security.HTTPException):
+            await security.rotate_session(refresh_token)
+        with pytest.raises(security.HTTPException):
+            await security.get_current_user(access_token)
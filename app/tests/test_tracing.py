@@ -0,0 +1,77 @@
+import logging
+
+import pytest
+from asgi_correlation_id import CorrelationIdFilter
+from httpx import AsyncClient
+
+from app.config import config
+from app.tracing import RequestQueries, normalized_sql
+
+
+@pytest.fixture()
+def traces(caplog):
+    # Same filter as the configured handlers, so records carry the request id
+    caplog.handler.addFilter(CorrelationIdFilter(default_value="-"))
+    with caplog.at_level(logging.DEBUG, logger="app.tracing"):
+        yield caplog
+
+
+def test_normalized_sql():
+    sql = """
+        SELECT * FROM users
+        WHERE email = 'o''brien@email.com' AND id IN ($1, 42)  LIMIT 10
+    """
+
+    assert normalized_sql(sql) == (
+        "SELECT * FROM users WHERE email = ? AND id IN ($1, ?) LIMIT ?"
+    )
+
+
+def test_request_queries_count_repeated_statements():
+    queries = RequestQueries()
+    for sql in ("SELECT 1", "SELECT 2", "SELECT 1", "SELECT 1"):
+        queries.record(sql, 0.5)
+
+    assert queries.count == 4
+    assert queries.seconds == 2.0
+    assert queries.repeated == 2
+
+
+@pytest.mark.anyio
+async def test_slow_queries_are_logged(
+    async_client: AsyncClient, logged_in_token: str, traces, mocker
+):
+    mocker.patch.object(config, "DB_SLOW_QUERY_SECONDS", 0)
+
+    response = await async_client.get(
+        "/posts/12345", headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+
+    request_id = response.headers["X-Request-ID"]
+    slow = [
+        record
+        for record in traces.records
+        if record.levelno == logging.WARNING and "FROM posts" in record.sql
+    ]
+    assert slow
+    assert "$1" in slow[0].sql
+    assert slow[0].duration_ms >= 0
+    assert slow[0].correlation_id == request_id
+
+
+@pytest.mark.anyio
+async def test_request_summary_is_logged(
+    async_client: AsyncClient, logged_in_token: str, traces
+):
+    response = await async_client.get(
+        "/posts/12345", headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+
+    summaries = [record for record in traces.records if hasattr(record, "db_queries")]
+    assert len(summaries) == 1
+    summary = summaries[0]
+    assert summary.route == "/posts/{post_id}"
+    assert summary.status_code == 404
+    assert summary.db_queries >= 1
+    assert summary.db_time_ms > 0
+    assert summary.correlation_id == response.headers["X-Request-ID"]
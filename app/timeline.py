@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from typing import Optional
+
+import sqlalchemy
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import config
+from app.database import (
+    database,
+    follow_table,
+    post_table,
+    timeline_table,
+    user_table,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def is_celebrity(follower_count):
+    # Authors with this many followers are not fanned out on write, their
+    # posts are merged into their followers' timelines on read instead
+    return follower_count >= config.TIMELINE_FANOUT_MAX_FOLLOWERS
+
+
+def fan_out_posts(author_id: int, post_ids: list[int]):
+    # Copies new posts into the timelines of the author and their followers
+    recipients = sqlalchemy.union_all(
+        sqlalchemy.select(follow_table.c.follower_id.label("user_id")).where(
+            follow_table.c.followee_id == author_id
+        ),
+        sqlalchemy.select(sqlalchemy.cast(author_id, sqlalchemy.Integer)),
+    ).subquery()
+    author_fans_out = (
+        sqlalchemy.select(user_table.c.id)
+        .where(
+            user_table.c.id == author_id,
+            sqlalchemy.not_(is_celebrity(user_table.c.follower_count)),
+        )
+        .exists()
+    )
+    entries = (
+        sqlalchemy.select(
+            recipients.c.user_id, post_table.c.id, post_table.c.created_at
+        )
+        .select_from(recipients.join(post_table, sqlalchemy.true()))
+        .where(post_table.c.id.in_(post_ids), author_fans_out)
+    )
+    return (
+        insert(timeline_table)
+        .from_select(["user_id", "post_id", "created_at"], entries)
+        .on_conflict_do_nothing()
+    )
+
+
+def backfill_timeline(user_id: int, author_id: int):
+    # Recent posts of a newly followed author, so the timeline is not empty
+    # until they post again
+    recent_posts = (
+        sqlalchemy.select(
+            sqlalchemy.cast(user_id, sqlalchemy.Integer),
+            post_table.c.id,
+            post_table.c.created_at,
+        )
+        .join(user_table, user_table.c.id == post_table.c.user_id)
+        .where(
+            post_table.c.user_id == author_id,
+            sqlalchemy.not_(is_celebrity(user_table.c.follower_count)),
+        )
+        .order_by(post_table.c.created_at.desc(), post_table.c.id.desc())
+        .limit(config.TIMELINE_BACKFILL_POSTS)
+    )
+    return (
+        insert(timeline_table)
+        .from_select(["user_id", "post_id", "created_at"], recent_posts)
+        .on_conflict_do_nothing()
+    )
+
+
+def remove_author_from_timeline(user_id: int, author_id: int):
+    return timeline_table.delete().where(
+        timeline_table.c.user_id == user_id,
+        timeline_table.c.post_id == post_table.c.id,
+        post_table.c.user_id == author_id,
+    )
+
+
+class FanoutWorker:
+    # Fans new posts out from a background task so create_post does not wait
+    # for one insert per follower. Without a running worker (or with a full
+    # queue) the fan-out runs inline instead.
+    def __init__(self, max_queue: int) -> None:
+        self.max_queue = max_queue
+        self.fanned_out = 0
+        self.inline = 0
+        self.failed = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def fan_out(self, author_id: int, post_ids: list[int]):
+        await database.execute(fan_out_posts(author_id, post_ids))
+        self.fanned_out += len(post_ids)
+
+    async def submit(self, author_id: int, post_ids: list[int]):
+        if self._queue is not None:
+            try:
+                self._queue.put_nowait((author_id, post_ids))
+                return
+            except asyncio.QueueFull:
+                logger.warning("Timeline fan-out queue is full, fanning out inline")
+
+        self.inline += 1
+        await self.fan_out(author_id, post_ids)
+
+    async def _run(self) -> None:
+        while True:
+            author_id, post_ids = await self._queue.get()
+            try:
+                await self.fan_out(author_id, post_ids)
+            except Exception:
+                self.failed += 1
+                logger.exception("Timeline fan-out failed for user %s", author_id)
+            finally:
+                self._queue.task_done()
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def join(self) -> None:
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self) -> None:
+        # Drains what was already accepted before shutting down
+        await self.join()
+        if self._task is not None:
+            self._task.cancel()
+        self._queue = None
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "fanned_out": self.fanned_out,
+            "inline": self.inline,
+            "failed": self.failed,
+        }
+
+
+fanout_worker = FanoutWorker(config.TIMELINE_FANOUT_QUEUE_SIZE)
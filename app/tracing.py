@@ -0,0 +1,114 @@
+import logging
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+# Literals are replaced so that the same statement with different values
+# logs (and groups) as one
+string_literal = re.compile(r"'(?:[^']|'')*'")
+# Not the $1 style bind parameters
+number_literal = re.compile(r"(?<![\w$])\d+(?:\.\d+)?\b")
+whitespace = re.compile(r"\s+")
+
+MAX_SQL_LENGTH = 2000
+
+
+def normalized_sql(sql: str) -> str:
+    sql = string_literal.sub("?", sql)
+    sql = number_literal.sub("?", sql)
+    return whitespace.sub(" ", sql).strip()[:MAX_SQL_LENGTH]
+
+
+class RequestQueries:
+    __slots__ = ("count", "seconds", "repeated", "_seen")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+        # Statements already run in this request, an N+1 shows up as a high
+        # repeated count
+        self.repeated = 0
+        self._seen: set[str] = set()
+
+    def record(self, sql: str, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        if sql in self._seen:
+            self.repeated += 1
+        else:
+            self._seen.add(sql)
+
+
+# Set by MetricsMiddleware for the duration of a request
+request_queries: ContextVar[Optional[RequestQueries]] = ContextVar(
+    "request_queries", default=None
+)
+
+
+class QueryTrace:
+    __slots__ = ("sql",)
+
+    def __init__(self) -> None:
+        self.sql = ""
+
+
+@contextmanager
+def traced_query() -> Iterator[QueryTrace]:
+    # The caller fills in trace.sql once the statement is compiled. Every log
+    # record carries the request's correlation id through the logging filter.
+    trace = QueryTrace()
+    started = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        elapsed = time.perf_counter() - started
+        queries = request_queries.get()
+        if queries is not None:
+            queries.record(trace.sql, elapsed)
+
+        if elapsed >= config.DB_SLOW_QUERY_SECONDS:
+            logger.warning(
+                "Slow query took %.1fms",
+                elapsed * 1000,
+                extra={
+                    "sql": normalized_sql(trace.sql),
+                    "duration_ms": round(elapsed * 1000, 3),
+                },
+            )
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Query took %.1fms",
+                elapsed * 1000,
+                extra={
+                    "sql": normalized_sql(trace.sql),
+                    "duration_ms": round(elapsed * 1000, 3),
+                },
+            )
+
+
+def log_request_summary(
+    method: str, route: str, status_code: int, elapsed: float, queries: RequestQueries
+) -> None:
+    logger.info(
+        "%s %s %s in %.1fms with %d queries",
+        method,
+        route,
+        status_code,
+        elapsed * 1000,
+        queries.count,
+        extra={
+            "method": method,
+            "route": route,
+            "status_code": status_code,
+            "duration_ms": round(elapsed * 1000, 3),
+            "db_queries": queries.count,
+            "db_time_ms": round(queries.seconds * 1000, 3),
+            "db_repeated_queries": queries.repeated,
+        },
+    )
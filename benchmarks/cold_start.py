@@ -0,0 +1,95 @@
+"""Cold start time of a worker, from interpreter start to serving requests.
+
+Every run starts a fresh interpreter that imports the app and runs its
+lifespan startup against the database configured by ENV_STATE:
+
+    python -m benchmarks.cold_start --runs 10
+    python -m benchmarks.cold_start --runs 10 --mode create_all
+
+``--mode create_all`` reproduces the old startup, which ran
+``metadata.create_all`` through a second engine on every boot.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MODES = ["auto", "always", "never", "create_all"]
+
+
+async def child(mode: str, started: float) -> dict:
+    if mode != "create_all":
+        from app.config import BaseConfig
+
+        os.environ[f"{BaseConfig().ENV_STATE.upper()}_DB_STARTUP_DDL"] = mode
+
+    from app.main import app
+
+    imported = time.perf_counter()
+
+    if mode == "create_all":
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        from app import main
+        from app.database import DATABASE_URL, metadata
+
+        async def create_all():
+            engine = create_async_engine(DATABASE_URL)
+            async with engine.begin() as conn:
+                await conn.run_sync(metadata.create_all)
+
+        main.prepare_schema = create_all
+
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+
+    return {"import_s": imported - started, "startup_s": ready - imported}
+
+
+def summarise(samples: list[float]) -> dict:
+    return {
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "min_ms": min(samples) * 1000,
+        "max_ms": max(samples) * 1000,
+    }
+
+
+def main(args: argparse.Namespace) -> dict:
+    results = {}
+    for mode in args.mode or MODES:
+        runs = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.cold_start", "--child", mode],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            run = json.loads(output.splitlines()[-1])
+            run["total_s"] = time.perf_counter() - started
+            runs.append(run)
+        results[mode] = {
+            key: summarise([run[key] for run in runs])
+            for key in ("import_s", "startup_s", "total_s")
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--mode", choices=MODES, action="append")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        started = time.perf_counter()
+        print(json.dumps(asyncio.run(child(args.child, started))))
+    else:
+        print(json.dumps(main(args), indent=2))
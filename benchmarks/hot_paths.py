@@ -0,0 +1,311 @@
+"""Throughput and latency of the API hot paths at a fixed concurrency.
+
+Seeds users, posts and likes into the database configured by ENV_STATE, drives
+each endpoint in turn with --concurrency clients and removes the seeded rows
+again. The app runs in-process unless --base-url points at a running server
+using the same database. Use a throwaway database; a dev config is best since
+the test config serialises all queries through one rolled-back connection:
+
+    python -m benchmarks.hot_paths --users 1000 --requests 500 --output run.json
+    python -m benchmarks.hot_paths --baseline run.json --only "GET /posts"
+
+Results are RPS and p50/p95/p99 latency per endpoint. With --baseline, each
+endpoint also gets its change relative to an earlier run's output.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import uuid
+from typing import Awaitable, Callable
+
+from httpx import ASGITransport, AsyncClient, Response
+
+from app.database import database, user_table
+from app.main import app
+from app.routes.post import PostSorting
+from app.security import get_password_hash
+
+PASSWORD = "benchmark_password"
+SEARCH = "Topic 7"
+FULLTEXT_SEARCH = "keyword7"
+
+Request = Callable[[AsyncClient, dict, random.Random], Awaitable[Response]]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+async def seed(prefix: str, args: argparse.Namespace) -> dict:
+    # One bcrypt hash shared by every seeded user, hashing each would
+    # dominate the seeding time
+    password = get_password_hash(PASSWORD)
+    await database.execute(
+        f"""
+        INSERT INTO users (email, password)
+        SELECT '{prefix}' || g || '@email.com', '{password}'
+        FROM generate_series(1, {args.users}) AS g
+        """
+    )
+    await database.execute(
+        f"""
+        INSERT INTO posts (title, content, user_id)
+        SELECT 'Topic ' || (users.id * g % 97),
+               'Benchmark content keyword' || (users.id * g % 199),
+               users.id
+        FROM users CROSS JOIN generate_series(1, {args.posts_per_user}) AS g
+        WHERE users.email LIKE '{prefix}%'
+        """
+    )
+    # Posts inserted by one statement get consecutive ids
+    seeded = await database.fetch_one(
+        f"""
+        SELECT min(posts.id) AS first_id, count(*) AS total
+        FROM posts JOIN users ON users.id = posts.user_id
+        WHERE users.email LIKE '{prefix}%'
+        """
+    )
+    await database.execute(
+        f"""
+        INSERT INTO likes (user_id, post_id)
+        SELECT users.id, {seeded.first_id} + (users.id * 7919 + g * 104729) % {seeded.total}
+        FROM users CROSS JOIN generate_series(1, {args.likes_per_user}) AS g
+        WHERE users.email LIKE '{prefix}%'
+        ON CONFLICT DO NOTHING
+        """
+    )
+    await database.execute(
+        """
+        UPDATE posts SET like_count = counts.likes
+        FROM (SELECT post_id, count(*) AS likes FROM likes GROUP BY post_id) AS counts
+        WHERE posts.id = counts.post_id AND posts.like_count <> counts.likes
+        """
+    )
+    await database.execute("ANALYZE")
+    return {
+        "first_post_id": seeded.first_id,
+        "posts": seeded.total,
+        "likes": await database.fetch_val(
+            f"""
+            SELECT count(*) FROM likes JOIN users ON users.id = likes.user_id
+            WHERE users.email LIKE '{prefix}%'
+            """
+        ),
+    }
+
+
+def random_post_id(dataset: dict, rng: random.Random) -> int:
+    return dataset["first_post_id"] + rng.randrange(dataset["posts"])
+
+
+def feed(params: dict, pages: int) -> Request:
+    async def request(client: AsyncClient, dataset: dict, rng: random.Random):
+        # Spread over a few pages so not every request is a feed cache hit
+        skip = rng.randrange(pages) * params.get("limit", 10)
+        return await client.get(
+            "/posts/", params={**params, "skip": skip}, headers=dataset["headers"]
+        )
+
+    return request
+
+
+async def get_post(client: AsyncClient, dataset: dict, rng: random.Random):
+    post_id = random_post_id(dataset, rng)
+    return await client.get(f"/posts/{post_id}", headers=dataset["headers"])
+
+
+async def like_post(client: AsyncClient, dataset: dict, rng: random.Random):
+    post_id = random_post_id(dataset, rng)
+    return await client.post(f"/like/{post_id}", headers=dataset["headers"])
+
+
+async def login(client: AsyncClient, dataset: dict, rng: random.Random):
+    email = f"{dataset['prefix']}{rng.randint(1, dataset['users'])}@email.com"
+    return await client.post("/token", data={"username": email, "password": PASSWORD})
+
+
+async def register(client: AsyncClient, dataset: dict, rng: random.Random):
+    # The prefix makes registered users part of the cleanup
+    email = f"{dataset['prefix']}new-{uuid.uuid4().hex[:12]}@gmail.com"
+    return await client.post("/register", json={"email": email, "password": PASSWORD})
+
+
+def endpoints(pages: int) -> dict[str, Request]:
+    requests = {}
+    for sorting in PostSorting:
+        if sorting == PostSorting.relevance:
+            params = {"search": FULLTEXT_SEARCH, "search_mode": "fulltext"}
+            requests[f"GET /posts?sorting={sorting.value}&search=fulltext"] = feed(
+                {"sorting": sorting.value, **params}, pages
+            )
+            continue
+        requests[f"GET /posts?sorting={sorting.value}"] = feed(
+            {"sorting": sorting.value}, pages
+        )
+        requests[f"GET /posts?sorting={sorting.value}&search=substring"] = feed(
+            {"sorting": sorting.value, "search": SEARCH}, pages
+        )
+    requests["GET /posts/{id}"] = get_post
+    requests["POST /like/{id}"] = like_post
+    requests["POST /token"] = login
+    requests["POST /register"] = register
+    return requests
+
+
+async def drive(
+    client: AsyncClient,
+    request: Request,
+    datasets: list[dict],
+    total: int,
+    warmup: int,
+    seed: int,
+) -> dict:
+    rng = random.Random(seed)
+    # Untimed, so connections and caches are warm for every endpoint
+    for i in range(warmup):
+        await request(client, datasets[i % len(datasets)], rng)
+
+    latencies = []
+    statuses: dict[str, int] = {}
+    remaining = total
+
+    async def worker(dataset: dict, rng: random.Random) -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            response = await request(client, dataset, rng)
+            latencies.append(time.perf_counter() - started)
+            key = f"{response.status_code // 100}xx"
+            statuses[key] = statuses.get(key, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            worker(dataset, random.Random(seed + i + 1))
+            for i, dataset in enumerate(datasets)
+        )
+    )
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": sum(count for key, count in statuses.items() if key != "2xx"),
+        "statuses": statuses,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+def compare(results: dict, baseline: dict) -> None:
+    for name, result in results.items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before:
+            continue
+        result["change"] = {
+            key: result[key] / before[key] - 1 if before[key] else None
+            for key in ("rps", "p50_ms", "p95_ms", "p99_ms")
+        }
+
+
+async def main(args: argparse.Namespace) -> dict:
+    prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+    await database.connect()
+    try:
+        started = time.perf_counter()
+        seeded = await seed(prefix, args)
+        seeded_in = time.perf_counter() - started
+
+        if args.base_url:
+            client = AsyncClient(base_url=args.base_url, timeout=60)
+        else:
+            client = AsyncClient(
+                transport=ASGITransport(app=app), base_url="http://bench", timeout=60
+            )
+        async with client:
+            # Every client is a different seeded user
+            datasets = []
+            for i in range(1, args.concurrency + 1):
+                response = await client.post(
+                    "/token",
+                    data={"username": f"{prefix}{i}@email.com", "password": PASSWORD},
+                )
+                response.raise_for_status()
+                token = response.json()["access_token"]
+                datasets.append(
+                    {
+                        **seeded,
+                        "prefix": prefix,
+                        "users": args.users,
+                        "headers": {"Authorization": f"Bearer {token}"},
+                    }
+                )
+
+            results = {}
+            for name, request in endpoints(args.pages).items():
+                if args.only and not any(only in name for only in args.only):
+                    continue
+                results[name] = await drive(
+                    client, request, datasets, args.requests, args.warmup, args.seed
+                )
+    finally:
+        await database.execute(
+            user_table.delete().where(user_table.c.email.startswith(prefix))
+        )
+        await database.disconnect()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+    return {
+        "target": args.base_url or "in-process",
+        "concurrency": args.concurrency,
+        "requests_per_endpoint": args.requests,
+        "dataset": {
+            "users": args.users,
+            "posts": seeded["posts"],
+            "likes": seeded["likes"],
+            "seed_seconds": seeded_in,
+        },
+        "endpoints": results,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts-per-user", type=int, default=10)
+    parser.add_argument("--likes-per-user", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=40)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", action="append", help="Endpoint name substring")
+    parser.add_argument("--base-url", help="Drive a running server instead")
+    parser.add_argument("--baseline", help="Earlier --output file to compare with")
+    parser.add_argument("--output", help="Also write the results to this file")
+    args = parser.parse_args()
+    if args.concurrency > args.users:
+        parser.error("--concurrency cannot exceed --users")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    output = json.dumps(asyncio.run(main(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
@@ -0,0 +1,141 @@
+"""Cost of the liked_by_me semi-join on the feed query.
+
+Seeds users, posts and likes (1M by default) into the database configured by
+ENV_STATE, times the feed query with and without the liked_by_me column, and
+removes the seeded rows again:
+
+    python -m benchmarks.liked_by_me --likes 1000000 --repeat 200
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+from app.database import database, post_table, user_table
+from app.routes.post import select_post_and_likes, select_posts_for
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+async def seed(prefix: str, users: int, posts_per_user: int, likes: int) -> int:
+    await database.execute(
+        f"""
+        INSERT INTO users (email, password)
+        SELECT '{prefix}' || g || '@email.com', 'not-a-hash'
+        FROM generate_series(1, {users}) AS g
+        """
+    )
+    await database.execute(
+        f"""
+        INSERT INTO posts (title, content, user_id)
+        SELECT 'Post ' || g, 'Content', users.id
+        FROM users CROSS JOIN generate_series(1, {posts_per_user}) AS g
+        WHERE users.email LIKE '{prefix}%'
+        """
+    )
+    # Posts inserted by one statement get consecutive ids, so every user can
+    # like a spread of them without joining back to the posts table
+    seeded = await database.fetch_one(
+        f"""
+        SELECT min(posts.id) AS first_id, count(*) AS total
+        FROM posts JOIN users ON users.id = posts.user_id
+        WHERE users.email LIKE '{prefix}%'
+        """
+    )
+    await database.execute(
+        f"""
+        INSERT INTO likes (user_id, post_id)
+        SELECT users.id, {seeded.first_id} + (users.id * 7919 + g * 104729) % {seeded.total}
+        FROM users CROSS JOIN generate_series(1, {likes // users}) AS g
+        WHERE users.email LIKE '{prefix}%'
+        ON CONFLICT DO NOTHING
+        """
+    )
+    await database.execute(
+        """
+        UPDATE posts SET like_count = counts.likes
+        FROM (SELECT post_id, count(*) AS likes FROM likes GROUP BY post_id) AS counts
+        WHERE posts.id = counts.post_id AND posts.like_count <> counts.likes
+        """
+    )
+    await database.execute("ANALYZE")
+    return await database.fetch_val(
+        f"SELECT min(id) FROM users WHERE email LIKE '{prefix}%'"
+    )
+
+
+async def execution_time(query) -> float:
+    # Server-side time only, without compiling, the round trip and decoding
+    async with database.connection() as connection:
+        sql, args, _ = connection._connection._compile(query)
+        plan = await connection.raw_connection.fetchval(
+            f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}", *args
+        )
+    return json.loads(plan)[0]["Execution Time"]
+
+
+async def time_query(query, repeat: int) -> dict:
+    await database.fetch_all(query)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await database.fetch_all(query)
+        timings.append(time.perf_counter() - started)
+    return {
+        "p50_ms": percentile(timings, 50) * 1000,
+        "p99_ms": percentile(timings, 99) * 1000,
+        "mean_ms": statistics.fmean(timings) * 1000,
+        "server_ms": await execution_time(query),
+    }
+
+
+async def main(args: argparse.Namespace) -> dict:
+    prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+    await database.connect()
+    try:
+        started = time.perf_counter()
+        user_id = await seed(prefix, args.users, args.posts_per_user, args.likes)
+        seeded_in = time.perf_counter() - started
+        like_count = await database.fetch_val("SELECT count(*) FROM likes")
+
+        orderings = {
+            "new": (post_table.c.created_at.desc(), post_table.c.id.desc()),
+            "most_likes": (post_table.c.like_count.desc(), post_table.c.id.desc()),
+        }
+        results = {}
+        for name, order_by in orderings.items():
+            for label, base in (
+                ("without_liked_by_me", select_post_and_likes),
+                ("with_liked_by_me", select_posts_for(user_id)),
+            ):
+                query = base.order_by(*order_by).limit(args.limit)
+                results[f"{name}/{label}"] = await time_query(query, args.repeat)
+    finally:
+        await database.execute(
+            user_table.delete().where(user_table.c.email.startswith(prefix))
+        )
+        await database.disconnect()
+
+    return {
+        "likes": like_count,
+        "seed_seconds": seeded_in,
+        "limit": args.limit,
+        "repeat": args.repeat,
+        "queries": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--posts-per-user", type=int, default=10)
+    parser.add_argument("--likes", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=200)
+    print(json.dumps(asyncio.run(main(parser.parse_args())), indent=2))
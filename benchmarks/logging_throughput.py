@@ -0,0 +1,155 @@
+"""Request throughput with logging off, synchronous and queued.
+
+Every mode runs in a fresh interpreter that starts the app in-process against
+the database configured by ENV_STATE, registers a user with a few posts and
+drives GET /posts and GET /posts/{id} at a fixed concurrency:
+
+    python -m benchmarks.logging_throughput --requests 2000 --concurrency 16
+
+``sync`` is the old pipeline, every handler formatting and writing on the
+event loop, ``queue`` hands records to the listener thread and ``off``
+disables logging altogether. Log files are written to a temporary directory.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+MODES = ["off", "sync", "queue"]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+async def child(mode: str, requests: int, concurrency: int) -> dict:
+    from app.config import BaseConfig
+
+    queue_size = "10000" if mode == "queue" else "0"
+    os.environ[f"{BaseConfig().ENV_STATE.upper()}_LOG_QUEUE_SIZE"] = queue_size
+
+    from httpx import ASGITransport, AsyncClient
+
+    from app.database import database, user_table
+    from app.logging_conf import logging_stats
+    from app.main import app
+
+    email = f"bench-{uuid.uuid4().hex[:12]}@gmail.com"
+    credentials = {"username": email, "password": "benchmark_password"}
+    latencies: list[float] = []
+
+    os.chdir(tempfile.mkdtemp())
+    async with app.router.lifespan_context(app):
+        if mode == "off":
+            logging.disable(logging.CRITICAL)
+
+        transport = ASGITransport(app=app)
+        try:
+            async with AsyncClient(
+                transport=transport, base_url="http://bench"
+            ) as client:
+                await client.post(
+                    "/register", json={"email": email, "password": "benchmark_password"}
+                )
+                token = (await client.post("/token", data=credentials)).json()[
+                    "access_token"
+                ]
+                headers = {"Authorization": f"Bearer {token}"}
+                post_ids = []
+                for i in range(10):
+                    response = await client.post(
+                        "/posts/",
+                        json={"title": f"Benchmark {i}", "content": "Content"},
+                        headers=headers,
+                    )
+                    post_ids.append(response.json()["id"])
+
+                remaining = requests
+
+                async def worker() -> None:
+                    nonlocal remaining
+                    while remaining > 0:
+                        remaining -= 1
+                        if remaining % 2:
+                            url = f"/posts/{post_ids[remaining % len(post_ids)]}"
+                        else:
+                            url = "/posts/"
+                        started = time.perf_counter()
+                        response = await client.get(url, headers=headers)
+                        response.raise_for_status()
+                        latencies.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                await asyncio.gather(*(worker() for _ in range(concurrency)))
+                elapsed = time.perf_counter() - started
+        finally:
+            await database.execute(
+                user_table.delete().where(user_table.c.email == email)
+            )
+        pipeline = logging_stats()
+
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "dropped": pipeline.get("dropped", 0),
+    }
+
+
+def main(args: argparse.Namespace) -> dict:
+    results = {}
+    for mode in args.mode or MODES:
+        runs = []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.logging_throughput",
+                    "--child",
+                    mode,
+                    "--requests",
+                    str(args.requests),
+                    "--concurrency",
+                    str(args.concurrency),
+                ],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            runs.append(json.loads(output.splitlines()[-1]))
+        results[mode] = {
+            key: statistics.fmean(run[key] for run in runs) for key in runs[0]
+        }
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "runs": args.runs,
+        "modes": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--mode", choices=MODES, action="append")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = asyncio.run(child(args.child, args.requests, args.concurrency))
+        print(json.dumps(result))
+    else:
+        print(json.dumps(main(args), indent=2))
@@ -0,0 +1,115 @@
+"""p99 latency of GET /posts while other clients hammer /token.
+
+Runs the app in-process against the database configured by ENV_STATE (use a
+throwaway database, a dev config is best since the test config serialises all
+queries through one rolled-back connection):
+
+    python -m benchmarks.login_storm --logins 16 --duration 10
+    python -m benchmarks.login_storm --logins 16 --duration 10 --inline
+
+``--inline`` hashes on the event loop, which is how /token behaved before
+bcrypt moved to the password hashing pool.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+from httpx import ASGITransport, AsyncClient
+
+from app.database import database, user_table
+from app.hashing import password_pool
+from app.main import app
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+async def run_inline(func, *args):
+    return func(*args)
+
+
+async def login_loop(client: AsyncClient, credentials: dict, until: float) -> dict:
+    counts = {"ok": 0, "rejected": 0}
+    while time.perf_counter() < until:
+        response = await client.post("/token", data=credentials)
+        counts["ok" if response.status_code == 200 else "rejected"] += 1
+    return counts
+
+
+async def read_loop(client: AsyncClient, token: str, until: float) -> list[float]:
+    latencies = []
+    headers = {"Authorization": f"Bearer {token}"}
+    while time.perf_counter() < until:
+        started = time.perf_counter()
+        response = await client.get("/posts/", headers=headers)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+    return latencies
+
+
+async def main(args: argparse.Namespace) -> dict:
+    if args.inline:
+        password_pool.run = run_inline
+
+    email = f"bench-{uuid.uuid4().hex[:12]}@gmail.com"
+    credentials = {"username": email, "password": "benchmark_password"}
+
+    await database.connect()
+    transport = ASGITransport(app=app)
+    try:
+        async with AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.post(
+                "/register", json={"email": email, "password": "benchmark_password"}
+            )
+            token = (await client.post("/token", data=credentials)).json()[
+                "access_token"
+            ]
+            headers = {"Authorization": f"Bearer {token}"}
+            for i in range(args.posts):
+                await client.post(
+                    "/posts/",
+                    json={"title": f"Benchmark {i}", "content": "Benchmark content"},
+                    headers=headers,
+                )
+
+            until = time.perf_counter() + args.duration
+            results = await asyncio.gather(
+                read_loop(client, token, until),
+                *(login_loop(client, credentials, until) for _ in range(args.logins)),
+            )
+    finally:
+        await database.execute(user_table.delete().where(user_table.c.email == email))
+        await database.disconnect()
+
+    latencies, logins = results[0], results[1:]
+    return {
+        "mode": "inline" if args.inline else "pool",
+        "concurrent_logins": args.logins,
+        "logins_ok": sum(count["ok"] for count in logins),
+        "logins_rejected": sum(count["rejected"] for count in logins),
+        "get_posts": {
+            "requests": len(latencies),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        },
+        "pool": password_pool.stats() if not args.inline else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--posts", type=int, default=20)
+    parser.add_argument("--inline", action="store_true")
+    print(json.dumps(asyncio.run(main(parser.parse_args())), indent=2))
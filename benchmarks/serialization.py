@@ -0,0 +1,106 @@
+"""Per-row cost of serializing a page of posts to JSON.
+
+Seeds posts in a transaction that is rolled back at the end, fetches them with
+the feed query and times each way of turning the records into a response
+body:
+
+    python -m benchmarks.serialization --rows 100 --repeat 500
+
+``response_model`` is FastAPI's encoding of a returned list of records,
+``from_attributes`` validates the records through the TypeAdapter as the feed
+did before, and ``posts_json`` is the current path.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+
+from app.database import database
+from app.main import app
+from app.routes.post import posts_adapter, posts_json, select_posts_for
+
+
+def response_field():
+    for route in app.routes:
+        if isinstance(route, APIRoute) and route.path == "/posts/batch":
+            return route.response_field
+    raise LookupError("/posts/batch")
+
+
+async def seed(rows: int) -> int:
+    user_id = await database.fetch_val(
+        "INSERT INTO users (email, password) "
+        "VALUES ('bench-serialization@email.com', 'not-a-hash') RETURNING id"
+    )
+    await database.execute(
+        f"""
+        INSERT INTO posts (title, content, user_id, like_count)
+        SELECT 'Benchmark post ' || g, repeat('Benchmark content ', 10), {user_id}, g
+        FROM generate_series(1, {rows}) AS g
+        """
+    )
+    return user_id
+
+
+async def time_per_row(serialize, posts: list, repeat: int) -> float:
+    await serialize(posts)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await serialize(posts)
+    return (time.perf_counter() - started) / repeat / len(posts)
+
+
+async def main(args: argparse.Namespace) -> dict:
+    field = response_field()
+
+    async def response_model(posts: list) -> bytes:
+        content = await serialize_response(field=field, response_content=posts)
+        return JSONResponse(content).body
+
+    async def from_attributes(posts: list) -> bytes:
+        return posts_adapter.dump_json(
+            posts_adapter.validate_python(posts, from_attributes=True)
+        )
+
+    async def fast_path(posts: list) -> bytes:
+        return posts_json(posts)
+
+    await database.connect()
+    try:
+        async with database.transaction(force_rollback=True):
+            user_id = await seed(args.rows)
+            posts = await database.fetch_all(select_posts_for(user_id))
+
+            bodies = [
+                json.loads(await serialize(posts))
+                for serialize in (response_model, from_attributes, fast_path)
+            ]
+            if any(body != bodies[0] for body in bodies):
+                raise AssertionError("Serializers disagree on the output")
+
+            results = {}
+            for name, serialize in (
+                ("response_model", response_model),
+                ("from_attributes", from_attributes),
+                ("posts_json", fast_path),
+            ):
+                seconds = await time_per_row(serialize, posts, args.repeat)
+                results[name] = {"us_per_row": seconds * 1_000_000}
+    finally:
+        await database.disconnect()
+
+    baseline = results["response_model"]["us_per_row"]
+    for result in results.values():
+        result["speedup"] = baseline / result["us_per_row"]
+    return {"rows": len(posts), "repeat": args.repeat, "serializers": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=500)
+    print(json.dumps(asyncio.run(main(parser.parse_args())), indent=2))